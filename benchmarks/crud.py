@@ -0,0 +1,128 @@
+"""Time and statements per call of CRUD functions as data grows.
+
+For every size, a temporary SQLite database is filled by benchmarks.data
+and each function is called --repeat times, for users picked with the
+activity weights of the data, so heavy users come up more often. Calls
+are rolled back, the data stays the same size.
+
+Usage: python -m benchmarks.crud [--sizes 10000,100000,1000000]
+    [--users 1000] [--repeat 200]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from benchmarks.data import METRIC_WEIGHTS, Dataset, generate, user_weight
+from goals.database.crud import get_general_progress, get_user_goals, \
+    new_metric_record, update_goal
+from goals.database.migrations import upgrade
+from goals.schemas import GoalUpdate
+
+
+class Call:
+    """Random arguments for the benchmarked functions."""
+
+    def __init__(self, goal_ids: Dict[int, List[int]], seed: int):
+        self.goal_ids = goal_ids
+        self.rng = random.Random(seed)
+        self.users = list(goal_ids)
+        self.weights = [user_weight(user_id) for user_id in self.users]
+
+    def user(self) -> int:
+        """Pick a user, active ones more often."""
+        return self.rng.choices(self.users, self.weights)[0]
+
+    def metric(self) -> str:
+        """Pick a metric."""
+        return self.rng.choice(list(METRIC_WEIGHTS))
+
+    def get_user_goals(self, session: Session):
+        """List the goals of a user."""
+        get_user_goals(session, self.user())
+
+    def get_general_progress(self, session: Session):
+        """Read the 30 days progress of a user metric."""
+        get_general_progress(session, self.metric(), self.user(), 30)
+
+    def new_metric_record(self, session: Session):
+        """Record progress of a user metric."""
+        new_metric_record(session, self.metric(), self.user(),
+                          self.rng.randint(1, 1000), self.rng.randint(1, 20))
+
+    def update_goal(self, session: Session):
+        """Set the progress of a goal."""
+        user_id = self.user()
+        update_goal(session, self.rng.choice(self.goal_ids[user_id]),
+                    GoalUpdate(progress=self.rng.randint(1, 1000)), user_id)
+
+
+FUNCTIONS = ["get_user_goals", "get_general_progress", "new_metric_record",
+             "update_goal"]
+
+
+def count_statements(engine) -> List[str]:
+    """Return a list that gets every statement run by engine."""
+    statements: List[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def add_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+    return statements
+
+
+def measure(session: Session, function: Callable[[Session], None],
+            repeat: int, statements: List[str]) -> tuple:
+    """Return median and p95 ms per call, and statements per call."""
+    times = []
+    statements.clear()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(session)
+        times.append((time.perf_counter() - start) * 1000)
+        session.rollback()
+    times.sort()
+    return (times[len(times) // 2], times[int(len(times) * 0.95)],
+            len(statements) / repeat)
+
+
+def main():
+    """Run every function on every size and print one row per pair."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        type=lambda text: [int(size)
+                                           for size in text.split(",")])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.stdout.write(f"{'records':>9} {'function':<22} {'median ms':>10}"
+                     f" {'p95 ms':>8} {'statements':>10}\n")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{directory}/crud.db")
+            upgrade(engine)
+            with Session(engine) as session:
+                goal_ids = generate(session, Dataset(size, args.users,
+                                                     seed=args.seed))
+            statements = count_statements(engine)
+            call = Call(goal_ids, args.seed)
+            with Session(engine) as session:
+                for name in FUNCTIONS:
+                    median, p95, per_call = measure(
+                        session, getattr(call, name), args.repeat, statements
+                    )
+                    sys.stdout.write(f"{size:>9} {name:<22} {median:>10.3f}"
+                                     f" {p95:>8.3f} {per_call:>10.1f}\n")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Synthetic goals and metric records for benchmarks.
+
+Activity is skewed like real usage: user weights follow a Zipf law, so a
+few users own most records, steps are logged more often than body
+measurements and records get denser towards today. Values of each user
+metric only grow. Day summaries and current values are filled too, the
+database ends up as if the records had come through the API.
+
+Usage: python -m benchmarks.data --records 1000000 [--users 1000]
+    [--url sqlite:///data.db]
+The configured database is used without --url.
+"""
+import argparse
+import random
+import sys
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, NamedTuple, Tuple
+
+from environ import to_config
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from goals.config import AppConfig
+from goals.database.initialization import get_sync_database_url
+from goals.database.migrations import upgrade
+from goals.database.models import Goals, MetricsCurrentValues, \
+    MetricsRecords
+from goals.database.rollup import backfill_daily_rollup
+from goals.database.util import current_date
+
+METRIC_WEIGHTS = {"steps": 6, "distance": 3, "fat": 1, "muscle": 1}
+ZIPF_EXPONENT = 1.1
+INSERT_BATCH_SIZE = 10_000
+# Goals go in multi-row inserts, kept under SQLite's parameter limit
+GOAL_BATCH_SIZE = 1000
+
+
+class Dataset(NamedTuple):
+    """Size and shape of the generated data."""
+
+    records: int
+    users: int
+    goals: int = 5
+    days: int = 365
+    seed: int = 1
+
+
+def user_weight(user_id: int) -> float:
+    """Return how active a user is, relative to the first one."""
+    return 1 / user_id ** ZIPF_EXPONENT
+
+
+def record_counts(dataset: Dataset,
+                  rng: random.Random) -> Dict[Tuple[int, str], int]:
+    """Split records among user metrics, skewed by user and metric."""
+    pairs = [(user_id, metric) for user_id in range(1, dataset.users + 1)
+             for metric in METRIC_WEIGHTS]
+    weights = [METRIC_WEIGHTS[metric] * user_weight(user_id)
+               for user_id, metric in pairs]
+    return Counter(rng.choices(pairs, weights, k=dataset.records))
+
+
+def record_ages(count: int, days: int, rng: random.Random) -> List[int]:
+    """Return distinct ages in microseconds, oldest first, mostly recent."""
+    span = days * 24 * 3600 * 10 ** 6
+    ages = sorted((int(span * rng.random() ** 2) for _ in range(count)),
+                  reverse=True)
+    for index in range(1, count):
+        ages[index] = min(ages[index], ages[index - 1] - 1)
+    return ages
+
+
+def _flush(session: Session, model, rows: List[dict]) -> None:
+    if rows:
+        session.execute(insert(model), rows)
+        rows.clear()
+
+
+def generate(session: Session, dataset: Dataset) -> Dict[int, List[int]]:
+    """Add goals and records of dataset, return goal ids by user.
+
+    The database must be empty and at the latest schema version.
+    """
+    rng = random.Random(dataset.seed)
+    now = current_date()
+    rows: List[dict] = []
+    current: List[dict] = []
+    for (user_id, metric), count in sorted(
+            record_counts(dataset, rng).items()):
+        value = 0
+        for age in record_ages(count, dataset.days, rng):
+            value += rng.randint(1, 20)
+            rows.append({"metric_name": metric, "user_id": user_id,
+                         "value": value,
+                         "date": now - timedelta(microseconds=age)})
+            if len(rows) >= INSERT_BATCH_SIZE:
+                _flush(session, MetricsRecords, rows)
+        current.append({"user_id": user_id, "metric_name": metric,
+                        "value": value})
+    _flush(session, MetricsRecords, rows)
+    session.execute(insert(MetricsCurrentValues), current)
+    goal_rows = [
+        {"user_id": user_id, "title": f"Goal {number}",
+         "description": "Synthetic goal", "metric": rng.choice(
+             list(METRIC_WEIGHTS)), "objective": rng.randint(10, 10_000),
+         "time_limit": "6/5/2030", "progress": 0}
+        for user_id in range(1, dataset.users + 1)
+        for number in range(dataset.goals)
+    ]
+    goal_ids: Dict[int, List[int]] = {}
+    for start in range(0, len(goal_rows), GOAL_BATCH_SIZE):
+        for goal_id, user_id in session.execute(
+                insert(Goals).values(
+                    goal_rows[start:start + GOAL_BATCH_SIZE]
+                ).returning(Goals.id, Goals.user_id)):
+            goal_ids.setdefault(user_id, []).append(goal_id)
+    backfill_daily_rollup(session)
+    session.commit()
+    return goal_ids
+
+
+def main():
+    """Populate a database."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--goals", type=int, default=5,
+                        help="goals of each user")
+    parser.add_argument("--days", type=int, default=365,
+                        help="age of the oldest records")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="database URL")
+    args = parser.parse_args()
+    engine = create_engine(
+        args.url or get_sync_database_url(to_config(AppConfig))
+    )
+    upgrade(engine)
+    with Session(engine) as session:
+        generate(session, Dataset(args.records, args.users, args.goals,
+                                  args.days, args.seed))
+    sys.stdout.write(f"{args.records} records for {args.users} users\n")
+
+
+if __name__ == "__main__":
+    main()
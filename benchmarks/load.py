@@ -0,0 +1,328 @@
+"""End-to-end load test against a local database and a stub auth service.
+
+The service runs with uvicorn on a temporary SQLite database, talking to
+benchmarks.stub_auth, both in subprocesses on free local ports. Clients
+keep --concurrency requests in flight for --duration seconds, picking
+requests with the weights of --mix, then throughput and latency
+percentiles are reported per route.
+
+--save stores the results as a baseline. With --baseline, the run fails
+if throughput drops, or the p95 latency of a route grows, by more than
+--threshold.
+
+Usage: python -m benchmarks.load [--duration 20] [--concurrency 16]
+    [--auth-latency 0.005]
+    [--mix list=50,progress=20,batch=10,stats=15,create=5]
+    [--save baseline.json | --baseline baseline.json --threshold 0.2]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from goals.database.crud import create_goals, update_goals_progress
+from goals.database.migrations import upgrade
+from goals.schemas import GoalBase, GoalProgress
+
+ROUTES = {
+    "list": "GET /goals/{user_id}",
+    "progress": "PATCH /goals/{goal_id}",
+    "batch": "PATCH /goals/{user_id}/progress",
+    "stats": "GET /goals/{user_id}/metricsProgress/{metric}",
+    "create": "POST /goals/{user_id}",
+}
+METRICS = ["distance", "muscle", "fat", "steps"]
+IMAGE = base64.b64encode(bytes(1024)).decode()
+STARTUP_TIMEOUT = 30.0
+
+
+class Sample(NamedTuple):
+    """Outcome of one request, status 0 if no response came."""
+
+    route: str
+    seconds: float
+    status: int
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """Parse name=weight pairs separated by commas."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown request {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def new_goal(rng: random.Random) -> dict:
+    """Return the body of a goal creation."""
+    return {
+        "title": f"Goal {rng.randint(1, 10 ** 6)}",
+        "description": "Benchmark goal",
+        "metric": rng.choice(METRICS),
+        "objective": rng.randint(10, 1000),
+        "time_limit": "6/5/2030",
+    }
+
+
+def seed(url: str, users: int, goals: int,
+         rng: random.Random) -> Dict[int, List[int]]:
+    """Create the schema and goals with progress, return goal ids by user."""
+    engine = create_engine(url)
+    upgrade(engine)
+    goal_ids = {}
+    with Session(engine) as session:
+        for user_id in range(1, users + 1):
+            ids = create_goals(session, [GoalBase(**new_goal(rng))
+                                         for _ in range(goals)], user_id)
+            update_goals_progress(session, user_id, [
+                GoalProgress(goal_id=goal_id, progress=rng.randint(1, 100))
+                for goal_id in ids
+            ])
+            goal_ids[user_id] = ids
+    engine.dispose()
+    return goal_ids
+
+
+def free_port() -> int:
+    """Return a local port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(app: str, port: int, env: dict) -> subprocess.Popen:
+    """Run an ASGI app with uvicorn in a subprocess."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+def wait_until_up(url: str) -> None:
+    """Poll url until it answers, failing after STARTUP_TIMEOUT seconds."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class Workload(NamedTuple):
+    """Requests to send and the goals they can refer to."""
+
+    mix: Dict[str, int]
+    goal_ids: Dict[int, List[int]]
+
+    def next_request(self, rng: random.Random):
+        """Pick a request, return its name, user, method, path and body."""
+        name = rng.choices(list(self.mix), list(self.mix.values()))[0]
+        user_id = rng.choice(list(self.goal_ids))
+        if name == "list":
+            return name, user_id, "GET", f"/goals/{user_id}", None
+        if name == "progress":
+            goal_id = rng.choice(self.goal_ids[user_id])
+            return name, user_id, "PATCH", f"/goals/{goal_id}", {
+                "progress": rng.randint(1, 1000)
+            }
+        if name == "batch":
+            goal_ids = self.goal_ids[user_id]
+            return name, user_id, "PATCH", f"/goals/{user_id}/progress", {
+                "updates": [
+                    {"goal_id": goal_id, "progress": rng.randint(1, 1000)}
+                    for goal_id in rng.sample(goal_ids, min(3, len(goal_ids)))
+                ]
+            }
+        if name == "stats":
+            return name, user_id, "GET", \
+                f"/goals/{user_id}/metricsProgress/{rng.choice(METRICS)}", \
+                None
+        return name, user_id, "POST", f"/goals/{user_id}", \
+            new_goal(rng) | {"image": IMAGE}
+
+
+async def client_loop(client: httpx.AsyncClient, workload: Workload,
+                      rng: random.Random, window: tuple,
+                      samples: List[Sample]) -> None:
+    """Send requests one after the other, keeping those inside window."""
+    measure_from, deadline = window
+    while time.perf_counter() < deadline:
+        name, user_id, method, path, body = workload.next_request(rng)
+        start = time.perf_counter()
+        try:
+            response = await client.request(
+                method, path, json=body,
+                headers={"Authorization": f"Bearer user-{user_id}"},
+            )
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        if start >= measure_from:
+            samples.append(Sample(ROUTES[name], time.perf_counter() - start,
+                                  status))
+
+
+async def drive(base_url: str, args, goal_ids) -> List[Sample]:
+    """Run the clients through warm-up and the measured duration."""
+    samples: List[Sample] = []
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=30.0) as client:
+        measure_from = time.perf_counter() + args.warmup
+        window = (measure_from, measure_from + args.duration)
+        workload = Workload(args.mix, goal_ids)
+        await asyncio.gather(*[
+            client_loop(client, workload, random.Random(args.seed + number),
+                        window, samples)
+            for number in range(args.concurrency)
+        ])
+    return samples
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of sorted values."""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(samples: List[Sample], seconds: float) -> dict:
+    """Return throughput and latency figures, in ms, of each route."""
+    routes = {}
+    for route in sorted({sample.route for sample in samples}):
+        ordered = sorted(sample.seconds * 1000 for sample in samples
+                         if sample.route == route)
+        routes[route] = {
+            "requests": len(ordered),
+            "errors": sum(1 for sample in samples if sample.route == route
+                          and not 200 <= sample.status < 400),
+            "throughput": len(ordered) / seconds,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+        }
+    return {"throughput": len(samples) / seconds, "routes": routes}
+
+
+def report(results: dict) -> None:
+    """Print one row per route."""
+    sys.stdout.write(f"{'route':<46} {'requests':>8} {'errors':>6}"
+                     f" {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}"
+                     f" {'p99 ms':>8}\n")
+    for route, figures in results["routes"].items():
+        sys.stdout.write(f"{route:<46} {figures['requests']:>8}"
+                         f" {figures['errors']:>6}"
+                         f" {figures['throughput']:>8.1f}"
+                         f" {figures['p50']:>8.1f} {figures['p95']:>8.1f}"
+                         f" {figures['p99']:>8.1f}\n")
+    sys.stdout.write(f"total {results['throughput']:.1f} req/s\n")
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Describe figures that got worse than baseline by over threshold."""
+    found = []
+    if results["throughput"] < baseline["throughput"] * (1 - threshold):
+        found.append(f"throughput {results['throughput']:.1f} req/s, "
+                     f"baseline {baseline['throughput']:.1f}")
+    for route, before in baseline["routes"].items():
+        after = results["routes"].get(route)
+        if after is not None and after["p95"] > before["p95"] * \
+                (1 + threshold):
+            found.append(f"{route} p95 {after['p95']:.1f} ms, "
+                         f"baseline {before['p95']:.1f}")
+    return found
+
+
+def run(args) -> dict:
+    """Start the servers, drive the load and return the summary."""
+    with tempfile.TemporaryDirectory() as directory:
+        database = f"{directory}/load.db"
+        goal_ids = seed(f"sqlite:///{database}", args.users, args.goals,
+                        random.Random(args.seed))
+        auth_port, app_port = free_port(), free_port()
+        env = dict(
+            os.environ, GOALS_DB_DRIVER=args.driver,
+            GOALS_DB_DATABASE=database,
+            GOALS_AUTH_HOST=f"127.0.0.1:{auth_port}",
+            GOALS_PROMETHEUS_PORT=str(free_port()),
+            STUB_AUTH_LATENCY=str(args.auth_latency),
+        )
+        servers = [serve("benchmarks.stub_auth:app", auth_port, env),
+                   serve("goals.main:app", app_port, env)]
+        try:
+            wait_until_up(f"http://127.0.0.1:{auth_port}/auth/credentials")
+            wait_until_up(f"http://127.0.0.1:{app_port}/goals/healthcheck/")
+            samples = asyncio.run(drive(f"http://127.0.0.1:{app_port}",
+                                        args, goal_ids))
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait()
+    return summarize(samples, args.duration)
+
+
+def main():
+    """Run the load test, then save or check a baseline."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--goals", type=int, default=10,
+                        help="goals created for each user before starting")
+    parser.add_argument("--auth-latency", type=float, default=0.005,
+                        help="seconds the stub auth service waits")
+    parser.add_argument("--mix", type=parse_mix,
+                        default="list=50,progress=20,batch=10,stats=15,"
+                                "create=5")
+    parser.add_argument("--driver", default="sqlite+aiosqlite",
+                        choices=["sqlite", "sqlite+aiosqlite"])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results to this file")
+    parser.add_argument("--baseline", help="compare with results saved here")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="tolerated regression, 0.2 is 20%%")
+    args = parser.parse_args()
+    settings = {name: getattr(args, name) for name in (
+        "duration", "concurrency", "users", "goals", "auth_latency", "mix",
+        "driver",
+    )}
+    results = run(args)
+    report(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as output:
+            json.dump(results | {"settings": settings}, output, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as saved:
+            baseline = json.load(saved)
+        if baseline.get("settings") != settings:
+            sys.stdout.write("Warning: baseline was taken with settings "
+                             f"{baseline.get('settings')}\n")
+        found = regressions(results, baseline, args.threshold)
+        for regression in found:
+            sys.stdout.write(f"Regression: {regression}\n")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
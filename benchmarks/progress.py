@@ -0,0 +1,103 @@
+"""Compare get_general_progress with the full history scan it replaced.
+
+The scan works on exact timestamps while get_general_progress uses whole
+days, so both results are shown but they may differ by a boundary day.
+
+Usage: python -m benchmarks.progress [--records 100000] [--repeat 20]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import create_engine, desc, insert
+from sqlalchemy.orm import Session
+
+from goals.database.crud import get_general_progress
+from goals.database.data import insert_new_metrics
+from goals.database.models import Base, MetricsRecords
+from goals.database.rollup import backfill_daily_rollup
+from goals.database.util import current_date
+
+USER_ID = 1
+METRIC = "steps"
+WINDOWS = [1, 7, 30, 365]
+
+
+def scan_general_progress(session, metric, user_id, days):
+    """Previous implementation, loads every record of the metric."""
+    date = current_date()
+    records = session.query(MetricsRecords).\
+        filter(MetricsRecords.user_id == user_id) \
+        .filter(MetricsRecords.metric_name == metric) \
+        .order_by(desc(MetricsRecords.date)).all()
+    latest_progress = 0
+    oldest_progress = 0
+    for record in records:
+        delta = (date - record.date).days
+        if delta <= days and latest_progress == 0:
+            latest_progress = record.value
+        if delta > days and oldest_progress == 0:
+            oldest_progress = record.value
+    if latest_progress > 0:
+        return latest_progress - oldest_progress
+    return 0
+
+
+def populate(session: Session, records: int) -> None:
+    """Add one record every ten minutes, newest now."""
+    now = current_date()
+    rows = [
+        {"metric_name": METRIC, "user_id": USER_ID,
+         "value": records - age, "date": now - timedelta(minutes=10 * age)}
+        for age in range(records)
+    ]
+    session.execute(insert(MetricsRecords), rows)
+    session.commit()
+
+
+def seconds_per_call(function, session, days, repeat) -> float:
+    """Return the best time out of repeat calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(session, METRIC, USER_ID, days)
+        best = min(best, time.perf_counter() - start)
+        session.expunge_all()
+    return best
+
+
+def main():
+    """Run the comparison and print one row per window."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/progress.db")
+        Base.metadata.create_all(bind=engine)
+        with Session(engine) as session:
+            insert_new_metrics(session)
+            populate(session, args.records)
+            backfill_daily_rollup(session)
+            sys.stdout.write(f"{args.records} records for one user\n")
+            sys.stdout.write(f"{'days':>6} {'scan ms':>10} {'lookup ms':>10}"
+                             f" {'speedup':>8} {'scan':>8} {'lookup':>8}\n")
+            for days in WINDOWS:
+                expected = scan_general_progress(session, METRIC, USER_ID,
+                                                 days)
+                actual = get_general_progress(session, METRIC, USER_ID, days)
+                before = seconds_per_call(scan_general_progress, session,
+                                          days, args.repeat)
+                after = seconds_per_call(get_general_progress, session,
+                                         days, args.repeat)
+                sys.stdout.write(f"{days:>6} {before * 1000:>10.2f}"
+                                 f" {after * 1000:>10.3f}"
+                                 f" {before / after:>7.0f}x"
+                                 f" {expected:>8} {actual:>8}\n")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
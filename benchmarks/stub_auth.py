@@ -0,0 +1,55 @@
+"""Stand-in for the auth service, for load benchmarks.
+
+Tokens are "Bearer user-<id>" and belong to that user. Images are kept
+in memory. Every answer waits STUB_AUTH_LATENCY seconds first.
+
+Usage: STUB_AUTH_LATENCY=0.005 python -m uvicorn benchmarks.stub_auth:app
+"""
+import asyncio
+import os
+from hashlib import sha256
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+LATENCY = float(os.environ.get("STUB_AUTH_LATENCY", "0"))
+TOKEN_PREFIX = "Bearer user-"
+IMAGES = {}
+
+
+async def credentials(request: Request):
+    """Return the user a token belongs to."""
+    await asyncio.sleep(LATENCY)
+    token = request.headers.get("Authorization", "")
+    if not token.startswith(TOKEN_PREFIX):
+        return JSONResponse({"Message": "Invalid token"}, status_code=401)
+    user_id = int(token[len(TOKEN_PREFIX):])
+    return JSONResponse({"data": {"id": user_id, "role": "user"}})
+
+
+async def store_image(request: Request):
+    """Keep an uploaded image."""
+    await asyncio.sleep(LATENCY)
+    IMAGES[request.path_params["name"]] = (await request.json())["image"]
+    return JSONResponse({})
+
+
+async def image(request: Request):
+    """Return a stored image, or 304 if the client has it."""
+    await asyncio.sleep(LATENCY)
+    stored = IMAGES.get(request.path_params["name"])
+    if stored is None:
+        return JSONResponse({"Message": "No such image"}, status_code=404)
+    tag = '"' + sha256(stored.encode()).hexdigest() + '"'
+    if request.headers.get("If-None-Match") == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+    return JSONResponse({"image": stored}, headers={"ETag": tag})
+
+
+app = Starlette(routes=[
+    Route("/auth/credentials", credentials),
+    Route("/auth/storage/{name}", store_image, methods=["POST"]),
+    Route("/auth/storage/{name}", image),
+])
@@ -0,0 +1,236 @@
+"""In-process caches."""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, NamedTuple, Optional
+
+
+class TTLCache:
+    """Bounded mapping with least recently used eviction and expiration.
+
+    A max_size or ttl of zero disables the cache, every lookup misses.
+    """
+
+    def __init__(self, max_size: int, ttl: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value stored for key, or default if missing/expired."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self._clock():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any,
+            ttl: Optional[float] = None) -> None:
+        """Store value for key, evicting the least recently used entries.
+
+        ttl overrides the cache one for this entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove key if present."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry, counters are kept."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Deletions remembered to keep fetches that overlap them out of the cache
+DELETIONS_KEPT = 1024
+
+
+class CachedImage(NamedTuple):
+    """Image payload with the validator sent by the storage."""
+
+    image: Any
+    etag: Optional[str]
+    fetched_at: float
+
+
+class DiskTier:
+    """JSON files in a directory, trimmed oldest first to max_bytes.
+
+    File sizes are scanned once and tracked in memory afterwards. Methods
+    block, callers on the event loop run them in a thread.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Size of each file, oldest written first
+        self._sizes: OrderedDict = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        files = [entry for entry in os.scandir(directory)
+                 if entry.name.endswith(".json")]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files:
+            self._sizes[entry.name[:-len(".json")]] = entry.stat().st_size
+            self._total += entry.stat().st_size
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".json")
+
+    def _remove_file(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def read(self, name: str) -> Optional[CachedImage]:
+        """Return the entry stored for name, if it can be read."""
+        try:
+            with open(self._path(name), encoding="utf-8") as file:
+                return CachedImage(**json.load(file))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def write(self, name: str, entry: CachedImage) -> None:
+        """Store entry, removing the oldest files past max_bytes."""
+        try:
+            with open(self._path(name), "w", encoding="utf-8") as file:
+                json.dump(entry._asdict(), file)
+                size = file.tell()
+        except (OSError, TypeError) as error:
+            logging.warning("Could not write image %s to disk: %s",
+                            name, error)
+            return
+        stale: List[str] = []
+        with self._lock:
+            self._total += size - self._sizes.pop(name, 0)
+            self._sizes[name] = size
+            while self._total > self.max_bytes:
+                oldest, oldest_size = self._sizes.popitem(last=False)
+                self._total -= oldest_size
+                stale.append(oldest)
+        for oldest in stale:
+            self._remove_file(oldest)
+
+    def delete(self, name: str) -> None:
+        """Remove the file of name, if any."""
+        with self._lock:
+            self._total -= self._sizes.pop(name, 0)
+        self._remove_file(name)
+
+
+class ImageCache:
+    """Two tier cache for goal images, keyed by stored file name.
+
+    Entries younger than max_age are served as they are, older ones are
+    kept so they can be revalidated with their ETag. Images the storage
+    doesn't have are remembered in memory for a shorter time. The disk
+    tier is only used when a directory is given, its files are accessed
+    from worker threads.
+
+    Fetches read generation before asking the storage and hand it to set,
+    which skips images deleted in the meantime, so an upload running
+    during a download can't have the old image cached again.
+    """
+
+    def __init__(self, max_size: int, max_age: float,
+                 directory: Optional[str] = None,
+                 max_disk_bytes: int = 0,
+                 clock: Callable[[], float] = time.time):
+        self.max_age = max_age
+        self.revalidated = 0
+        self.generation = 0
+        self._memory = TTLCache(max_size, float("inf"), clock)
+        # Generation at which recently deleted names were deleted
+        self._deleted = TTLCache(DELETIONS_KEPT, float("inf"))
+        self._disk = DiskTier(directory, max_disk_bytes) \
+            if directory else None
+        self._clock = clock
+
+    @property
+    def hits(self) -> int:
+        """Lookups answered by the memory tier."""
+        return self._memory.hits
+
+    @property
+    def misses(self) -> int:
+        """Lookups the memory tier couldn't answer."""
+        return self._memory.misses
+
+    def _deleted_since(self, name: str, generation: Optional[int]) -> bool:
+        return generation is not None and \
+            self._deleted.get(name, -1) > generation
+
+    async def get(self, name: str) -> Optional[CachedImage]:
+        """Return the cached entry for name, fresh or not.
+
+        The image of an entry is None if the storage has none.
+        """
+        entry = self._memory.get(name)
+        if entry is None and self._disk is not None:
+            entry = await asyncio.to_thread(self._disk.read, name)
+            if entry is not None:
+                self._memory.set(name, entry)
+        return entry
+
+    def is_fresh(self, entry: CachedImage) -> bool:
+        """Tell whether entry can be served without asking the storage."""
+        return self._clock() - entry.fetched_at < self.max_age
+
+    async def set(self, name: str, image: Any, etag: Optional[str],
+                  generation: Optional[int] = None) -> None:
+        """Store an image fetched when the cache was at generation."""
+        if self._deleted_since(name, generation):
+            return
+        entry = CachedImage(image, etag, self._clock())
+        self._memory.set(name, entry)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.write, name, entry)
+            if self._deleted_since(name, generation):
+                await asyncio.to_thread(self._disk.delete, name)
+
+    async def set_missing(self, name: str, ttl: float,
+                          generation: Optional[int] = None) -> None:
+        """Remember for ttl seconds that the storage has no image for name."""
+        if self._deleted_since(name, generation):
+            return
+        self._memory.set(name, CachedImage(None, None, self._clock()), ttl)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.delete, name)
+
+    async def revalidate(self, name: str, entry: CachedImage,
+                         generation: Optional[int] = None) -> None:
+        """Mark entry as fresh after the storage answered Not Modified."""
+        self.revalidated += 1
+        await self.set(name, entry.image, entry.etag, generation)
+
+    async def delete(self, name: str) -> None:
+        """Forget name in every tier."""
+        self.generation += 1
+        self._deleted.set(name, self.generation)
+        self._memory.delete(name)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.delete, name)
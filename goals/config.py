@@ -8,7 +8,14 @@ class AppConfig:
     """Application configuration values from environment."""
 
     log_level = var("WARNING")
+    # Longer log messages are truncated
+    log_max_length = var(2000, converter=int)
+    # Share of debug and info records written
+    log_sample_rate = var(1.0, converter=float)
+    telemetry_interval = var(10.0, converter=float)
     prometheus_port = var(9001, converter=int)
+    page_size = var(100, converter=int)
+    max_page_size = var(500, converter=int)
 
     @config
     class DB:
@@ -21,12 +28,75 @@ class AppConfig:
         port = var(5432, converter=int)
         database = var("postgres")
         create_structures = var(False, converter=bool)
+        pool_size = var(5, converter=int)
+        max_overflow = var(5, converter=int)
+        pool_timeout = var(10.0, converter=float)
+        pool_recycle = var(1800, converter=int)
+        pool_pre_ping = bool_var(True)
+        # "buffered" writes metric records in bulk, see database/buffer.py
+        records_durability = var("immediate")
+        records_flush_size = var(500, converter=int)
+        records_flush_interval = var(1.0, converter=float)
+        records_buffer_capacity = var(5000, converter=int)
+        # Statements a request may run before it's reported
+        query_budget = var(25, converter=int)
+        # Raise instead of logging requests over budget or repeating queries
+        strict_queries = bool_var(False)
 
     @config
     class AUTH:
         """Authentication service configuration."""
 
         host = var("auth-svc")
+        max_connections = var(100, converter=int)
+        max_keepalive_connections = var(20, converter=int)
+        keepalive_expiry = var(5.0, converter=float)
+        connect_timeout = var(5.0, converter=float)
+        read_timeout = var(10.0, converter=float)
+        http2 = bool_var(False)
+        credentials_cache_size = var(1024, converter=int)
+        credentials_cache_ttl = var(30.0, converter=float)
+        # "remote" asks the auth service, "local" checks signatures here
+        verification = var("remote")
+        keys_path = var("/auth/.well-known/jwks.json")
+        keys_refresh_interval = var(300.0, converter=float)
+        algorithms = var("RS256")
+
+    @config
+    class IMAGES:
+        """Goal images configuration."""
+
+        concurrency = var(8, converter=int)
+        timeout = var(5.0, converter=float)
+        cache_size = var(256, converter=int)
+        cache_max_age = var(60.0, converter=float)
+        # Goals without an image are asked for again after this long
+        missing_max_age = var(10.0, converter=float)
+        # Empty disables the disk tier
+        disk_cache_path = var("")
+        disk_cache_max_bytes = var(100 * 1024 * 1024, converter=int)
+        upload_concurrency = var(4, converter=int)
+        upload_retries = var(3, converter=int)
+        upload_retry_delay = var(0.5, converter=float)
+        upload_queue_size = var(1000, converter=int)
+        upload_status_size = var(10000, converter=int)
+        upload_status_ttl = var(3600.0, converter=float)
+
+    @config
+    class CACHE:
+        """Shared cache of goal listings and progress."""
+
+        # "none", "memory" (one replica) or "redis" (any number)
+        backend = var("none")
+        ttl = var(60.0, converter=float)
+        max_size = var(10000, converter=int)
+        redis_host = var("redis")
+        redis_port = var(6379, converter=int)
+        redis_db = var(0, converter=int)
+        redis_pool_size = var(10, converter=int)
+        redis_timeout = var(0.5, converter=float)
+        lock_ttl = var(5.0, converter=float)
+        lock_wait = var(2.0, converter=float)
 
     @config
     class TEST:
@@ -45,5 +115,7 @@ class AppConfig:
 
     db = group(DB)  # type: ignore
     auth = group(AUTH)  # type: ignore
+    images = group(IMAGES)  # type: ignore
+    cache = group(CACHE)  # type: ignore
     test = group(TEST)  # type: ignore
     sentry = group(Sentry)
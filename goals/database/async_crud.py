@@ -0,0 +1,122 @@
+"""Async versions of the CRUD operations.
+
+Each function runs its counterpart from crud. Given an AsyncSession the
+queries go through the async driver with run_sync, so the event loop is
+free while the database works. Given a Session they run as before.
+"""
+from contextlib import asynccontextmanager
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from goals.database import crud
+from goals.schemas import GoalBase, GoalProgress, GoalUpdate
+
+AnySession = Session | AsyncSession
+
+
+@asynccontextmanager
+async def opened(session: AnySession):
+    """Open session, closing it on exit whatever its kind."""
+    if isinstance(session, AsyncSession):
+        async with session as open_session:
+            yield open_session
+    else:
+        with session as open_session:
+            yield open_session
+
+
+def new_session_like(session: AnySession) -> AnySession:
+    """Create another session of the same kind, on the same engine."""
+    if isinstance(session, AsyncSession):
+        return AsyncSession(autocommit=False, autoflush=False,
+                            bind=session.bind)
+    return Session(autocommit=False, autoflush=False,
+                   bind=session.get_bind())
+
+
+async def release(session: AnySession):
+    """Give the connection back to the pool, session remains usable."""
+    if isinstance(session, AsyncSession):
+        await session.close()
+    else:
+        session.close()
+
+
+async def run_in_session(session: AnySession,
+                         function: Callable[..., Any], *args, **kwargs):
+    """Call function(session, ...) with a synchronous view of session."""
+    if isinstance(session, AsyncSession):
+        return await session.run_sync(function, *args, **kwargs)
+    return function(session, *args, **kwargs)
+
+
+async def get_user_version(session: AnySession, user_id: int) -> int:
+    """Return the version of the goals and progress of user_id."""
+    return await run_in_session(session, crud.get_user_version, user_id)
+
+
+async def record_user_change(session: AnySession, user_id: int) -> None:
+    """Bump the version of user_id for a change stored elsewhere."""
+    return await run_in_session(session, crud.record_user_change, user_id)
+
+
+async def unknown_metrics(session: AnySession,
+                          metrics: List[str]) -> List[str]:
+    """Return the metrics that are not in the catalog, sorted."""
+    return await run_in_session(session, crud.unknown_metrics, metrics)
+
+
+async def create_goal(session: AnySession, goal: GoalBase, user_id: int):
+    """Create a new user in the goals table, using the id as primary key."""
+    return await run_in_session(session, crud.create_goal, goal, user_id)
+
+
+async def create_goals(session: AnySession, goals: List[GoalBase],
+                       user_id: int) -> List[int]:
+    """Create goals for user_id with bulk inserts, return their ids."""
+    return await run_in_session(session, crud.create_goals, goals, user_id)
+
+
+async def get_user_goals(session: AnySession, user_id: int,
+                         after: Optional[int] = None,
+                         limit: Optional[int] = None):
+    """Return goals for user specified by user_id, ordered by id."""
+    return await run_in_session(session, crud.get_user_goals, user_id,
+                                after, limit)
+
+
+async def get_goal(session: AnySession, goal_id: int):
+    """Return details from a goal identified by a certain goal id."""
+    return await run_in_session(session, crud.get_goal, goal_id)
+
+
+async def delete_goal(session: AnySession, goal_id: int):
+    """Delete goal with specified goal ID."""
+    return await run_in_session(session, crud.delete_goal, goal_id)
+
+
+async def get_general_progress(session: AnySession, metric, user_id, days):
+    """Get a metric's progress in the specified amount of time."""
+    return await run_in_session(session, crud.get_general_progress,
+                                metric, user_id, days)
+
+
+async def update_user_goal(session: AnySession, goal_id: int, user_id: int,
+                           details: GoalUpdate) -> bool:
+    """Update a goal of user_id and record its progress in one transaction."""
+    return await run_in_session(session, crud.update_user_goal, goal_id,
+                                user_id, details)
+
+
+async def update_goals_progress(session: AnySession, user_id: int,
+                                updates: List[GoalProgress]):
+    """Set the progress of several goals of user_id in one transaction."""
+    return await run_in_session(session, crud.update_goals_progress,
+                                user_id, updates)
+
+
+async def get_all_metrics(session: AnySession):
+    """Return all available metrics."""
+    return await run_in_session(session, crud.get_all_metrics)
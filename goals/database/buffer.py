@@ -0,0 +1,263 @@
+"""Write-behind buffer for metric records.
+
+Progress updates add a row to metricsRecords and to its day summary. With
+records_durability set to "buffered" those writes are kept in memory and
+sent in bulk, when records_flush_size records are waiting or every
+records_flush_interval seconds, and on shutdown. Records join the buffer
+when the transaction that took them commits, and are dropped if it rolls
+back. A full buffer (records_buffer_capacity records) is written right
+away, with a session of its own, and writes raise BufferFull until it
+has room again. One flush runs at a time, records that could not be
+written go back ahead of newer ones. If the process dies, buffered
+records are lost: at most records_flush_interval seconds or
+records_buffer_capacity records of history. Goals and current values
+are always written immediately, and progress reads include buffered
+records.
+
+The default, "immediate", writes records in the request transaction.
+"""
+import asyncio
+import logging
+import threading
+from datetime import date, datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, \
+    Tuple
+
+from environ import to_config
+from sqlalchemy import event, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from goals.config import AppConfig
+from goals.database.models import MetricsRecords, UserVersions
+from goals.database.rollup import merge_daily_summaries
+from goals.database.util import upsert
+
+IMMEDIATE = "immediate"
+BUFFERED = "buffered"
+# Session info key of records waiting for their transaction to commit
+STAGED_RECORDS = "staged_records"
+
+
+class BufferFull(Exception):
+    """The buffer holds records_buffer_capacity records already."""
+
+
+class PendingRecord(NamedTuple):
+    """Metric record waiting to be written."""
+
+    metric_name: str
+    user_id: int
+    value: int
+    date: datetime
+
+
+def write_records(session: Session, records: List[PendingRecord]) -> None:
+    """Insert records and merge them into day summaries, without committing.
+
+    Records must be in the order they were taken.
+    """
+    summaries: Dict[Tuple, Dict] = {}
+    for record in records:
+        key = (record.user_id, record.metric_name, record.date.date())
+        summary = summaries.get(key)
+        if summary is None:
+            summaries[key] = {
+                "user_id": record.user_id, "metric_name": record.metric_name,
+                "day": record.date.date(), "last_value": record.value,
+                "min_value": record.value, "max_value": record.value,
+                "count": 1,
+            }
+            continue
+        summary["last_value"] = record.value
+        summary["min_value"] = min(summary["min_value"], record.value)
+        summary["max_value"] = max(summary["max_value"], record.value)
+        summary["count"] += 1
+    session.execute(insert(MetricsRecords),
+                    [record._asdict() for record in records])
+    merge_daily_summaries(session, list(summaries.values()))
+
+
+class _Batch:
+    """Buffered records with the last value of each day per user metric."""
+
+    def __init__(self):
+        self.records: List[PendingRecord] = []
+        self.days: Dict[Tuple[int, str], Dict[date, int]] = {}
+
+    def add(self, record: PendingRecord) -> None:
+        """Append record, it is the newest of its user metric."""
+        self.records.append(record)
+        self.days.setdefault((record.user_id, record.metric_name), {})[
+            record.date.date()] = record.value
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class _Flusher:
+    """Background task calling flush every interval or when woken up."""
+
+    def __init__(self, flush: Callable[[], Awaitable], interval: float):
+        self.flush = flush
+        self.interval = interval
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def wake_up(self) -> None:
+        """Ask for a flush, from any thread."""
+        self.loop.call_soon_threadsafe(self.wake.set)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                await self.flush()
+            except SQLAlchemyError as error:
+                logging.error("Could not write metric records: %r", error)
+
+
+class RecordBuffer:
+    """Metric records waiting to be written, see the module docstring."""
+
+    def __init__(self, buffered: bool, flush_size: int, capacity: int,
+                 flush_interval: float):
+        self.buffered = buffered
+        self.flush_size = flush_size
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Batch being written, if any, then the one being filled. Only
+        # one flush runs at a time, so batches are written in order.
+        self._batches = [_Batch()]
+        self._flusher: Optional[_Flusher] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(map(len, self._batches))
+
+    def write(self, session: Session, user_id: int, values: Dict[str, int],
+              when: datetime) -> None:
+        """Record the values of user_id metrics, now or on a later flush.
+
+        Buffered records are kept in session until its transaction
+        commits. Raises BufferFull if the buffer has no room left.
+        """
+        records = [PendingRecord(metric, user_id, value, when)
+                   for metric, value in values.items()]
+        if not self.buffered:
+            write_records(session, records)
+            return
+        if len(self) >= self.capacity:
+            raise BufferFull(f"{len(self)} metric records waiting")
+        session.info.setdefault(STAGED_RECORDS, {}).setdefault(
+            self, []).extend(records)
+
+    def add(self, session: Session, records: List[PendingRecord]) -> None:
+        """Buffer committed records, session is the one that took them.
+
+        A full buffer is written with a new session on the same bind, the
+        caller's one is never committed. Records are kept even past
+        capacity, they are committed already.
+        """
+        with self._lock:
+            for record in records:
+                self._batches[-1].add(record)
+            pending = len(self._batches[-1])
+        if pending >= self.capacity:
+            logging.warning("Metric records buffer full, flushing now")
+            try:
+                with Session(bind=session.get_bind()) as own_session:
+                    self.flush(own_session)
+            except SQLAlchemyError as error:
+                logging.error("Could not write metric records: %r", error)
+        elif pending >= self.flush_size and self._flusher is not None:
+            self._flusher.wake_up()
+
+    def day_values(self, user_id: int, metric: str) -> Dict[date, int]:
+        """Return the last buffered value of each day of a user metric."""
+        with self._lock:
+            days: Dict[date, int] = {}
+            for batch in self._batches:
+                days.update(batch.days.get((user_id, metric), {}))
+            return days
+
+    def flush(self, session: Session) -> int:
+        """Write buffered records with session and commit, return how many.
+
+        Records stay visible to reads until committed, and go back to the
+        buffer, ahead of newer ones, if writing them fails. Returns 0 right
+        away if another flush is running.
+        """
+        with self._lock:
+            batch = self._batches[-1]
+            if not batch or len(self._batches) > 1:
+                return 0
+            self._batches.append(_Batch())
+        written = False
+        try:
+            write_records(session, batch.records)
+            # Progress cached by other replicas lacks these records
+            session.execute(upsert(
+                session, UserVersions,
+                [{"user_id": user_id, "version": 1} for user_id in
+                 sorted({record.user_id for record in batch.records})],
+                ["user_id"],
+                lambda excluded: {"version": UserVersions.version + 1},
+            ))
+            session.commit()
+            written = True
+        finally:
+            with self._lock:
+                newer = self._batches.pop()
+                if not written:
+                    # Back ahead of the records taken meanwhile
+                    for record in newer.records:
+                        batch.add(record)
+                    newer = batch
+                self._batches = [newer]
+        return len(batch)
+
+    async def start(self, flush: Callable[[], Awaitable]) -> None:
+        """Flush in the background with flush(), if records are buffered."""
+        await self.stop()
+        if self.buffered:
+            self._flusher = _Flusher(flush, self.flush_interval)
+
+    async def stop(self) -> None:
+        """Stop flushing in the background and write what is left."""
+        if self._flusher is None:
+            return
+        flusher, self._flusher = self._flusher, None
+        flusher.task.cancel()
+        await asyncio.gather(flusher.task, return_exceptions=True)
+        await flusher.flush()
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_committed_records(session: Session) -> None:
+    for buffer, records in session.info.pop(STAGED_RECORDS, {}).items():
+        buffer.add(session, records)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_records(session: Session) -> None:
+    session.info.pop(STAGED_RECORDS, None)
+
+
+def create_record_buffer(config: AppConfig) -> RecordBuffer:
+    """Create the buffer for the configured records durability."""
+    durability = config.db.records_durability
+    if durability not in (IMMEDIATE, BUFFERED):
+        raise ValueError(f"Unknown records durability {durability}")
+    return RecordBuffer(durability == BUFFERED, config.db.records_flush_size,
+                        config.db.records_buffer_capacity,
+                        config.db.records_flush_interval)
+
+
+RECORD_BUFFER = create_record_buffer(to_config(AppConfig))
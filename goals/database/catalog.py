@@ -0,0 +1,58 @@
+"""In-process copy of the metrics catalog.
+
+The metrics table is small and only changes when metrics are seeded, so
+its rows are kept in memory instead of being queried on every request.
+"""
+import time
+from types import MappingProxyType
+from typing import Callable, List, Mapping, Optional
+
+from sqlalchemy.orm import Session
+
+from goals.database.models import Metrics
+
+
+class MetricsCatalog:
+    """Unit of each metric, loaded on first use.
+
+    The mapping is immutable and replaced whole on refresh, so readers
+    never see a partial catalog. Unknown names reload it, at most once
+    per second, to pick up metrics added by another process.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._units: Optional[Mapping[str, str]] = None
+        self._loaded_at = float("-inf")
+
+    def refresh(self, session: Session) -> Mapping[str, str]:
+        """Load the catalog from the database."""
+        rows = session.query(Metrics.name, Metrics.unit).all()
+        self._units = MappingProxyType({row.name: row.unit for row in rows})
+        self._loaded_at = self._clock()
+        return self._units
+
+    def invalidate(self) -> None:
+        """Forget the catalog, the next lookup loads it again."""
+        self._units = None
+
+    def units(self, session: Session) -> Mapping[str, str]:
+        """Return the unit of every metric."""
+        if self._units is None:
+            return self.refresh(session)
+        return self._units
+
+    def unit(self, session: Session, name: str) -> Optional[str]:
+        """Return the unit of metric name, None if there is no such metric."""
+        units = self.units(session)
+        if name not in units and self._clock() - self._loaded_at >= 1:
+            units = self.refresh(session)
+        return units.get(name)
+
+    def as_list(self, session: Session) -> List[dict]:
+        """Return every metric with its unit."""
+        return [{"name": name, "unit": unit}
+                for name, unit in self.units(session).items()]
+
+
+METRICS_CATALOG = MetricsCatalog()
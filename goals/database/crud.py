@@ -1,9 +1,42 @@
 """Handles CRUD database operations."""
-from sqlalchemy import desc
+from datetime import timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import delete, desc, insert, select, update
 from sqlalchemy.orm import Session
-from goals.database.models import Goals, Metrics, MetricsRecords
-from goals.database.util import current_date
-from goals.schemas import GoalBase, GoalUpdate
+from goals.database.buffer import RECORD_BUFFER
+from goals.database.catalog import METRICS_CATALOG
+from goals.database.models import Goals, MetricsCurrentValues, \
+    MetricsDailyRollups, UserVersions
+from goals.database.util import current_date, upsert
+from goals.schemas import GoalBase, GoalProgress, GoalUpdate
+
+
+def bump_user_version(session: Session, user_id: int) -> None:
+    """Mark goals or progress of user_id as changed, without committing."""
+    session.execute(upsert(
+        session, UserVersions, {"user_id": user_id, "version": 1},
+        ["user_id"],
+        lambda excluded: {"version": UserVersions.version + 1},
+    ))
+
+
+def record_user_change(session: Session, user_id: int) -> None:
+    """Bump the version of user_id for a change stored elsewhere."""
+    bump_user_version(session, user_id)
+    session.commit()
+
+
+def get_user_version(session: Session, user_id: int) -> int:
+    """Return the version of the goals and progress of user_id."""
+    return session.query(UserVersions.version) \
+        .filter(UserVersions.user_id == user_id).scalar() or 0
+
+
+def unknown_metrics(session: Session, metrics: List[str]) -> List[str]:
+    """Return the metrics that are not in the catalog, sorted."""
+    return sorted({metric for metric in metrics
+                   if METRICS_CATALOG.unit(session, metric) is None})
 
 
 def create_goal(session: Session, goal: GoalBase, user_id: int):
@@ -13,25 +46,51 @@ def create_goal(session: Session, goal: GoalBase, user_id: int):
                      time_limit=goal.time_limit, user_id=user_id,
                      progress=0)
     session.add(new_goal)
+    bump_user_version(session, user_id)
     session.commit()
     session.refresh(new_goal)
     return new_goal.id
 
 
-def get_user_goals(session: Session, user_id: int):
-    """Return goals for user specified by user_id."""
+def create_goals(session: Session, goals: List[GoalBase],
+                 user_id: int) -> List[int]:
+    """Create goals for user_id with bulk inserts, return their ids.
+
+    Ids are in the same order as goals.
+    """
+    ids = session.scalars(
+        insert(Goals).returning(Goals.id, sort_by_parameter_order=True),
+        [{"title": goal.title, "description": goal.description,
+          "metric": goal.metric, "objective": goal.objective,
+          "time_limit": goal.time_limit, "user_id": user_id, "progress": 0}
+         for goal in goals],
+    ).all()
+    bump_user_version(session, user_id)
+    session.commit()
+    return ids
+
+
+def get_user_goals(session: Session, user_id: int,
+                   after: Optional[int] = None, limit: Optional[int] = None):
+    """Return goals for user specified by user_id, ordered by id.
+
+    Pages are selected by key: at most limit goals with id after the
+    given one.
+    """
     user_goals = []
-    query = session.query(Goals, Metrics)
-    q_filter = query.join(Goals).filter(Goals.metric == Metrics.name) \
-        .filter(Goals.user_id == user_id)
-    for goals, metrics in q_filter:
+    q_filter = session.query(Goals).filter(Goals.user_id == user_id)
+    if after is not None:
+        q_filter = q_filter.filter(Goals.id > after)
+    q_filter = q_filter.order_by(Goals.id).limit(limit)
+    for goals in q_filter:
         user_goals.append({"id": goals.id,
                            "title": goals.title,
                            "description": goals.description,
-                           "metric": metrics.name,
+                           "metric": goals.metric,
                            "objective": goals.objective,
                            "progress": goals.progress,
-                           "unit": metrics.unit,
+                           "unit": METRICS_CATALOG.unit(session,
+                                                        goals.metric),
                            "time_limit": goals.time_limit})
     return user_goals
 
@@ -43,73 +102,226 @@ def get_goal(session: Session, goal_id: int):
 
 def delete_goal(session: Session, goal_id: int):
     """Delete goal with specified goal ID."""
-    session.query(Goals).filter(Goals.id == goal_id).delete()
+    user_id = session.execute(
+        delete(Goals).where(Goals.id == goal_id).returning(Goals.user_id),
+        execution_options={"synchronize_session": False},
+    ).scalar()
+    if user_id is not None:
+        bump_user_version(session, user_id)
     session.commit()
 
 
+def _latest_day_value(session: Session, metric, user_id, window_start,
+                      before: bool):
+    """Return the last value of the newest day in or before the window.
+
+    Buffered records take precedence over stored summaries of their day.
+    """
+    def in_range(day):
+        return day < window_start if before else day >= window_start
+    buffered = {day: value for day, value in
+                RECORD_BUFFER.day_values(user_id, metric).items()
+                if in_range(day)}
+    rollup = MetricsDailyRollups
+    # Days ending in 0 never counted as progress, they are skipped
+    query = session.query(rollup.day, rollup.last_value) \
+        .filter(rollup.user_id == user_id) \
+        .filter(rollup.metric_name == metric) \
+        .filter(rollup.last_value != 0) \
+        .filter(rollup.day < window_start if before
+                else rollup.day >= window_start)
+    if buffered:
+        query = query.filter(rollup.day.notin_(list(buffered)))
+    candidates = [(day, value) for day, value in buffered.items() if value]
+    stored = query.order_by(desc(rollup.day)).limit(1).first()
+    if stored is not None:
+        candidates.append(tuple(stored))
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
 def get_general_progress(session, metric, user_id, days):
-    """Get a metric's progress in the specified amount of time."""
-    date = current_date()
-    metric_exists = session.query(Metrics).\
-        filter(Metrics.name == metric).first()
-    if metric_exists is None:
+    """Get a metric's progress in the specified amount of time.
+
+    Progress is the last value of the newest day inside the window minus
+    the last value of the newest day before it. Both come from single row
+    lookups on the daily rollup, whatever the window length.
+    """
+    window_start = (current_date() - timedelta(days=days)).date()
+    if METRICS_CATALOG.unit(session, metric) is None:
         return None
-    records = session.query(MetricsRecords).\
-        filter(MetricsRecords.user_id == user_id) \
-        .filter(MetricsRecords.metric_name == metric) \
-        .order_by(desc(MetricsRecords.date)).all()
-    if records is None or len(records) == 0:
+    latest_progress = _latest_day_value(session, metric, user_id,
+                                        window_start, before=False)
+    if latest_progress is None or latest_progress <= 0:
         return 0
-    latest_progress = 0
-    oldest_progress = 0
-    for record in records:
-        delta = (date - record.date).days
-        if delta <= days and latest_progress == 0:
-            latest_progress = record.value
-        if delta > days and oldest_progress == 0:
-            oldest_progress = record.value
-    if latest_progress > 0:
-        return latest_progress - oldest_progress
-    return 0
-
-
-def update_goal(session: Session, goal_id: int, details: GoalUpdate):
-    """Update goal with specified ID with provided data."""
-    initial_goal = get_goal(session, goal_id)
-    progress_delta = details.progress - initial_goal.progress
+    oldest_progress = _latest_day_value(session, metric, user_id,
+                                        window_start, before=True)
+    return latest_progress - (oldest_progress or 0)
+
+
+class UpdatedGoal(NamedTuple):
+    """Goal values returned after an update."""
+
+    metric: str
+    user_id: int
+    progress: int
+    progress_delta: int
+
+
+def update_goal(session: Session, goal_id: int, details: GoalUpdate,
+                user_id: Optional[int] = None) -> Optional[UpdatedGoal]:
+    """Update goal with specified ID with provided data, without committing.
+
+    The update is conditional on the goal owner when user_id is given, and
+    returns the goal values, or None when no goal matched. Progress
+    changes first lock the row to read the previous progress, so
+    concurrent updates get consistent deltas.
+    """
+    conditions = [Goals.id == goal_id]
+    if user_id is not None:
+        conditions.append(Goals.user_id == user_id)
+    previous_progress = 0
+    if details.progress is not None:
+        previous = session.execute(
+            select(Goals.progress).where(*conditions).with_for_update()
+        ).first()
+        if previous is None:
+            return None
+        previous_progress = previous.progress
     col = {
         col: val for col, val in details.__dict__.items() if val is not None
+    } or {"progress": Goals.progress}
+    goal = session.execute(
+        update(Goals).where(*conditions).values(**col)
+        .returning(Goals.metric, Goals.user_id, Goals.progress),
+        execution_options={"synchronize_session": False},
+    ).first()
+    if goal is None:
+        return None
+    bump_user_version(session, goal.user_id)
+    delta = goal.progress - previous_progress \
+        if details.progress is not None else 0
+    return UpdatedGoal(goal.metric, goal.user_id, goal.progress, delta)
+
+
+class MetricChange(NamedTuple):
+    """Progress to record for a metric.
+
+    progress is the value of a first record, later records move the
+    current value by progress_delta.
+    """
+
+    progress: int
+    progress_delta: int
+
+
+def _advance_current_value(session: Session, metric: str, user_id: int,
+                           change: MetricChange) -> int:
+    """Apply change to the current value with an atomic upsert."""
+    return session.execute(upsert(
+        session, MetricsCurrentValues,
+        {"user_id": user_id, "metric_name": metric, "value": change.progress},
+        ["user_id", "metric_name"],
+        lambda excluded: {
+            "value": MetricsCurrentValues.value + change.progress_delta
+        },
+    ).returning(MetricsCurrentValues.value)).scalar_one()
+
+
+def new_metric_records(session: Session, user_id: int,
+                       changes: Dict[str, MetricChange],
+                       bump_version: bool = True) -> Dict[str, int]:
+    """Create one record per changed metric, without committing.
+
+    Records and day summaries are written with one statement each, or
+    buffered, returns the recorded value of every metric. Callers that
+    already bumped the user version in this transaction skip the bump.
+    """
+    date = current_date()
+    values = {
+        metric: _advance_current_value(session, metric, user_id, change)
+        for metric, change in changes.items()
     }
-    session.query(Goals).filter(Goals.id == goal_id).update(values=col)
-    session.commit()
-    return progress_delta
+    RECORD_BUFFER.write(session, user_id, values, date)
+    if bump_version:
+        bump_user_version(session, user_id)
+    return values
 
 
-def get_latest_record(session, metric_name, user_id):
-    """Get latest metric record for a certain user_id."""
-    return session.query(MetricsRecords).\
-        filter(MetricsRecords.user_id == user_id) \
-        .filter(MetricsRecords.metric_name == metric_name)\
-        .order_by(desc(MetricsRecords.date)).first()
+def new_metric_record(session: Session, metric: str, user_id: int,
+                      progress: int, progress_delta: int):
+    """Create new metric record after a progress update, without committing.
 
+    The current value is moved by progress_delta, or set to the goal
+    progress for a first record, with an atomic upsert whose result is
+    the recorded value.
+    """
+    new_metric_records(session, user_id,
+                       {metric: MetricChange(progress, progress_delta)})
 
-def new_metric_record(session: Session, goal_id: int, progress_delta: int):
-    """Create new metric record after a progress update."""
-    goal = session.query(Goals).filter(Goals.id == goal_id).first()
-    latest_record = get_latest_record(session, goal.metric, goal.user_id)
-    new_value = goal.progress
-    if latest_record is not None:
-        new_value = latest_record.value + progress_delta
-    new_record = MetricsRecords(metric_name=goal.metric, user_id=goal.user_id,
-                                value=new_value, date=current_date())
-    session.add(new_record)
+
+def update_user_goal(session: Session, goal_id: int, user_id: int,
+                     details: GoalUpdate) -> bool:
+    """Update a goal of user_id and record its progress in one transaction.
+
+    Returns False, changing nothing, if the user has no such goal.
+    """
+    goal = update_goal(session, goal_id, details, user_id)
+    if goal is None:
+        session.rollback()
+        return False
+    if details.progress is not None:
+        # update_goal already bumped the version
+        new_metric_records(session, goal.user_id, {
+            goal.metric: MetricChange(goal.progress, goal.progress_delta)
+        }, bump_version=False)
+    session.commit()
+    return True
+
+
+def update_goals_progress(session: Session, user_id: int,
+                          updates: List[GoalProgress]) -> Dict[int, int]:
+    """Set the progress of several goals of user_id in one transaction.
+
+    Ownership of every goal is checked with a single locking query, goals
+    of other users are skipped. Goal updates are sent as one bulk
+    statement and each metric gets one record for the whole batch.
+    Returns the owner of each goal found.
+    """
+    goals = {goal.id: goal for goal in session.execute(
+        select(Goals.id, Goals.user_id, Goals.metric, Goals.progress)
+        .where(Goals.id.in_({item.goal_id for item in updates}))
+        .order_by(Goals.id).with_for_update()
+    )}
+    progress: Dict[int, int] = {}
+    changes: Dict[str, MetricChange] = {}
+    for item in updates:
+        goal = goals.get(item.goal_id)
+        if goal is None or goal.user_id != user_id:
+            continue
+        delta = item.progress - progress.get(goal.id, goal.progress)
+        progress[goal.id] = item.progress
+        change = changes.get(goal.metric)
+        if change is None:
+            changes[goal.metric] = MetricChange(item.progress, delta)
+        else:
+            changes[goal.metric] = MetricChange(
+                change.progress + delta, change.progress_delta + delta
+            )
+    if progress:
+        session.execute(update(Goals), [
+            {"id": goal_id, "progress": value}
+            for goal_id, value in progress.items()
+        ])
+        new_metric_records(session, user_id, changes)
     session.commit()
-    session.refresh(new_record)
+    return {goal.id: goal.user_id for goal in goals.values()}
 
 
 def get_all_metrics(session: Session):
     """Return all available metrics."""
-    return session.query(Metrics).all()
+    return METRICS_CATALOG.as_list(session)
 
 
 def correct_user_id(session: Session, goal_id: int, _id: int):
@@ -3,6 +3,7 @@ from typing import List, Any
 
 from sqlalchemy.orm import Session
 
+from goals.database.catalog import METRICS_CATALOG
 from goals.database.models import Metrics
 
 
@@ -14,6 +15,7 @@ def _insert(session, records: List[Any]) -> None:
             continue
         session.add(record)
     session.commit()
+    METRICS_CATALOG.invalidate()
 
 
 def insert_new_metrics(session: Session):
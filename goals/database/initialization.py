@@ -1,11 +1,18 @@
 """Handles database connection."""
-from sqlalchemy import URL
+from sqlalchemy import URL, Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from goals.config import AppConfig
+from goals.database.pool import TimedAsyncAdaptedQueuePool, TimedQueuePool
+
+ASYNC_DRIVERS = {"asyncpg", "aiosqlite", "psycopg_async", "asyncmy"}
 
 
 def get_database_url(config: AppConfig) -> URL:
     """Return connection parameters."""
+    if config.db.driver.startswith("sqlite"):
+        return URL.create(drivername=config.db.driver,
+                          database=config.db.database)
     return URL.create(
         drivername=config.db.driver,
         username=config.db.user,
@@ -14,3 +21,38 @@ def get_database_url(config: AppConfig) -> URL:
         port=config.db.port,
         database=config.db.database,
     )
+
+
+def get_sync_database_url(config: AppConfig) -> URL:
+    """Return connection parameters using the default, synchronous driver.
+
+    Used by maintenance commands, which don't need asyncio.
+    """
+    url = get_database_url(config)
+    return url.set(drivername=url.get_backend_name())
+
+
+def is_async_driver(config: AppConfig) -> bool:
+    """Tell whether the configured driver is meant for asyncio."""
+    return config.db.driver.partition("+")[2] in ASYNC_DRIVERS
+
+
+def get_pool_arguments(config: AppConfig) -> dict:
+    """Return connection pool settings for the engine."""
+    return {
+        "pool_size": config.db.pool_size,
+        "max_overflow": config.db.max_overflow,
+        "pool_timeout": config.db.pool_timeout,
+        "pool_recycle": config.db.pool_recycle,
+        "pool_pre_ping": config.db.pool_pre_ping,
+    }
+
+
+def create_database_engine(config: AppConfig) -> Engine | AsyncEngine:
+    """Create an async engine for async drivers, a regular one otherwise."""
+    if is_async_driver(config):
+        return create_async_engine(get_database_url(config),
+                                   poolclass=TimedAsyncAdaptedQueuePool,
+                                   **get_pool_arguments(config))
+    return create_engine(get_database_url(config), poolclass=TimedQueuePool,
+                         **get_pool_arguments(config))
@@ -0,0 +1,129 @@
+"""Versioned schema migrations.
+
+Each migration module defines VERSION, DESCRIPTION, TRANSACTIONAL and
+upgrade/downgrade functions taking a connection. Migrations that are not
+transactional run in autocommit mode, so statements like CREATE INDEX
+CONCURRENTLY don't lock tables in production. On PostgreSQL runs hold an
+advisory lock, so replicas starting together migrate one at a time.
+
+Run them with: python -m goals.database.migrations upgrade
+"""
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import (
+    Column, DateTime, Engine, Integer, MetaData, String, Table, delete,
+    insert, select, text,
+)
+
+from goals.database.migrations import (
+    m0001_initial_schema, m0002_performance_indexes, m0003_daily_rollups,
+    m0004_current_values, m0005_user_versions,
+)
+
+MIGRATIONS = [
+    m0001_initial_schema,
+    m0002_performance_indexes,
+    m0003_daily_rollups,
+    m0004_current_values,
+    m0005_user_versions,
+]
+LATEST_VERSION = MIGRATIONS[-1].VERSION
+# Advisory lock taken by migration runs, any constant shared by replicas
+LOCK_KEY = 4_147_001
+
+metadata = MetaData()
+schema_versions = Table(
+    "schema_versions", metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String),
+    Column("applied_at", DateTime),
+)
+
+
+def current_version(engine: Engine) -> int:
+    """Return the latest applied migration, 0 for an empty database."""
+    metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        applied = connection.execute(
+            select(schema_versions.c.version)
+            .order_by(schema_versions.c.version.desc()).limit(1)
+        ).scalar()
+    return applied or 0
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """Wait until no other process migrates the database, then hold it.
+
+    The lock is held by its own autocommit connection, an open transaction
+    would make CREATE INDEX CONCURRENTLY wait for it.
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"),
+                           {"key": LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"),
+                               {"key": LOCK_KEY})
+
+
+def _run(engine: Engine, migration, step, record) -> None:
+    """Run one step of migration and record it, together if possible.
+
+    Transactional steps are recorded in the same transaction. Others run
+    in autocommit mode and are recorded right after they complete.
+    """
+    if migration.TRANSACTIONAL:
+        with engine.begin() as connection:
+            step(connection)
+            connection.execute(record)
+        return
+    with engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as connection:
+        step(connection)
+    with engine.begin() as connection:
+        connection.execute(record)
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> int:
+    """Apply pending migrations up to target, the latest by default."""
+    target = LATEST_VERSION if target is None else target
+    with migration_lock(engine):
+        version = current_version(engine)
+        for migration in MIGRATIONS:
+            if version < migration.VERSION <= target:
+                logging.info("Applying migration %s: %s",
+                             migration.VERSION, migration.DESCRIPTION)
+                _run(engine, migration, migration.upgrade,
+                     insert(schema_versions).values(
+                         version=migration.VERSION,
+                         description=migration.DESCRIPTION,
+                         applied_at=datetime.now(),
+                     ))
+                version = migration.VERSION
+    return version
+
+
+def downgrade(engine: Engine, target: int) -> int:
+    """Revert applied migrations newer than target."""
+    with migration_lock(engine):
+        version = current_version(engine)
+        for migration in reversed(MIGRATIONS):
+            if target < migration.VERSION <= version:
+                logging.info("Reverting migration %s: %s",
+                             migration.VERSION, migration.DESCRIPTION)
+                _run(engine, migration, migration.downgrade,
+                     delete(schema_versions).where(
+                         schema_versions.c.version == migration.VERSION
+                     ))
+        return current_version(engine)
@@ -0,0 +1,44 @@
+"""Command line entry point for schema migrations."""
+import argparse
+import logging
+import sys
+
+from environ import to_config
+from sqlalchemy import create_engine
+
+from goals.config import AppConfig
+from goals.database.initialization import get_sync_database_url
+from goals.database.migrations import current_version, downgrade, upgrade
+
+
+def main():
+    """Parse arguments and run the requested command."""
+    parser = argparse.ArgumentParser(
+        prog="python -m goals.database.migrations",
+        description="Manage the goals database schema.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="apply migrations")
+    upgrade_parser.add_argument("--to", type=int, default=None,
+                                help="target version, latest by default")
+    downgrade_parser = commands.add_parser("downgrade",
+                                           help="revert migrations")
+    downgrade_parser.add_argument("--to", type=int, required=True,
+                                  help="target version, 0 drops everything")
+    commands.add_parser("current", help="show the applied version")
+    args = parser.parse_args()
+
+    configuration = to_config(AppConfig)
+    logging.basicConfig(level=configuration.log_level.upper())
+    engine = create_engine(get_sync_database_url(configuration))
+    if args.command == "upgrade":
+        version = upgrade(engine, args.to)
+    elif args.command == "downgrade":
+        version = downgrade(engine, args.to)
+    else:
+        version = current_version(engine)
+    sys.stdout.write(f"Schema version {version}\n")
+
+
+if __name__ == "__main__":
+    main()
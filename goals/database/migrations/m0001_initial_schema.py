@@ -0,0 +1,56 @@
+"""Tables as they were created before migrations existed."""
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Integer, MetaData, String, Table, select,
+    insert,
+)
+
+VERSION = 1
+DESCRIPTION = "Initial schema"
+TRANSACTIONAL = True
+
+metadata = MetaData()
+metrics = Table(
+    "metrics", metadata,
+    Column("name", String, primary_key=True, autoincrement=False),
+    Column("unit", String),
+)
+Table(
+    "goals", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer),
+    Column("description", String),
+    Column("title", String),
+    Column("metric", String, ForeignKey("metrics.name"), nullable=False),
+    Column("objective", Integer),
+    Column("time_limit", String),
+    Column("progress", Integer),
+)
+Table(
+    "metricsRecords", metadata,
+    Column("metric_name", String, ForeignKey("metrics.name"),
+           primary_key=True),
+    Column("user_id", Integer, primary_key=True, nullable=False),
+    Column("value", Integer),
+    Column("date", DateTime, primary_key=True),
+)
+INITIAL_METRICS = [
+    {"name": "distance", "unit": "km"},
+    {"name": "muscle", "unit": "kg"},
+    {"name": "fat", "unit": "kg"},
+    {"name": "steps", "unit": "step"},
+]
+
+
+def upgrade(connection) -> None:
+    """Create missing tables and load the fixed metrics."""
+    metadata.create_all(bind=connection, checkfirst=True)
+    existing = set(connection.execute(select(metrics.c.name)).scalars())
+    missing = [metric for metric in INITIAL_METRICS
+               if metric["name"] not in existing]
+    if missing:
+        connection.execute(insert(metrics), missing)
+
+
+def downgrade(connection) -> None:
+    """Drop every table."""
+    metadata.drop_all(bind=connection, checkfirst=True)
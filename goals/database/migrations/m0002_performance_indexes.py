@@ -0,0 +1,56 @@
+"""Indexes for the goals listing and the latest record lookups."""
+import logging
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, \
+    Table, text
+
+VERSION = 2
+DESCRIPTION = "Index goals by user and records by user, metric and date"
+# CREATE INDEX CONCURRENTLY can't run inside a transaction
+TRANSACTIONAL = False
+
+
+metadata = MetaData()
+goals = Table("goals", metadata, Column("user_id", Integer))
+records = Table(
+    "metricsRecords", metadata,
+    Column("user_id", Integer),
+    Column("metric_name", String),
+    Column("date", DateTime),
+)
+INDEXES = [
+    Index("ix_goals_user_id", goals.c.user_id,
+          postgresql_concurrently=True),
+    Index("ix_metricsRecords_user_metric_date", records.c.user_id,
+          records.c.metric_name, records.c.date.desc(),
+          postgresql_concurrently=True),
+]
+
+
+def is_invalid(connection, index: Index) -> bool:
+    """Tell whether an interrupted concurrent build left index invalid."""
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(text(
+        "SELECT NOT i.indisvalid FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {"name": index.name}).scalar())
+
+
+def upgrade(connection) -> None:
+    """Create the indexes without blocking writes.
+
+    Invalid indexes exist but are never used, they are built again.
+    """
+    for index in INDEXES:
+        if is_invalid(connection, index):
+            logging.warning("Rebuilding invalid index %s", index.name)
+            index.drop(bind=connection)
+        index.create(bind=connection, checkfirst=True)
+
+
+def downgrade(connection) -> None:
+    """Drop the indexes."""
+    for index in INDEXES:
+        index.drop(bind=connection, checkfirst=True)
@@ -0,0 +1,59 @@
+"""Per day summaries of metrics records, filled from existing records."""
+from sqlalchemy import (
+    Column, Date, DateTime, ForeignKey, Integer, MetaData, String, Table,
+    func, insert, select,
+)
+
+VERSION = 3
+DESCRIPTION = "Daily rollup of metrics records"
+TRANSACTIONAL = True
+
+metadata = MetaData()
+Table("metrics", metadata,
+      Column("name", String, primary_key=True, autoincrement=False))
+rollups = Table(
+    "metricsDailyRollups", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("metric_name", String, ForeignKey("metrics.name"),
+           primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("last_value", Integer, nullable=False),
+    Column("min_value", Integer, nullable=False),
+    Column("max_value", Integer, nullable=False),
+    Column("count", Integer, nullable=False),
+)
+records = Table(
+    "metricsRecords", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("metric_name", String, primary_key=True),
+    Column("date", DateTime, primary_key=True),
+    Column("value", Integer),
+)
+
+
+def upgrade(connection) -> None:
+    """Create the rollup table with a summary of each day of records."""
+    rollups.create(bind=connection, checkfirst=True)
+    day = func.date(records.c.date)
+    daily = select(
+        records.c.user_id, records.c.metric_name, day.label("day"),
+        func.min(records.c.value).label("min_value"),
+        func.max(records.c.value).label("max_value"),
+        func.count().label("count"),
+        func.max(records.c.date).label("last_date"),
+    ).group_by(records.c.user_id, records.c.metric_name, day).subquery()
+    connection.execute(insert(rollups).from_select(
+        ["user_id", "metric_name", "day", "last_value", "min_value",
+         "max_value", "count"],
+        select(daily.c.user_id, daily.c.metric_name, daily.c.day,
+               records.c.value, daily.c.min_value, daily.c.max_value,
+               daily.c.count)
+        .join(records, (records.c.user_id == daily.c.user_id)
+              & (records.c.metric_name == daily.c.metric_name)
+              & (records.c.date == daily.c.last_date)),
+    ))
+
+
+def downgrade(connection) -> None:
+    """Drop the rollup table."""
+    rollups.drop(bind=connection, checkfirst=True)
@@ -0,0 +1,47 @@
+"""Latest value of each user metric, filled from existing records."""
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Integer, MetaData, String, Table, func,
+    insert, select,
+)
+
+VERSION = 4
+DESCRIPTION = "Current value per user and metric"
+TRANSACTIONAL = True
+
+metadata = MetaData()
+Table("metrics", metadata,
+      Column("name", String, primary_key=True, autoincrement=False))
+records = Table(
+    "metricsRecords", metadata,
+    Column("metric_name", String, primary_key=True),
+    Column("user_id", Integer, primary_key=True),
+    Column("value", Integer),
+    Column("date", DateTime, primary_key=True),
+)
+current_values = Table(
+    "metricsCurrentValues", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("metric_name", String, ForeignKey("metrics.name"),
+           primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+
+def upgrade(connection) -> None:
+    """Create the table with the newest record value of each metric."""
+    current_values.create(bind=connection, checkfirst=True)
+    latest = select(records.c.user_id, records.c.metric_name,
+                    func.max(records.c.date).label("date")) \
+        .group_by(records.c.user_id, records.c.metric_name).subquery()
+    connection.execute(insert(current_values).from_select(
+        ["user_id", "metric_name", "value"],
+        select(records.c.user_id, records.c.metric_name, records.c.value)
+        .join(latest, (records.c.user_id == latest.c.user_id)
+              & (records.c.metric_name == latest.c.metric_name)
+              & (records.c.date == latest.c.date)),
+    ))
+
+
+def downgrade(connection) -> None:
+    """Drop the table."""
+    current_values.drop(bind=connection, checkfirst=True)
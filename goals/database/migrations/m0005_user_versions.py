@@ -0,0 +1,23 @@
+"""Per user version of goals and progress, used as ETag."""
+from sqlalchemy import Column, Integer, MetaData, Table
+
+VERSION = 5
+DESCRIPTION = "Per user goals version"
+TRANSACTIONAL = True
+
+metadata = MetaData()
+user_versions = Table(
+    "userVersions", metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("version", Integer, nullable=False),
+)
+
+
+def upgrade(connection) -> None:
+    """Create the versions table, users start at version 0."""
+    user_versions.create(bind=connection, checkfirst=True)
+
+
+def downgrade(connection) -> None:
+    """Drop the versions table."""
+    user_versions.drop(bind=connection, checkfirst=True)
@@ -1,6 +1,8 @@
 """Defines table structure for each table in the database."""
 
-from sqlalchemy import Column, ForeignKey, String, Integer, DateTime
+from sqlalchemy import (
+    Column, ForeignKey, String, Integer, Date, DateTime, Index
+)
 from sqlalchemy.orm import (
     Mapped, declarative_base, mapped_column
 )
@@ -13,7 +15,7 @@ class Goals(Base):
 
     __tablename__ = "goals"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    user_id = Column(Integer)
+    user_id = Column(Integer, index=True)
     description = Column(String)
     title = Column(String)
     metric = Column(String, ForeignKey("metrics.name"), nullable=False)
@@ -47,3 +49,48 @@ class MetricsRecords(Base):
 
     def __repr__(self):
         return f"<MetricsRecords {self.metric_name, self.user_id, self.date}>"
+
+
+class MetricsDailyRollups(Base):
+    """Table structure for per day summaries of metrics records."""
+
+    __tablename__ = "metricsDailyRollups"
+    user_id = Column(Integer, primary_key=True)
+    metric_name = Column(String, ForeignKey("metrics.name"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    last_value = Column(Integer, nullable=False)
+    min_value = Column(Integer, nullable=False)
+    max_value = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<MetricsDailyRollups " \
+            f"{self.metric_name, self.user_id, self.day}>"
+
+
+class MetricsCurrentValues(Base):
+    """Table structure for the latest value of each user metric."""
+
+    __tablename__ = "metricsCurrentValues"
+    user_id = Column(Integer, primary_key=True)
+    metric_name = Column(String, ForeignKey("metrics.name"), primary_key=True)
+    value = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<MetricsCurrentValues " \
+            f"{self.metric_name, self.user_id, self.value}>"
+
+
+Index("ix_metricsRecords_user_metric_date", MetricsRecords.user_id,
+      MetricsRecords.metric_name, MetricsRecords.date.desc())
+
+
+class UserVersions(Base):
+    """Table structure for a counter bumped on every change to user goals."""
+
+    __tablename__ = "userVersions"
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<UserVersions {self.user_id, self.version}>"
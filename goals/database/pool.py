@@ -0,0 +1,58 @@
+"""Connection pools that keep track of checkout wait times."""
+import time
+
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class WaitStatistics:
+    """Time spent waiting for pooled connections."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Add one checkout."""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout takes."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait = WaitStatistics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait.record(time.perf_counter() - start)
+
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool recording how long each checkout takes."""
+
+
+def pool_statistics(engine: Engine | AsyncEngine) -> dict:
+    """Return usage figures for the engine connection pool."""
+    pool = getattr(engine, "sync_engine", engine).pool
+    statistics = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    wait = getattr(pool, "wait", None)
+    if wait is not None:
+        statistics.update({
+            "wait_count": wait.count,
+            "wait_total": wait.total,
+            "wait_max": wait.max,
+        })
+    return statistics
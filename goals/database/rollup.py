@@ -0,0 +1,107 @@
+"""Daily summaries of metrics records.
+
+Each progress update adds a row to metricsRecords. The rollup keeps, per
+user, metric and day, the last value of the day along with its minimum,
+maximum and number of records, so progress queries read one row per day
+instead of one per update.
+
+Migration 3 fills it from existing records. Should it ever drift, rebuild
+it with: python -m goals.database.rollup
+"""
+import logging
+import sys
+from typing import Dict, List
+
+from environ import to_config
+from sqlalchemy import case, create_engine, delete, insert
+from sqlalchemy.orm import Session
+
+from goals.config import AppConfig
+from goals.database.initialization import get_sync_database_url
+from goals.database.models import MetricsDailyRollups, MetricsRecords
+from goals.database.util import upsert
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def merge_daily_summaries(session: Session, summaries: List[Dict]) -> None:
+    """Add partial day summaries to the stored ones, without committing.
+
+    Each summary covers records newer than the stored ones for its day,
+    and there is at most one per user, metric and day.
+    """
+    rollup = MetricsDailyRollups
+    session.execute(upsert(
+        session, rollup, summaries,
+        ["user_id", "metric_name", "day"],
+        lambda excluded: {
+            "last_value": excluded.last_value,
+            "min_value": case(
+                (excluded.min_value < rollup.min_value, excluded.min_value),
+                else_=rollup.min_value,
+            ),
+            "max_value": case(
+                (excluded.max_value > rollup.max_value, excluded.max_value),
+                else_=rollup.max_value,
+            ),
+            "count": rollup.count + excluded.count,
+        },
+    ))
+
+
+def backfill_daily_rollup(session: Session) -> int:
+    """Rebuild every day summary from metricsRecords, return rows written.
+
+    Records added while this runs may be counted twice, run it before
+    traffic reaches a freshly migrated database.
+    """
+    session.execute(delete(MetricsDailyRollups))
+    records = session.query(MetricsRecords.user_id,
+                            MetricsRecords.metric_name,
+                            MetricsRecords.value, MetricsRecords.date) \
+        .order_by(MetricsRecords.user_id, MetricsRecords.metric_name,
+                  MetricsRecords.date) \
+        .execution_options(yield_per=BACKFILL_BATCH_SIZE)
+    summaries = []
+    written = 0
+    current = {"key": None}
+    for user_id, metric_name, value, date in records:
+        key = (user_id, metric_name, date.date())
+        if current["key"] != key:
+            current = {"key": key, "user_id": user_id,
+                       "metric_name": metric_name, "day": date.date(),
+                       "last_value": value, "min_value": value,
+                       "max_value": value, "count": 0}
+            summaries.append(current)
+        current["last_value"] = value
+        current["min_value"] = min(current["min_value"], value)
+        current["max_value"] = max(current["max_value"], value)
+        current["count"] += 1
+        if len(summaries) > BACKFILL_BATCH_SIZE:
+            written += _write_summaries(session, summaries[:-1])
+            summaries = summaries[-1:]
+    written += _write_summaries(session, summaries)
+    session.commit()
+    return written
+
+
+def _write_summaries(session: Session, summaries) -> int:
+    rows = [{k: v for k, v in summary.items() if k != "key"}
+            for summary in summaries]
+    if rows:
+        session.execute(insert(MetricsDailyRollups), rows)
+    return len(rows)
+
+
+def main():
+    """Rebuild the rollup for the configured database."""
+    configuration = to_config(AppConfig)
+    logging.basicConfig(level=configuration.log_level.upper())
+    engine = create_engine(get_sync_database_url(configuration))
+    with Session(engine) as session:
+        written = backfill_daily_rollup(session)
+    sys.stdout.write(f"Wrote {written} daily summaries\n")
+
+
+if __name__ == "__main__":
+    main()
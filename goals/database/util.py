@@ -1,7 +1,30 @@
 """General utility functions for database handling."""
 from datetime import datetime
+from typing import Callable, Dict, List, Union
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
 
 
 def current_date():
     """Return current datetime."""
     return datetime.now()
+
+
+UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+
+def upsert(session: Session, model, values: Union[Dict, List[Dict]],
+           keys: List[str], update: Callable[..., Dict]):
+    """Return an insert that updates the row with the same keys instead.
+
+    values is one row or a list of rows with distinct keys. update
+    receives the rejected row (excluded) and returns the new column values.
+    """
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name not in UPSERT_DIALECTS:
+        raise ValueError(f"Upsert is not supported on {dialect_name}")
+    statement = UPSERT_DIALECTS[dialect_name].insert(model).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=keys, set_=update(statement.excluded)
+    )
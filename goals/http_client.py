@@ -0,0 +1,50 @@
+"""Shared HTTP client used to talk to the authentication service."""
+from typing import Optional
+
+import httpx
+
+from goals.config import AppConfig
+
+
+def create_http_client(config: AppConfig, **kwargs) -> httpx.AsyncClient:
+    """Create a pooled client with the limits and timeouts configured."""
+    limits = httpx.Limits(
+        max_connections=config.auth.max_connections,
+        max_keepalive_connections=config.auth.max_keepalive_connections,
+        keepalive_expiry=config.auth.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        config.auth.read_timeout, connect=config.auth.connect_timeout
+    )
+    return httpx.AsyncClient(
+        limits=limits, timeout=timeout, http2=config.auth.http2, **kwargs
+    )
+
+
+class HttpClient:
+    """Application-lifetime client, opened on startup and closed on shutdown.
+
+    If the client is requested before startup (scripts, tests) it is
+    created on first use.
+    """
+
+    def __init__(self, config: AppConfig):
+        self._config = config
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self, **kwargs) -> None:
+        """Create the client, extra arguments are passed to httpx."""
+        await self.stop()
+        self._client = create_http_client(self._config, **kwargs)
+
+    async def stop(self) -> None:
+        """Close the client and release its pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get(self) -> httpx.AsyncClient:
+        """Return the shared client."""
+        if self._client is None:
+            self._client = create_http_client(self._config)
+        return self._client
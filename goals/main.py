@@ -1,32 +1,48 @@
 """Requests handlers."""
+import asyncio
+import json
 import logging
-import os
 import time
-from typing import Optional
+from typing import NamedTuple, Optional
 
+import httpx
 import sentry_sdk
-from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, \
+    Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.applications import get_swagger_ui_html
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import REGISTRY
 from environ import to_config
-from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from newrelic.agent import (
-    record_custom_metric as record_metric,
-    register_application,
-)
+from newrelic.agent import record_custom_metrics, register_application
 
 from goals.config import AppConfig
-from goals.database.crud import create_goal, get_user_goals, get_goal, \
-    get_all_metrics, delete_goal, update_goal, correct_user_id, \
-    new_metric_record, get_general_progress
-from goals.database.data import initialize_db
-from goals.database.models import Base
-from goals.database.initialization import get_database_url
+from goals.cache import TTLCache
+from goals.database.async_crud import create_goal, create_goals, \
+    get_user_goals, get_goal, get_all_metrics, delete_goal, \
+    get_general_progress, release, update_user_goal, \
+    update_goals_progress, opened, run_in_session, get_user_version, \
+    record_user_change, new_session_like, unknown_metrics, AnySession
+from goals.database.buffer import BufferFull, RECORD_BUFFER
+from goals.database.catalog import METRICS_CATALOG
+from goals.database.initialization import create_database_engine, \
+    is_async_driver
+from goals.database.pool import pool_statistics
+from goals.database.util import current_date
 from goals.healthcheck import HealthCheckDto
-from goals.schemas import GoalBase, GoalUpdate
-from goals.util import get_credentials, upload_image, download_image
+from goals.monitoring import CacheCollector, PoolCollector, \
+    PrometheusMiddleware, QueryProfileMiddleware, SingleFlightCollector, \
+    instrument_engine, start_metrics_server
+from goals.schemas import GoalBase, GoalBatch, GoalUpdate, ProgressBatch
+from goals.util import get_credentials, upload_image, download_image, \
+    forget_image, CREDENTIALS_CACHE, HTTP_CLIENT, IMAGE_CACHE
+from goals.shared_cache import create_shared_cache
+from goals.single_flight import SingleFlight
+from goals.telemetry import Telemetry, configure_logging
+from goals.uploads import RetryPolicy, UploadQueue
 
 BASE_URI = "/goals"
 DOCUMENTATION_URI = BASE_URI + "/documentation/"
@@ -50,9 +66,16 @@ METHODS = [
 ]
 ORIGIN_REGEX = "(http)?(s)?(://)?(.*vercel.app|localhost|local)(:3000)?.*"
 NR_APP = register_application()
-COUNTER = {"count": 1}
+TELEMETRY = Telemetry(lambda metrics: record_custom_metrics(metrics, NR_APP),
+                      CONFIGURATION.telemetry_interval)
+FLIGHTS = {
+    "goals": SingleFlight(),
+    "progress": SingleFlight(),
+    "images": SingleFlight(),
+}
 
-logging.basicConfig(encoding="utf-8", level=CONFIGURATION.log_level.upper())
+configure_logging(CONFIGURATION.log_level, CONFIGURATION.log_max_length,
+                  CONFIGURATION.log_sample_rate)
 
 if CONFIGURATION.sentry.enabled:
     sentry_sdk.init(dsn=CONFIGURATION.sentry.dsn, traces_sample_rate=0.5)
@@ -66,142 +89,480 @@ app.add_middleware(
     allow_origin_regex=ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=METHODS,
-    allow_headers=['*']
+    allow_headers=['*'],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
+app.add_middleware(QueryProfileMiddleware,
+                   budget=CONFIGURATION.db.query_budget,
+                   strict=CONFIGURATION.db.strict_queries)
+app.add_middleware(PrometheusMiddleware)
 
 
-def get_db() -> Session:
-    """Create a session."""
+def new_session() -> AnySession:
+    """Create a session, async if the configured driver is."""
+    if IS_ASYNC:
+        return AsyncSession(autocommit=False, autoflush=False, bind=ENGINE)
     return Session(autocommit=False, autoflush=False, bind=ENGINE)
 
 
-ENGINE = create_engine(get_database_url(CONFIGURATION))
-if "TESTING" not in os.environ:
-    Base.metadata.create_all(bind=ENGINE)
-    logging.info("Initializing database...")
-    initialize_db(get_db())
+def pool_gauges():
+    """Return connection pool usage for monitoring."""
+    return {f"Custom/db-pool/{name}": value
+            for name, value in pool_statistics(ENGINE).items()}
+
+
+def single_flight_gauges():
+    """Return how many calls were started and joined for monitoring."""
+    gauges = {}
+    for name, flights in FLIGHTS.items():
+        gauges[f"Custom/single-flight/{name}/started"] = flights.started
+        gauges[f"Custom/single-flight/{name}/coalesced"] = flights.coalesced
+    return gauges
+
+
+async def get_db():
+    """Yield a session, its connection is released when the request ends."""
+    session = new_session()
+    start = time.perf_counter()
+    try:
+        yield session
+    finally:
+        await release(session)
+        TELEMETRY.timing("Custom/db-session/duration",
+                         time.perf_counter() - start)
+
+
+def etag(*parts) -> str:
+    """Build a weak ETag from the values a response depends on."""
+    return 'W/"' + "-".join(map(str, parts)) + '"'
+
+
+def is_not_modified(request: Request, tag: str) -> bool:
+    """Tell whether the client already has the response tagged tag."""
+    header = request.headers.get("If-None-Match")
+    if header is None:
+        return False
+    return header.strip() == "*" or \
+        tag in [value.strip() for value in header.split(",")]
+
+
+async def upload_goal_image(image: str, user_id: int, goal_id: int):
+    """Upload a goal image, changing the version of its owner."""
+    await upload_image(image, user_id, goal_id)
+    async with opened(new_session()) as session:
+        await record_user_change(session, user_id)
+
+
+ENGINE = create_database_engine(CONFIGURATION)
+IS_ASYNC = is_async_driver(CONFIGURATION)
+UPLOAD_QUEUE = UploadQueue(
+    upload_goal_image, CONFIGURATION.images.upload_concurrency,
+    RetryPolicy(CONFIGURATION.images.upload_retries,
+                CONFIGURATION.images.upload_retry_delay),
+    TTLCache(CONFIGURATION.images.upload_status_size,
+             CONFIGURATION.images.upload_status_ttl),
+    CONFIGURATION.images.upload_queue_size,
+)
+SHARED_CACHE = create_shared_cache(CONFIGURATION)
+
+instrument_engine(getattr(ENGINE, "sync_engine", ENGINE))
+REGISTRY.register(PoolCollector(ENGINE))
+REGISTRY.register(CacheCollector({
+    "credentials": CREDENTIALS_CACHE,
+    "images": IMAGE_CACHE,
+    "shared": SHARED_CACHE,
+}))
+REGISTRY.register(SingleFlightCollector(FLIGHTS))
+TELEMETRY.add_gauges(pool_gauges)
+TELEMETRY.add_gauges(single_flight_gauges)
+
+
+@app.on_event("startup")
+async def serve_metrics():
+    """Expose Prometheus metrics on their own port."""
+    start_metrics_server(CONFIGURATION.prometheus_port)
+
+
+@app.on_event("startup")
+async def start_http_client():
+    """Open the pooled client used for auth service calls."""
+    await HTTP_CLIENT.start()
+
+
+@app.on_event("startup")
+async def load_metrics_catalog():
+    """Load the metrics catalog, or leave it for the first request."""
+    try:
+        async with opened(new_session()) as session:
+            await run_in_session(session, METRICS_CATALOG.refresh)
+    except SQLAlchemyError as error:
+        logging.warning("Could not load metrics catalog: %r", error)
+
+
+async def flush_records():
+    """Write buffered metric records with a session of their own."""
+    async with opened(new_session()) as session:
+        await run_in_session(session, RECORD_BUFFER.flush)
+
+
+@app.on_event("startup")
+async def start_record_buffer():
+    """Flush buffered metric records in the background."""
+    await RECORD_BUFFER.start(flush_records)
+
+
+@app.on_event("shutdown")
+async def stop_record_buffer():
+    """Write buffered metric records before exiting."""
+    await RECORD_BUFFER.stop()
+
+
+@app.on_event("startup")
+async def start_upload_queue():
+    """Start the workers uploading goal images in the background."""
+    await UPLOAD_QUEUE.start()
+
+
+@app.on_event("shutdown")
+async def stop_upload_queue():
+    """Let queued image uploads finish."""
+    await UPLOAD_QUEUE.stop()
+
+
+@app.on_event("shutdown")
+async def close_shared_cache():
+    """Close connections to the shared cache."""
+    await SHARED_CACHE.close()
+
+
+@app.on_event("startup")
+async def start_telemetry():
+    """Send telemetry to New Relic in the background."""
+    await TELEMETRY.start()
+
+
+@app.on_event("shutdown")
+async def stop_telemetry():
+    """Send the telemetry left before exiting."""
+    await TELEMETRY.stop()
+
+
+@app.on_event("shutdown")
+async def stop_http_client():
+    """Close the pooled client used for auth service calls."""
+    await HTTP_CLIENT.stop()
+
+
+@app.exception_handler(BufferFull)
+async def buffer_full(_request: Request, error: BufferFull):
+    """Ask clients to retry progress updates once records are written."""
+    logging.warning("Rejecting progress update: %s", error)
+    return JSONResponse(status_code=503,
+                        content={"detail": "Too many progress updates"},
+                        headers={"Retry-After": "1"})
+
+
+async def check_metrics(session: AnySession, goals: list):
+    """Reject goals on metrics missing from the catalog."""
+    unknown = await unknown_metrics(session, [goal.metric for goal in goals])
+    if unknown:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown metrics: {', '.join(unknown)}")
 
 
 @app.post(BASE_URI + "/{user_id}")
 async def add_goal_for_user(request: Request,
                             goal: GoalBase, user_id: int,
-                            session: Session = Depends(get_db)):
+                            session: AnySession = Depends(get_db)):
     """Create a new goal for user_id."""
-    record_metric('Custom/goals-userId/post', COUNTER, NR_APP)
-    logging.info("Adding goal %s for user %s", goal.__dict__, user_id)
+    TELEMETRY.increment('Custom/goals-userId/post')
+    logging.info("Adding goal %s for user %s", goal.dict(exclude={"image"}),
+                 user_id)
+    creds = await get_credentials(request)
+    if creds["id"] != user_id:
+        logging.warning("User %s has invalid credentials %s", user_id, creds)
+        raise HTTPException(status_code=403, detail="Invalid credentials")
+    await check_metrics(session, [goal])
+    logging.info("Creating goals...")
+    goal_id = await create_goal(session=session, goal=goal, user_id=user_id)
+    if goal.image:
+        logging.info("Uploading goal image...")
+        await upload_image(goal.image, user_id, goal_id)
+        await record_user_change(session, user_id)
+    return goal_id
+
+
+@app.post(BASE_URI + "/{user_id}/bulk")
+async def add_goals_for_user(request: Request,
+                             batch: GoalBatch, user_id: int,
+                             session: AnySession = Depends(get_db)):
+    """Create several goals for user_id, images are uploaded afterwards."""
+    TELEMETRY.increment('Custom/goals-userId-bulk/post')
+    logging.info("Adding %s goals for user %s", len(batch.goals), user_id)
     creds = await get_credentials(request)
     if creds["id"] != user_id:
         logging.warning("User %s has invalid credentials %s", user_id, creds)
         raise HTTPException(status_code=403, detail="Invalid credentials")
-    with session as open_session:
-        logging.info("Creating goals...")
-        goal_id = create_goal(session=open_session, goal=goal, user_id=user_id)
+    await check_metrics(session, batch.goals)
+    uploads = sum(1 for goal in batch.goals if goal.image)
+    if not UPLOAD_QUEUE.reserve(uploads):
+        raise HTTPException(status_code=503, detail="Too many image uploads")
+    try:
+        goal_ids = await create_goals(session, batch.goals, user_id)
+    except BaseException:
+        UPLOAD_QUEUE.release(uploads)
+        raise
+    for goal, goal_id in zip(batch.goals, goal_ids):
         if goal.image:
-            logging.info("Uploading goal image...")
-            await upload_image(goal.image, user_id, goal_id)
-        return goal_id
+            await UPLOAD_QUEUE.put(goal.image, user_id, goal_id)
+    return goal_ids
+
+
+@app.get(BASE_URI + "/{user_id}/images/{goal_id}")
+async def get_image_upload_status(request: Request, user_id: int,
+                                  goal_id: int):
+    """Return the status of a background image upload."""
+    creds = await get_credentials(request)
+    if creds["id"] != user_id:
+        logging.warning("User %s has invalid credentials %s", user_id, creds)
+        raise HTTPException(status_code=403, detail="Invalid credentials")
+    status = UPLOAD_QUEUE.status(user_id, goal_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such upload")
+    return {"goal_id": goal_id, "status": status}
 
 
 @app.get(BASE_URI + "/metrics")
 async def get_metrics(request: Request,
-                      session: Session = Depends(get_db)):
+                      session: AnySession = Depends(get_db)):
     """Return all metrics in database."""
-    record_metric('Custom/goals-metrics/get', COUNTER, NR_APP)
+    TELEMETRY.increment('Custom/goals-metrics/get')
     logging.info("Returning all metrics...")
     creds = await get_credentials(request)
     if not creds["role"] == "admin" and not creds["role"] == "user":
         logging.warning("User is not authorized to get metrics: %s", creds)
         raise HTTPException(status_code=403, detail="Invalid credentials")
-    with session as open_session:
-        return get_all_metrics(open_session)
+    return await get_all_metrics(session)
 
 
 @app.get(BASE_URI + "/{user_id}/metricsProgress/{metric}")
 async def get_metrics_progress(request: Request,
                                user_id: int,
                                metric: str,
-                               session: Session = Depends(get_db),
+                               session: AnySession = Depends(get_db),
                                days: Optional[int] = 7,
                                ):
     """Create a new goal for user_id."""
-    record_metric(
-        'Custom/goals-userId-metricsProgress-metric/get', COUNTER, NR_APP
-    )
+    TELEMETRY.increment('Custom/goals-userId-metricsProgress-metric/get')
     logging.info("Requesting  %s progress for user %s", metric, user_id)
     creds = await get_credentials(request)
     if creds["id"] != user_id:
         logging.warning("User %s has invalid credentials %s", user_id, creds)
         raise HTTPException(status_code=403, detail="Invalid credentials")
-    with session as open_session:
-        breakdown = get_general_progress(session=open_session,
-                                         metric=metric,
-                                         user_id=user_id,
-                                         days=days)
-        if breakdown is None:
-            raise HTTPException(status_code=404,
-                                detail="No data found on that specific metric")
-        body = {
-            "progress": breakdown
-        }
-        return JSONResponse(content=body, status_code=200)
+    # Windows move with the date even if nothing changes
+    version = await get_user_version(session, user_id)
+    tag = etag(version, current_date().date())
+    if is_not_modified(request, tag):
+        return Response(status_code=304, headers={"ETag": tag})
+    key = f"progress:{user_id}:{version}:{current_date():%Y%m%d}:" \
+        f"{metric}:{days}"
+
+    async def compute():
+        # Joined callers outlive this request, so its session can't be used
+        async with opened(new_session_like(session)) as flight_session:
+            return await get_general_progress(session=flight_session,
+                                              metric=metric, user_id=user_id,
+                                              days=days)
+    breakdown = await FLIGHTS["progress"].run(
+        key, lambda: SHARED_CACHE.get_or_compute(key, compute),
+    )
+    if breakdown is None:
+        raise HTTPException(status_code=404,
+                            detail="No data found on that specific metric")
+    body = {
+        "progress": breakdown
+    }
+    return JSONResponse(content=body, status_code=200, headers={"ETag": tag})
+
+
+async def _add_goal_image(semaphore: asyncio.Semaphore, user_id: int,
+                          user_goal: dict) -> bool:
+    """Download the image of a goal, leaving the goal as is on failure.
+
+    Returns False if the image could not be fetched.
+    """
+    async with semaphore:
+        logging.debug("Downloading image for goal %s...", user_goal["id"])
+        try:
+            image = await asyncio.wait_for(
+                FLIGHTS["images"].run(
+                    (user_id, user_goal["id"]),
+                    lambda: download_image(user_id, user_goal["id"]),
+                ),
+                CONFIGURATION.images.timeout,
+            )
+        except (asyncio.TimeoutError, httpx.HTTPError, ValueError) as error:
+            logging.warning("Image for goal %s not available: %r",
+                            user_goal["id"], error)
+            return False
+    if image:
+        user_goal.update(image)
+    return True
+
+
+async def _add_goal_images(user_id: int, user_goals: list) -> bool:
+    """Download the images of a page of goals concurrently.
+
+    Returns False if any image could not be fetched.
+    """
+    logging.info("Downloading images for goals...")
+    semaphore = asyncio.Semaphore(CONFIGURATION.images.concurrency)
+    return all(await asyncio.gather(*[
+        _add_goal_image(semaphore, user_id, user_goal)
+        for user_goal in user_goals
+    ]))
+
+
+async def _stream_goals(session: AnySession, user_id: int,
+                        after: Optional[int], page_size: int):
+    """Yield goals as NDJSON lines, holding one page at a time."""
+    while True:
+        page = await get_user_goals(session, user_id, after, page_size)
+        await release(session)
+        await _add_goal_images(user_id, page)
+        for user_goal in page:
+            yield json.dumps(user_goal) + "\n"
+        if len(page) < page_size:
+            return
+        after = page[-1]["id"]
+
+
+class GoalsPage(NamedTuple):
+    """Goal listing parameters."""
+
+    after: Optional[int]
+    limit: int
+    stream: bool
+
+
+def goals_page(after: Optional[int] = None,
+               limit: Optional[int] = Query(None, ge=1,
+                                            le=CONFIGURATION.max_page_size),
+               stream: bool = False) -> GoalsPage:
+    """Read listing parameters, limit defaults to the configured page size."""
+    return GoalsPage(after, limit or CONFIGURATION.page_size, stream)
 
 
 @app.get(BASE_URI + "/{user_id}")
-async def get_goals(request: Request, user_id: int,
-                    session: Session = Depends(get_db)):
-    """Return all goals in database."""
-    record_metric('Custom/goals-userId/get', COUNTER, NR_APP)
+async def get_goals(request: Request, response: Response, user_id: int,
+                    session: AnySession = Depends(get_db),
+                    page: GoalsPage = Depends(goals_page)):
+    """Return a page of goals, with id after the given cursor.
+
+    X-Next-Cursor holds the cursor of the next page, if there is one. The
+    ETag is the version of the user goals, If-None-Match with it gets a
+    304 without reading goals or images. Only responses with every image
+    get it, others must not be stored.
+    Streamed responses go through every page as NDJSON, limit being the
+    number of goals read at once. Images are fetched after headers are
+    sent, so they are never tagged.
+    """
+    TELEMETRY.increment('Custom/goals-userId/get')
     logging.info("Returning all goals...")
     creds = await get_credentials(request)
     if creds["id"] != user_id:
         logging.warning("User %s has invalid credentials %s", user_id, creds)
         raise HTTPException(status_code=403, detail="Invalid credentials")
-    with session as open_session:
-        user_goals = get_user_goals(session=open_session, user_id=user_id)
-        logging.info("Downloading images for goals...")
-        for _idx, user_goal in enumerate(user_goals):
-            logging.debug("Downloading image for goal %s...", user_goal["id"])
-            image = await download_image(user_id, user_goal["id"])
-            if image:
-                user_goal.update(image)
-        return user_goals
+    # Read before the goals, so a concurrent change can't get this tag
+    version = await get_user_version(session, user_id)
+    tag = etag(version)
+    if is_not_modified(request, tag):
+        return Response(status_code=304, headers={"ETag": tag})
+    after, limit = page.after, page.limit
+    if page.stream:
+        return StreamingResponse(_stream_goals(session, user_id, after, limit),
+                                 media_type="application/x-ndjson",
+                                 headers={"Cache-Control": "no-store"})
+    key = f"goals:{user_id}:{version}:{after}:{limit}"
+
+    async def compute():
+        # Joined callers outlive this request, so its session can't be used
+        async with opened(new_session_like(session)) as flight_session:
+            return await get_user_goals(flight_session, user_id, after,
+                                        limit + 1)
+    user_goals = await FLIGHTS["goals"].run(
+        key, lambda: SHARED_CACHE.get_or_compute(key, compute),
+    )
+    await release(session)
+    if len(user_goals) > limit:
+        user_goals = user_goals[:limit]
+        response.headers["X-Next-Cursor"] = str(user_goals[-1]["id"])
+    if await _add_goal_images(user_id, user_goals):
+        response.headers["ETag"] = tag
+    else:
+        response.headers["Cache-Control"] = "no-store"
+    return user_goals
 
 
 @app.delete(BASE_URI + "/{goal_id}")
 async def delete_user_goal(request: Request,
-                           goal_id: int, session: Session = Depends(get_db)):
+                           goal_id: int,
+                           session: AnySession = Depends(get_db)):
     """Delete goal with goal_id."""
-    record_metric('Custom/goals-goalId/delete', COUNTER, NR_APP)
+    TELEMETRY.increment('Custom/goals-goalId/delete')
     logging.info("Deleting goal %s...", goal_id)
     creds = await get_credentials(request)
-    if get_goal(session, goal_id) is None:
+    goal = await get_goal(session, goal_id)
+    if goal is None:
         raise HTTPException(status_code=404, detail="No such goal")
-    if correct_user_id(session, goal_id, creds["id"]) is False:
+    if goal.user_id != creds["id"]:
         logging.warning("User has invalid credentials %s", creds)
         raise HTTPException(status_code=403, detail="Invalid credentials")
-    with session as open_session:
-        delete_goal(session=open_session, goal_id=goal_id)
+    await delete_goal(session=session, goal_id=goal_id)
+    await forget_image(creds["id"], goal_id)
 
 
 @app.patch(BASE_URI + "/{goal_id}")
 async def _update_goal(request: Request, goal_update: GoalUpdate,
-                       goal_id: int, session: Session = Depends(get_db)):
+                       goal_id: int,
+                       session: AnySession = Depends(get_db)):
     """Update goal with goal_id."""
-    record_metric('Custom/goals-goalId/patch', COUNTER, NR_APP)
-    logging.info("Updating goal %s with %s...", goal_id, goal_update.__dict__)
+    TELEMETRY.increment('Custom/goals-goalId/patch')
+    logging.info("Updating goal %s with %s...", goal_id,
+                 goal_update.dict(exclude_none=True))
     creds = await get_credentials(request)
-    if get_goal(session, goal_id) is None:
-        raise HTTPException(status_code=404, detail="No such goal")
-    if correct_user_id(session, goal_id, creds["id"]) is False:
+    if not await update_user_goal(session, goal_id, creds["id"], goal_update):
+        if await get_goal(session, goal_id) is None:
+            raise HTTPException(status_code=404, detail="No such goal")
         logging.warning("User has invalid credentials %s", creds)
         raise HTTPException(status_code=403, detail="Invalid credentials")
-    with session as open_session:
-        progress_delta = update_goal(open_session, goal_id, goal_update)
-        if goal_update.progress is not None:
-            new_metric_record(open_session, goal_id, progress_delta)
     return JSONResponse(content={}, status_code=200)
 
 
+@app.patch(BASE_URI + "/{user_id}/progress")
+async def update_progress_batch(request: Request, user_id: int,
+                                batch: ProgressBatch,
+                                session: AnySession = Depends(get_db)):
+    """Update progress of several goals of user_id at once."""
+    TELEMETRY.increment('Custom/goals-userId-progress/patch')
+    logging.info("Updating progress of %s goals for user %s",
+                 len(batch.updates), user_id)
+    creds = await get_credentials(request)
+    if creds["id"] != user_id:
+        logging.warning("User %s has invalid credentials %s", user_id, creds)
+        raise HTTPException(status_code=403, detail="Invalid credentials")
+    owners = await update_goals_progress(session, user_id, batch.updates)
+    results = []
+    for item in batch.updates:
+        status = 200
+        if item.goal_id not in owners:
+            status = 404
+        elif owners[item.goal_id] != user_id:
+            status = 403
+        results.append({"goal_id": item.goal_id, "status": status})
+    return JSONResponse(content={"results": results}, status_code=200)
+
+
 @app.get(BASE_URI + "/healthcheck/")
 async def health_check() -> HealthCheckDto:
     """Check for how long has the service been running."""
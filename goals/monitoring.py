@@ -0,0 +1,306 @@
+"""Prometheus metrics, served on the configured prometheus_port."""
+import logging
+import time
+from collections import Counter as Tally
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from goals.database.pool import pool_statistics
+
+REQUEST_LATENCY = Histogram(
+    "goals_request_duration_seconds", "Time to answer a request.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "goals_requests_in_flight", "Requests being answered.",
+    ["method", "route"],
+)
+AUTH_LATENCY = Histogram(
+    "goals_auth_request_duration_seconds",
+    "Time taken by calls to the auth service.", ["operation"],
+)
+AUTH_ERRORS = Counter(
+    "goals_auth_request_errors_total",
+    "Auth service calls failing or answering with a server error.",
+    ["operation", "reason"],
+)
+QUERY_DURATION = Histogram(
+    "goals_db_query_duration_seconds", "Time taken by database statements.",
+)
+REQUEST_QUERIES = Histogram(
+    "goals_request_db_queries", "Database statements run by a request.",
+    ["route"], buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+REQUEST_DB_TIME = Histogram(
+    "goals_request_db_duration_seconds",
+    "Time a request spent running database statements.", ["route"],
+)
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope: Scope) -> str:
+    """Return the path template of the route handling a request."""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class QueryProfile:
+    """Statements run while answering one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.transactions = 0
+        self.statements: Tally = Tally()
+
+    def record(self, statement: str, parameters, duration: float) -> None:
+        """Add a statement that took duration seconds."""
+        self.count += 1
+        self.duration += duration
+        self.statements[
+            (self.transactions, statement, repr(parameters))
+        ] += 1
+
+    def end_transaction(self) -> None:
+        """Start over repetition checks, later statements see new data."""
+        self.transactions += 1
+
+    def repeated(self) -> List[str]:
+        """Return statements run again in a transaction, same parameters."""
+        return [statement for (_, statement, _), times
+                in self.statements.items() if times > 1]
+
+    def server_timing(self) -> str:
+        """Return the totals as a Server-Timing header value."""
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+CURRENT_QUERIES: ContextVar[Optional[QueryProfile]] = \
+    ContextVar("current_queries", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Request repeated a statement or ran more than the query budget."""
+
+
+class PrometheusMiddleware:
+    """Measure latency and concurrency of requests per route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, route = scope["method"], route_template(scope)
+        status = {"code": 500}
+
+        async def send_with_status(message: Message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route, status["code"]).observe(
+                time.perf_counter() - start
+            )
+
+
+class QueryProfileMiddleware:
+    """Count the statements of each request, in a Server-Timing header.
+
+    Requests repeating a statement with the same parameters in a
+    transaction, or running more than budget statements, are logged. In
+    strict mode they raise QueryBudgetExceeded instead, failing tests.
+    """
+
+    def __init__(self, app: ASGIApp, budget: int, strict: bool = False):
+        self.app = app
+        self.budget = budget
+        self.strict = strict
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = QueryProfile()
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", profile.server_timing()
+                )
+            await send(message)
+        token = CURRENT_QUERIES.set(profile)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            CURRENT_QUERIES.reset(token)
+        route = route_template(scope)
+        REQUEST_QUERIES.labels(route).observe(profile.count)
+        REQUEST_DB_TIME.labels(route).observe(profile.duration)
+        self.check(f"{scope['method']} {route}", profile)
+
+    def check(self, request: str, profile: QueryProfile) -> None:
+        """Report a request that went over the budget or repeated itself."""
+        problems = [f"repeated {statement!r}"
+                    for statement in profile.repeated()]
+        if profile.count > self.budget:
+            problems.append(f"ran {profile.count} statements, "
+                            f"budget is {self.budget}")
+        if not problems:
+            return
+        message = f"{request} " + "; ".join(problems)
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logging.warning("Query budget: %s", message)
+
+
+async def observe_auth_call(operation: str,
+                            call: Awaitable[httpx.Response]) -> httpx.Response:
+    """Await a call to the auth service, measuring it."""
+    start = time.perf_counter()
+    try:
+        response = await call
+    except httpx.HTTPError as error:
+        AUTH_ERRORS.labels(operation, type(error).__name__).inc()
+        raise
+    finally:
+        AUTH_LATENCY.labels(operation).observe(time.perf_counter() - start)
+    if response.status_code >= 500:
+        AUTH_ERRORS.labels(operation, str(response.status_code)).inc()
+    return response
+
+
+def _observe_query(statement: str, parameters, duration: float) -> None:
+    QUERY_DURATION.observe(duration)
+    profile = CURRENT_QUERIES.get()
+    if profile is not None:
+        profile.record(statement, parameters, duration)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Measure every statement run by engine, also for the current request."""
+    # Parameters are kept from before the execution: batches of a bulk
+    # insert all get the whole parameter list afterwards
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, _cursor, _statement, parameters, *_args):
+        conn.info.setdefault("query_start", []).append(
+            (time.perf_counter(), parameters)
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, _cursor, statement, *_args):
+        start, parameters = conn.info["query_start"].pop()
+        _observe_query(statement, parameters, time.perf_counter() - start)
+
+    @event.listens_for(engine, "commit")
+    @event.listens_for(engine, "rollback")
+    def end_transaction(_conn):
+        profile = CURRENT_QUERIES.get()
+        if profile is not None:
+            profile.end_transaction()
+
+    @event.listens_for(engine, "handle_error")
+    def failed_query(context):
+        starts = context.connection.info.get("query_start") \
+            if context.connection is not None else None
+        if starts:
+            start, parameters = starts.pop()
+            _observe_query(context.statement, parameters,
+                           time.perf_counter() - start)
+
+
+class PoolCollector:
+    """Connection pool usage, read when metrics are scraped."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        """Yield the pool metrics."""
+        statistics = pool_statistics(self.engine)
+        connections = GaugeMetricFamily(
+            "goals_db_pool_connections", "Connections by state.",
+            labels=["state"],
+        )
+        for state in ("size", "checked_out", "overflow"):
+            connections.add_metric([state], statistics[state])
+        yield connections
+        if "wait_count" in statistics:
+            yield CounterMetricFamily(
+                "goals_db_pool_waits", "Connection checkouts.",
+                value=statistics["wait_count"],
+            )
+            yield CounterMetricFamily(
+                "goals_db_pool_wait_seconds", "Time waiting for connections.",
+                value=statistics["wait_total"],
+            )
+            yield GaugeMetricFamily(
+                "goals_db_pool_wait_max_seconds",
+                "Longest wait for a connection.", value=statistics["wait_max"],
+            )
+
+
+class CacheCollector:
+    """Hits and misses of caches with hits and misses attributes."""
+
+    def __init__(self, caches: Dict[str, object]):
+        self.caches = caches
+
+    def collect(self):
+        """Yield the lookup counters of every cache."""
+        lookups = CounterMetricFamily(
+            "goals_cache_lookups", "Cache lookups by result.",
+            labels=["cache", "result"],
+        )
+        for name, cache in self.caches.items():
+            lookups.add_metric([name, "hit"], cache.hits)
+            lookups.add_metric([name, "miss"], cache.misses)
+        yield lookups
+
+
+class SingleFlightCollector:
+    """Calls started and coalesced by single-flight groups."""
+
+    def __init__(self, flights: Dict[str, object]):
+        self.flights = flights
+
+    def collect(self):
+        """Yield the call counters of every group."""
+        calls = CounterMetricFamily(
+            "goals_single_flight_calls", "Calls by outcome.",
+            labels=["name", "outcome"],
+        )
+        for name, flights in self.flights.items():
+            calls.add_metric([name, "started"], flights.started)
+            calls.add_metric([name, "coalesced"], flights.coalesced)
+        yield calls
+
+
+def start_metrics_server(port: int,
+                         start: Callable[[int], object] = start_http_server):
+    """Serve metrics on port, logging instead of failing if it's taken."""
+    try:
+        start(port)
+    except OSError as error:
+        logging.warning("Could not serve metrics on port %s: %s",
+                        port, error)
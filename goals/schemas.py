@@ -1,8 +1,11 @@
 # pylint: disable=no-name-in-module
 """Defines models for data exchange in API and between modules."""
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+MAX_PROGRESS_BATCH = 500
+MAX_GOALS_BATCH = 100
 
 
 class GoalBase(BaseModel):
@@ -16,6 +19,12 @@ class GoalBase(BaseModel):
     image: Optional[str]
 
 
+class GoalBatch(BaseModel):
+    """Bulk goal creation DTO."""
+
+    goals: List[GoalBase] = Field(min_items=1, max_items=MAX_GOALS_BATCH)
+
+
 class GoalUpdate(BaseModel):
     """Goal details DTO."""
 
@@ -26,6 +35,20 @@ class GoalUpdate(BaseModel):
     progress: Optional[int]
 
 
+class GoalProgress(BaseModel):
+    """Progress of one goal in a batch update."""
+
+    goal_id: int
+    progress: int
+
+
+class ProgressBatch(BaseModel):
+    """Batch progress update DTO."""
+
+    updates: List[GoalProgress] = Field(min_items=1,
+                                        max_items=MAX_PROGRESS_BATCH)
+
+
 class Goal(GoalBase):
     """Goal DTO for database."""
 
@@ -0,0 +1,223 @@
+"""Cache of assembled responses, shared by every replica with Redis.
+
+Keys include the user version, which every write bumps, so entries of
+changed users are never read again and simply expire. Misses take a
+short lock in the backend, other callers wait for the value instead of
+querying the database at the same time.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from goals.cache import TTLCache
+from goals.config import AppConfig
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+class NullBackend:  # pylint: disable=unused-argument
+    """Backend that stores nothing, every lookup misses."""
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the value stored for key."""
+        return None
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        """Store value for key during ttl seconds."""
+
+    async def add(self, key: str, value: str, ttl: float) -> bool:
+        """Store value only if key is missing, tell whether it was stored."""
+        return True
+
+    async def delete(self, key: str) -> None:
+        """Remove key."""
+
+    async def close(self) -> None:
+        """Release backend resources."""
+
+
+class MemoryBackend(NullBackend):
+    """Backend in process memory, only consistent with a single replica."""
+
+    def __init__(self, max_size: int):
+        self._entries = TTLCache(max_size, float("inf"))
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._entries.set(key, value, ttl)
+
+    async def add(self, key: str, value: str, ttl: float) -> bool:
+        if self._entries.get(key) is not None:
+            return False
+        self._entries.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._entries.delete(key)
+
+
+class RedisError(Exception):
+    """Error reply from a Redis server."""
+
+
+def encode_command(*args) -> bytes:
+    """Encode a command in the Redis serialization protocol."""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Read one reply in the Redis serialization protocol."""
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by Redis")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise RedisError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        if int(payload) < 0:
+            return None
+        data = await reader.readexactly(int(payload) + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        return [await read_reply(reader) for _ in range(int(payload))]
+    raise RedisError(f"Unknown reply {line!r}")
+
+
+class RedisBackend(NullBackend):
+    """Backend speaking the Redis protocol, over a pool of connections.
+
+    Errors are logged and treated as misses, the cache never fails a
+    request.
+    """
+
+    def __init__(self, host: str, port: int, database: int = 0,
+                 pool_size: int = 10, timeout: float = 0.5):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: List[Tuple[asyncio.StreamReader,
+                               asyncio.StreamWriter]] = []
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.database:
+            writer.write(encode_command("SELECT", self.database))
+            await read_reply(reader)
+        return reader, writer
+
+    async def _send(self, *args) -> Any:
+        reader, writer = self._idle.pop() if self._idle \
+            else await self._connect()
+        try:
+            writer.write(encode_command(*args))
+            await writer.drain()
+            reply = await read_reply(reader)
+        except BaseException:
+            writer.close()
+            raise
+        if len(self._idle) < self.pool_size:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return reply
+
+    async def command(self, *args, default: Any = None) -> Any:
+        """Run a command, returning default if Redis can't answer."""
+        try:
+            return await asyncio.wait_for(self._send(*args), self.timeout)
+        except (OSError, asyncio.TimeoutError, RedisError) as error:
+            logging.warning("Redis %s failed: %r", args[0], error)
+            return default
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self.command("SET", key, value, "PX", int(ttl * 1000))
+
+    async def add(self, key: str, value: str, ttl: float) -> bool:
+        stored = await self.command("SET", key, value, "NX", "PX",
+                                    int(ttl * 1000), default="OK")
+        return stored == "OK"
+
+    async def delete(self, key: str) -> None:
+        await self.command("DEL", key)
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class SharedCache:
+    """JSON values kept in a backend for ttl seconds."""
+
+    def __init__(self, backend: NullBackend, ttl: float, lock_ttl: float,
+                 lock_wait: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key: str,
+                             compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, computing it once on misses.
+
+        Callers that find the key locked wait up to lock_wait seconds for
+        the value, then compute it themselves.
+        """
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return json.loads(value)
+        self.misses += 1
+        lock = key + ":lock"
+        if await self.backend.add(lock, "1", self.lock_ttl):
+            try:
+                result = await compute()
+                await self.backend.set(key, json.dumps(result), self.ttl)
+                return result
+            finally:
+                await self.backend.delete(lock)
+        for _ in range(int(self.lock_wait / LOCK_POLL_INTERVAL)):
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            value = await self.backend.get(key)
+            if value is not None:
+                return json.loads(value)
+        return await compute()
+
+    async def close(self) -> None:
+        """Release backend resources."""
+        await self.backend.close()
+
+
+def create_shared_cache(config: AppConfig) -> SharedCache:
+    """Create the cache for the configured backend."""
+    backends = {
+        "none": NullBackend,
+        "memory": lambda: MemoryBackend(config.cache.max_size),
+        "redis": lambda: RedisBackend(
+            config.cache.redis_host, config.cache.redis_port,
+            config.cache.redis_db, config.cache.redis_pool_size,
+            config.cache.redis_timeout,
+        ),
+    }
+    if config.cache.backend not in backends:
+        raise ValueError(f"Unknown cache backend {config.cache.backend}")
+    return SharedCache(backends[config.cache.backend](), config.cache.ttl,
+                       config.cache.lock_ttl, config.cache.lock_wait)
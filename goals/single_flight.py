@@ -0,0 +1,38 @@
+"""Coalescing of identical concurrent calls."""
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution.
+
+    Callers joining a call in flight get a deep copy of its result, so
+    each of them can change it freely. The call goes on if the caller
+    that started it is cancelled.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    def _land(self, key: Hashable, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key: Hashable,
+                  function: Callable[[], Awaitable[Any]]) -> Any:
+        """Return function(), or the result of the call in flight for key."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return copy.deepcopy(await asyncio.shield(flight))
+        self.started += 1
+        flight = asyncio.ensure_future(function())
+        self._flights[key] = flight
+        flight.add_done_callback(lambda _: self._land(key, flight))
+        return await asyncio.shield(flight)
+
+    def __len__(self) -> int:
+        return len(self._flights)
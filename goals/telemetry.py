@@ -0,0 +1,135 @@
+"""Telemetry that stays off the request path.
+
+Handlers count events and time operations in memory, a background task
+sends the aggregates to New Relic every telemetry_interval seconds. Logs
+go through a queue to a thread that writes them, with long messages
+truncated and debug and info records sampled.
+"""
+import asyncio
+import atexit
+import copy
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Metrics = Iterable[Tuple[str, object]]
+
+
+class Telemetry:
+    """Counters, timings and gauges aggregated between flushes."""
+
+    def __init__(self, send: Callable[[Metrics], None], interval: float):
+        self.send = send
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._gauges: List[Callable[[], Dict[str, float]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add value to the counter name."""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def timing(self, name: str, seconds: float) -> None:
+        """Add a duration to the timing name."""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                self._timings[name] = {
+                    "count": 1, "total": seconds, "min": seconds,
+                    "max": seconds, "sum_of_squares": seconds ** 2,
+                }
+                return
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["min"] = min(timing["min"], seconds)
+            timing["max"] = max(timing["max"], seconds)
+            timing["sum_of_squares"] += seconds ** 2
+
+    def add_gauges(self, read: Callable[[], Dict[str, float]]) -> None:
+        """Send the values returned by read on every flush."""
+        self._gauges.append(read)
+
+    def flush(self) -> int:
+        """Send and reset the aggregates, return how many were sent."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            timings, self._timings = self._timings, {}
+        metrics: List[Tuple[str, object]] = [
+            (name, {"count": count}) for name, count in counts.items()
+        ]
+        metrics.extend(timings.items())
+        for read in self._gauges:
+            metrics.extend(read().items())
+        if metrics:
+            self.send(metrics)
+        return len(metrics)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.flush)
+
+    async def start(self) -> None:
+        """Flush in the background every interval seconds."""
+        await self.stop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop flushing in the background and send what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """Queue records for another thread, shortened and sampled.
+
+    Messages longer than max_length are cut. Records below WARNING are
+    kept with probability sample_rate.
+    """
+
+    def __init__(self, records: queue.SimpleQueue, max_length: int,
+                 sample_rate: float = 1.0,
+                 sample: Callable[[], float] = random.random):
+        super().__init__(records)
+        self.max_length = max_length
+        self.sample_rate = sample_rate
+        self.sample = sample
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and \
+                self.sample() >= self.sample_rate:
+            return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if len(message) > self.max_length:
+            record = copy.copy(record)
+            record.msg = message[:self.max_length] + \
+                f"... ({len(message) - self.max_length} characters more)"
+            record.args = None
+        return super().prepare(record)
+
+
+def configure_logging(level: str, max_length: int,
+                      sample_rate: float) -> QueueListener:
+    """Send root logger records through a queue to a writing thread."""
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    listener = QueueListener(records, output)
+    listener.start()
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    root.addHandler(TruncatingQueueHandler(records, max_length, sample_rate))
+    root.setLevel(level.upper())
+    return listener
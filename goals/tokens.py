@@ -0,0 +1,92 @@
+"""Local verification of tokens signed by the auth service."""
+import logging
+import time
+from typing import Callable, Dict, List
+
+import httpx
+import jwt
+
+from goals.monitoring import observe_auth_call
+from goals.single_flight import SingleFlight
+
+
+class KeysUnavailable(Exception):
+    """Token can't be checked locally, the auth service has to do it."""
+
+
+class SigningKeys:
+    """Public key set published by the auth service.
+
+    Keys are fetched on first use and refreshed every refresh_interval
+    seconds, or earlier when a token refers to an unknown key id.
+    Concurrent callers needing a refresh share one download.
+    """
+
+    def __init__(self, url: str, refresh_interval: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at = float("-inf")
+        self._refreshes = SingleFlight()
+
+    def _is_stale(self) -> bool:
+        return self._clock() - self._fetched_at >= self.refresh_interval
+
+    async def refresh(self, client: httpx.AsyncClient) -> None:
+        """Download the key set."""
+        try:
+            res = await observe_auth_call("signing_keys",
+                                          client.get(self.url))
+            res.raise_for_status()
+            key_set = jwt.PyJWKSet.from_dict(res.json())
+        except (httpx.HTTPError, ValueError, jwt.PyJWTError) as error:
+            raise KeysUnavailable(str(error)) from error
+        self._keys = {key.key_id: key for key in key_set.keys}
+        self._fetched_at = self._clock()
+
+    async def get(self, client: httpx.AsyncClient, key_id: str) -> jwt.PyJWK:
+        """Return the key with key_id, refreshing the set if needed."""
+        # Unknown ids trigger at most one download per second
+        unknown = key_id not in self._keys and \
+            self._clock() - self._fetched_at >= 1
+        if self._is_stale() or unknown:
+            try:
+                await self._refreshes.run("keys",
+                                          lambda: self.refresh(client))
+            except KeysUnavailable:
+                if key_id not in self._keys:
+                    raise
+                logging.warning("Could not refresh keys, using cached ones")
+        if key_id not in self._keys:
+            raise KeysUnavailable(f"Unknown key id {key_id}")
+        return self._keys[key_id]
+
+
+def get_bearer_token(auth_header: str) -> str:
+    """Remove the Bearer prefix, if any, from an Authorization header."""
+    scheme, _, token = auth_header.partition(" ")
+    if token and scheme.lower() == "bearer":
+        return token.strip()
+    return auth_header.strip()
+
+
+async def verify_token(token: str, keys: SigningKeys,
+                       client: httpx.AsyncClient, algorithms: List[str]):
+    """Return the id and role claims of a token after checking it.
+
+    Raises jwt.InvalidTokenError for bad or expired tokens and
+    KeysUnavailable when the token can't be checked locally.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.DecodeError as error:
+        raise jwt.InvalidTokenError("Token format error") from error
+    if "kid" not in header:
+        raise KeysUnavailable("Token has no key id")
+    key = await keys.get(client, header["kid"])
+    claims = jwt.decode(token, key=key.key, algorithms=algorithms,
+                        options={"require": ["id", "role"]})
+    logging.debug("Token for user %s verified locally", claims["id"])
+    return {"id": claims["id"], "role": claims["role"]}
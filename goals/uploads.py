@@ -0,0 +1,118 @@
+"""Background queue for goal image uploads."""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from goals.cache import TTLCache
+
+PENDING = "pending"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+
+
+class RetryPolicy(NamedTuple):
+    """How many times to retry an upload, and the first wait in seconds."""
+
+    retries: int
+    delay: float
+
+
+class UploadQueue:
+    """Uploads images in the background with a fixed number of workers.
+
+    Network errors and server errors are retried up to retry.retries
+    times, waiting retry.delay * 2 ** attempt seconds in between. The status of
+    each upload is kept per goal in the status cache. At most capacity
+    uploads wait at once: callers reserve room before creating the goals,
+    so put never fails once they exist.
+    """
+
+    def __init__(self, upload: Callable[[str, int, int], Awaitable],
+                 workers: int, retry: RetryPolicy, status: TTLCache,
+                 capacity: int = 1000):
+        self.workers = workers
+        self.retry = retry
+        # Uploads that can still be reserved
+        self._free = capacity
+        self._upload = upload
+        self._status = status
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the workers, in the running event loop."""
+        await self.stop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work())
+                       for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Wait for queued uploads to finish, then stop the workers."""
+        if self._queue is not None:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+    def reserve(self, uploads: int) -> bool:
+        """Take room for uploads, return False if there isn't enough."""
+        if uploads > self._free:
+            return False
+        self._free -= uploads
+        return True
+
+    def release(self, uploads: int) -> None:
+        """Give back room reserved for uploads that won't be queued."""
+        self._free += uploads
+
+    async def put(self, image: str, user_id: int, goal_id: int) -> None:
+        """Queue an upload room was reserved for, starting the workers."""
+        if self._queue is None:
+            await self.start()
+        self._queue.put_nowait((image, user_id, goal_id))
+        self._status.set((user_id, goal_id), PENDING)
+
+    def status(self, user_id: int, goal_id: int) -> Optional[str]:
+        """Return the upload status of a goal image, None if unknown."""
+        return self._status.get((user_id, goal_id))
+
+    async def _work(self) -> None:
+        while True:
+            image, user_id, goal_id = await self._queue.get()
+            self.release(1)
+            try:
+                await self._upload_with_retries(image, user_id, goal_id)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Keep the worker alive whatever the upload raised
+                logging.exception("Image upload for goal %s failed", goal_id)
+                self._status.set((user_id, goal_id), FAILED)
+            finally:
+                self._queue.task_done()
+
+    async def _upload_with_retries(self, image: str, user_id: int,
+                                   goal_id: int) -> None:
+        key = (user_id, goal_id)
+        for attempt in range(self.retry.retries + 1):
+            self._status.set(key, UPLOADING)
+            try:
+                await self._upload(image, user_id, goal_id)
+            except HTTPException as error:
+                logging.warning("Image upload for goal %s failed: %s",
+                                goal_id, error.detail)
+                if error.status_code < 500:
+                    break
+            except httpx.HTTPError as error:
+                logging.warning("Image upload for goal %s failed: %r",
+                                goal_id, error)
+            else:
+                self._status.set(key, DONE)
+                return
+            if attempt < self.retry.retries:
+                await asyncio.sleep(self.retry.delay * 2 ** attempt)
+        self._status.set(key, FAILED)
@@ -1,13 +1,31 @@
 """Utility methods."""
+import logging
+from hashlib import sha256
 
-import httpx
+import jwt
 from environ import to_config
 
 from fastapi import Request, HTTPException
 
+from goals.cache import ImageCache, TTLCache
 from goals.config import AppConfig
+from goals.http_client import HttpClient
+from goals.monitoring import observe_auth_call
+from goals.tokens import KeysUnavailable, SigningKeys, get_bearer_token, \
+    verify_token
 
 CONFIGURATION = to_config(AppConfig)
+HTTP_CLIENT = HttpClient(CONFIGURATION)
+CREDENTIALS_CACHE = TTLCache(CONFIGURATION.auth.credentials_cache_size,
+                             CONFIGURATION.auth.credentials_cache_ttl)
+IMAGE_CACHE = ImageCache(CONFIGURATION.images.cache_size,
+                         CONFIGURATION.images.cache_max_age,
+                         CONFIGURATION.images.disk_cache_path,
+                         CONFIGURATION.images.disk_cache_max_bytes)
+SIGNING_KEYS = SigningKeys(
+    f"http://{CONFIGURATION.auth.host}{CONFIGURATION.auth.keys_path}",
+    CONFIGURATION.auth.keys_refresh_interval,
+)
 
 
 def get_auth_header(request):
@@ -18,22 +36,47 @@ def get_auth_header(request):
     return {"Authorization": auth_header}
 
 
+async def verify_locally(auth_header: str):
+    """Check the token signature here, None if it can't be done locally."""
+    try:
+        return await verify_token(get_bearer_token(auth_header),
+                                  SIGNING_KEYS, HTTP_CLIENT.get(),
+                                  CONFIGURATION.auth.algorithms.split(","))
+    except KeysUnavailable as error:
+        logging.info("Falling back to auth service: %s", error)
+        return None
+    except jwt.InvalidTokenError as error:
+        raise HTTPException(status_code=403, detail=str(error)) from error
+
+
 async def get_credentials(request: Request):
     """Make a request to auth service for credentials encoded in token."""
     url = f"http://{CONFIGURATION.auth.host}/auth/credentials"
     auth_header = get_auth_header(request)
     if auth_header is None:
         raise HTTPException(status_code=403, detail="No token")
-    creds = await httpx.AsyncClient().get(url, headers=auth_header)
+    if CONFIGURATION.auth.verification == "local":
+        creds = await verify_locally(auth_header["Authorization"])
+        if creds is not None:
+            return creds
+    key = sha256(auth_header["Authorization"].encode()).hexdigest()
+    cached = CREDENTIALS_CACHE.get(key)
+    if cached is not None:
+        return cached
+    creds = await observe_auth_call(
+        "credentials", HTTP_CLIENT.get().get(url, headers=auth_header)
+    )
     if creds.status_code != 200:
         raise HTTPException(status_code=creds.status_code,
                             detail=creds.json()["Message"])
     try:
-        return creds.json()['data']
+        data = creds.json()['data']
     except Exception as json_exception:
         msg = "Token format error"
         raise HTTPException(status_code=403,
                             detail=msg) from json_exception
+    CREDENTIALS_CACHE.set(key, data)
+    return data
 
 
 def get_name(user_id, goal_id):
@@ -48,17 +91,44 @@ async def upload_image(image: str, user_id: int, goal_id: int):
     body = {
         "image": image
     }
-    res = await httpx.AsyncClient().post(url, json=body)
+    res = await observe_auth_call("upload_image",
+                                  HTTP_CLIENT.get().post(url, json=body))
+    await IMAGE_CACHE.delete(filename)
     if res.status_code != 200:
         raise HTTPException(status_code=res.status_code,
                             detail=res.json()["Message"])
 
 
+async def forget_image(user_id: int, goal_id: int):
+    """Drop a goal image from the cache, for deleted goals."""
+    await IMAGE_CACHE.delete(get_name(user_id, goal_id))
+
+
 async def download_image(user_id: int, goal_id: int):
-    """Download image from auth service."""
+    """Download image from auth service, or use the cached copy."""
     filename = get_name(user_id, goal_id)
+    cached = await IMAGE_CACHE.get(filename)
+    if cached is not None and IMAGE_CACHE.is_fresh(cached):
+        return cached.image
+    headers = {}
+    if cached is not None and cached.etag is not None:
+        headers["If-None-Match"] = cached.etag
     url = f"http://{CONFIGURATION.auth.host}/auth/storage/" + filename
-    res = await httpx.AsyncClient().get(url)
+    generation = IMAGE_CACHE.generation
+    res = await observe_auth_call("download_image",
+                                  HTTP_CLIENT.get().get(url, headers=headers))
+    if res.status_code == 304 and cached is not None:
+        await IMAGE_CACHE.revalidate(filename, cached, generation)
+        return cached.image
+    if res.status_code == 404:
+        await IMAGE_CACHE.set_missing(
+            filename, CONFIGURATION.images.missing_max_age, generation
+        )
+        return None
     if res.status_code != 200:
+        await IMAGE_CACHE.delete(filename)
         return None
-    return res.json()
+    image = res.json()
+    await IMAGE_CACHE.set(filename, image, res.headers.get("ETag"),
+                          generation)
+    return image
@@ -0,0 +1,133 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= unused-argument, redefined-outer-name
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from goals.database import async_crud
+from goals.database.buffer import RecordBuffer
+from goals.database.models import MetricsCurrentValues
+from goals.schemas import GoalBase, GoalUpdate
+from tests.test_constants import goal_1, goal_2
+
+SLOW_QUERY_SECONDS = 0.1
+CONCURRENT_QUERIES = 10
+
+
+def add_sleep_function(engine):
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, _record):
+        dbapi_connection.create_function("sleep", 1, time.sleep)
+
+
+def slow_query(session):
+    return session.execute(
+        text("SELECT sleep(:seconds)"), {"seconds": SLOW_QUERY_SECONDS}
+    ).all()
+
+
+@pytest.fixture
+def slow_async_engine(async_engine):
+    add_sleep_function(async_engine.sync_engine)
+    # Connections opened before have no sleep function
+    asyncio.run(async_engine.dispose())
+    return async_engine
+
+
+def test_new_session_is_like_the_given_one(async_engine):
+    session = AsyncSession(async_engine)
+    other = async_crud.new_session_like(session)
+    assert isinstance(other, AsyncSession) and other is not session
+    assert other.bind is async_engine
+    engine = create_engine("sqlite://")
+    assert async_crud.new_session_like(Session(engine)).get_bind() is engine
+
+
+def test_async_session_creates_and_lists_goals(async_engine):
+    async def run():
+        async with async_crud.opened(AsyncSession(async_engine)) as session:
+            for goal in [goal_1, goal_2]:
+                await async_crud.create_goal(session, GoalBase(**goal), 1)
+            return await async_crud.get_user_goals(session, 1)
+    goals = asyncio.run(run())
+    assert [goal["metric"] for goal in goals] == ["distance", "fat"]
+    assert goals[0]["unit"] == "km"
+
+
+def test_current_value_follows_progress_updates(async_engine):
+    fat_value = select(MetricsCurrentValues.value).where(
+        MetricsCurrentValues.user_id == 1,
+        MetricsCurrentValues.metric_name == "fat",
+    )
+
+    async def run():
+        async with async_crud.opened(AsyncSession(async_engine)) as session:
+            before = await session.scalar(fat_value)
+            first = await async_crud.create_goal(
+                session, GoalBase(**goal_2), 1
+            )
+            second = await async_crud.create_goal(
+                session, GoalBase(**goal_2), 1
+            )
+            for goal_id, progress in [(first, 3), (second, 2), (first, 5)]:
+                await async_crud.update_user_goal(
+                    session, goal_id, 1, GoalUpdate(progress=progress)
+                )
+            return before, await session.scalar(fat_value)
+    assert asyncio.run(run()) == (None, 7)
+
+
+def test_concurrent_slow_queries_overlap_with_async_driver(slow_async_engine):
+    async def one_request():
+        async with async_crud.opened(
+            AsyncSession(slow_async_engine)
+        ) as session:
+            return await async_crud.run_in_session(session, slow_query)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*[one_request()
+                               for _ in range(CONCURRENT_QUERIES)])
+        return time.perf_counter() - start
+    elapsed = asyncio.run(run())
+    serial = SLOW_QUERY_SECONDS * CONCURRENT_QUERIES
+    assert elapsed < serial / 2, f"{CONCURRENT_QUERIES / elapsed} queries/s"
+
+
+def test_concurrent_slow_queries_serialize_with_sync_driver(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/sync.db")
+    add_sleep_function(engine)
+
+    async def one_request():
+        async with async_crud.opened(Session(engine)) as session:
+            return await async_crud.run_in_session(session, slow_query)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*[one_request()
+                               for _ in range(CONCURRENT_QUERIES)])
+        return time.perf_counter() - start
+    elapsed = asyncio.run(run())
+    assert elapsed >= SLOW_QUERY_SECONDS * CONCURRENT_QUERIES, \
+        f"{CONCURRENT_QUERIES / elapsed} queries/s"
+
+
+def test_full_buffer_is_written_after_async_commit(async_engine):
+    buffer = RecordBuffer(True, 100, 1, 60)
+
+    @patch('goals.database.crud.RECORD_BUFFER', buffer)
+    async def run():
+        async with async_crud.opened(AsyncSession(async_engine)) as session:
+            goal_id = await async_crud.create_goal(session, GoalBase(**goal_1),
+                                                   1)
+            await async_crud.update_user_goal(session, goal_id, 1,
+                                              GoalUpdate(progress=4))
+            return (await session.execute(
+                text('SELECT value FROM "metricsRecords"'))).scalars().all()
+    assert asyncio.run(run()) == [4]
+    assert len(buffer) == 0
@@ -0,0 +1,181 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= redefined-outer-name
+import asyncio
+from datetime import datetime
+from os import environ
+from unittest.mock import patch
+
+import pytest
+from environ import to_config
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from goals.config import AppConfig
+from goals.database import crud
+from goals.database.buffer import BufferFull, RecordBuffer, \
+    create_record_buffer
+from goals.database.models import MetricsDailyRollups, MetricsRecords
+from goals.schemas import GoalBase, GoalUpdate
+from tests.test_constants import goal_1
+
+NOW = datetime(2023, 6, 5, 12)
+
+
+def buffered(flush_size=100, capacity=1000):
+    return RecordBuffer(True, flush_size, capacity, 60)
+
+
+def stored_records(engine):
+    with Session(engine) as session:
+        rows = session.query(MetricsRecords.value) \
+            .order_by(MetricsRecords.date).all()
+        return [row.value for row in rows]
+
+
+def test_immediate_buffer_writes_in_the_request_transaction(engine):
+    buffer = RecordBuffer(False, 100, 1000, 60)
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5}, NOW)
+        session.commit()
+    assert len(buffer) == 0
+    assert stored_records(engine) == [5]
+
+
+def test_buffered_records_are_written_on_flush(engine):
+    buffer = buffered()
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5}, NOW)
+        buffer.write(session, 1, {"distance": 8}, NOW.replace(hour=13))
+        session.commit()
+    assert stored_records(engine) == []
+    with Session(engine) as session:
+        assert buffer.flush(session) == 2
+        summary = session.query(MetricsDailyRollups).one()
+        assert (summary.last_value, summary.min_value, summary.count) == \
+            (8, 5, 2)
+    assert stored_records(engine) == [5, 8]
+    assert len(buffer) == 0
+
+
+def test_full_buffer_is_written_without_the_request_session(engine):
+    buffer = buffered(capacity=2)
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5}, NOW)
+        buffer.write(session, 1, {"distance": 8}, NOW.replace(hour=13))
+        session.commit()
+        buffer.write(session, 1, {"distance": 9}, NOW.replace(hour=14))
+        assert stored_records(engine) == [5, 8]
+        session.rollback()
+    assert stored_records(engine) == [5, 8]
+    assert len(buffer) == 0
+
+
+def test_records_are_buffered_only_once_committed(engine):
+    buffer = buffered()
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5}, NOW)
+        assert not buffer.day_values(1, "distance")
+        session.rollback()
+        buffer.write(session, 1, {"distance": 7}, NOW)
+        session.commit()
+    assert buffer.day_values(1, "distance") == {NOW.date(): 7}
+
+
+def test_failed_flush_keeps_records(engine):
+    buffer = buffered()
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5}, NOW)
+        session.commit()
+    with Session(engine) as session, \
+            patch.object(session, "commit", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            buffer.flush(session)
+    assert buffer.day_values(1, "distance") == {NOW.date(): 5}
+    with Session(engine) as session:
+        assert buffer.flush(session) == 1
+    assert stored_records(engine) == [5]
+
+
+def test_failed_flush_puts_records_back_ahead_of_newer_ones(engine):
+    buffer = buffered()
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5}, NOW)
+        session.commit()
+
+    def fail_after_newer_record():
+        with Session(engine) as other:
+            buffer.write(other, 1, {"distance": 6}, NOW.replace(hour=13))
+            other.commit()
+            assert buffer.flush(other) == 0
+        raise RuntimeError
+    with Session(engine) as session, \
+            patch.object(session, "commit",
+                         side_effect=fail_after_newer_record):
+        with pytest.raises(RuntimeError):
+            buffer.flush(session)
+    assert buffer.day_values(1, "distance") == {NOW.date(): 6}
+    with Session(engine) as session:
+        assert buffer.flush(session) == 2
+        assert session.query(MetricsDailyRollups).one().last_value == 6
+    assert stored_records(engine) == [5, 6]
+
+
+@patch('goals.database.buffer.Session',
+       side_effect=SQLAlchemyError("database is down"))
+def test_full_buffer_rejects_writes_until_written(_session, engine):
+    buffer = buffered(capacity=2)
+    with Session(engine) as session:
+        buffer.write(session, 1, {"distance": 5, "fat": 2}, NOW)
+        session.commit()
+        with pytest.raises(BufferFull):
+            buffer.write(session, 1, {"distance": 6}, NOW)
+    assert len(buffer) == 2
+    with Session(engine) as session:
+        assert buffer.flush(session) == 2
+        buffer.write(session, 1, {"distance": 6}, NOW)
+
+
+@patch('goals.database.crud.current_date')
+def test_progress_includes_buffered_records(date_mock, engine):
+    date_mock.return_value = NOW
+    buffer = buffered()
+    with Session(engine) as session, \
+            patch('goals.database.crud.RECORD_BUFFER', buffer):
+        goal_id = crud.create_goal(session, GoalBase(**goal_1), 1)
+        crud.update_user_goal(session, goal_id, 1, GoalUpdate(progress=4))
+        buffer.flush(session)
+        date_mock.return_value = NOW.replace(day=6)
+        crud.update_user_goal(session, goal_id, 1, GoalUpdate(progress=9))
+        assert stored_records(engine) == [4]
+        assert crud.get_general_progress(session, "distance", 1, 0) == 5
+        assert crud.get_general_progress(session, "distance", 1, 2) == 9
+
+
+def test_size_threshold_wakes_the_background_flush(engine):
+    buffer = RecordBuffer(True, 2, 1000, 60)
+
+    async def flush():
+        with Session(engine) as session:
+            buffer.flush(session)
+
+    async def run():
+        await buffer.start(flush)
+        with Session(engine) as session:
+            buffer.write(session, 1, {"distance": 5, "fat": 2}, NOW)
+            session.commit()
+        await asyncio.sleep(0.05)
+        flushed = len(buffer) == 0
+        with Session(engine) as session:
+            buffer.write(session, 1, {"distance": 6}, NOW.replace(hour=13))
+            session.commit()
+        await buffer.stop()
+        return flushed
+    assert asyncio.run(run())
+    assert sorted(stored_records(engine)) == [2, 5, 6]
+
+
+@patch.dict(environ, {"GOALS_DB_RECORDS_DURABILITY": "sometimes"},
+            clear=True)
+def test_unknown_durability_is_rejected():
+    with pytest.raises(ValueError):
+        create_record_buffer(to_config(AppConfig))
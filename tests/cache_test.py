@@ -0,0 +1,157 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= missing-class-docstring
+import asyncio
+
+from goals.cache import ImageCache, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_missing_key_returns_default_and_counts_miss():
+    cache = TTLCache(2, 10)
+    assert cache.get("a", "default") == "default"
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+
+def test_stored_key_is_returned_and_counts_hit():
+    cache = TTLCache(2, 10)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.hits == 1
+
+
+def test_entry_expires_after_ttl():
+    clock = Clock()
+    cache = TTLCache(2, 10, clock=clock)
+    cache.set("a", 1)
+    clock.now = 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(2, 10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_zero_size_disables_cache():
+    cache = TTLCache(0, 10)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_image_is_fresh_until_max_age():
+    clock = Clock()
+    cache = ImageCache(2, 60, clock=clock)
+
+    async def run():
+        await cache.set("user1goal1", {"image": "a"}, '"v1"')
+        entry = await cache.get("user1goal1")
+        assert entry.image == {"image": "a"}
+        assert cache.is_fresh(entry)
+        clock.now = 60
+        assert not cache.is_fresh(await cache.get("user1goal1"))
+    asyncio.run(run())
+
+
+def test_revalidated_image_is_fresh_again():
+    clock = Clock()
+    cache = ImageCache(2, 60, clock=clock)
+
+    async def run():
+        await cache.set("user1goal1", {"image": "a"}, '"v1"')
+        clock.now = 100
+        await cache.revalidate("user1goal1", await cache.get("user1goal1"))
+        assert cache.is_fresh(await cache.get("user1goal1"))
+    asyncio.run(run())
+    assert cache.revalidated == 1
+
+
+def test_image_survives_memory_eviction_on_disk(tmp_path):
+    cache = ImageCache(1, 60, str(tmp_path), 1024 * 1024)
+
+    async def run():
+        await cache.set("user1goal1", {"image": "a"}, '"v1"')
+        await cache.set("user1goal2", {"image": "b"}, None)
+        return await cache.get("user1goal1")
+    entry = asyncio.run(run())
+    assert entry.image == {"image": "a"}
+    assert entry.etag == '"v1"'
+
+
+def test_disk_tier_is_trimmed_to_max_bytes(tmp_path):
+    cache = ImageCache(0, 60, str(tmp_path), 150)
+
+    async def run():
+        await cache.set("user1goal1", {"image": "a" * 60}, None)
+        await cache.set("user1goal2", {"image": "b" * 60}, None)
+        assert await cache.get("user1goal1") is None
+        assert (await cache.get("user1goal2")).image == {"image": "b" * 60}
+    asyncio.run(run())
+
+
+def test_disk_tier_counts_files_left_by_a_previous_run(tmp_path):
+    async def fill():
+        await ImageCache(0, 60, str(tmp_path), 150).set(
+            "user1goal1", {"image": "a" * 60}, None
+        )
+    asyncio.run(fill())
+    cache = ImageCache(0, 60, str(tmp_path), 150)
+
+    async def run():
+        await cache.set("user1goal2", {"image": "b" * 60}, None)
+        assert await cache.get("user1goal1") is None
+        assert (await cache.get("user1goal2")).image == {"image": "b" * 60}
+    asyncio.run(run())
+    assert [path.name for path in tmp_path.iterdir()] == ["user1goal2.json"]
+
+
+def test_deleted_image_is_removed_from_every_tier(tmp_path):
+    cache = ImageCache(2, 60, str(tmp_path), 1024)
+
+    async def run():
+        await cache.set("user1goal1", {"image": "a"}, None)
+        await cache.delete("user1goal1")
+        assert await cache.get("user1goal1") is None
+    asyncio.run(run())
+    assert not list(tmp_path.iterdir())
+
+
+def test_image_deleted_during_fetch_is_not_stored():
+    cache = ImageCache(2, 60)
+
+    async def run():
+        generation = cache.generation
+        await cache.delete("user1goal1")
+        await cache.set("user1goal1", {"image": "old"}, None, generation)
+        assert await cache.get("user1goal1") is None
+        await cache.set("user1goal1", {"image": "new"}, None,
+                        cache.generation)
+        assert (await cache.get("user1goal1")).image == {"image": "new"}
+    asyncio.run(run())
+
+
+def test_missing_image_expires_after_its_ttl():
+    clock = Clock()
+    cache = ImageCache(2, 60, clock=clock)
+
+    async def run():
+        await cache.set_missing("user1goal1", 10)
+        entry = await cache.get("user1goal1")
+        assert entry.image is None and cache.is_fresh(entry)
+        clock.now = 10
+        assert await cache.get("user1goal1") is None
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= redefined-outer-name
+import pytest
+from sqlalchemy import event
+
+from goals.database.catalog import MetricsCatalog
+from goals.database.models import Metrics
+from tests.cache_test import Clock
+
+
+@pytest.fixture
+def statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_catalog_is_loaded_once(session, statements):
+    catalog = MetricsCatalog()
+    assert catalog.unit(session, "distance") == "km"
+    assert catalog.unit(session, "fat") == "kg"
+    assert len(statements) == 1
+
+
+def test_catalog_cant_be_changed(session):
+    catalog = MetricsCatalog()
+    with pytest.raises(TypeError):
+        catalog.units(session)["distance"] = "mi"
+
+
+def test_unknown_metrics_reload_at_most_once_per_second(session,
+                                                        statements):
+    clock = Clock()
+    catalog = MetricsCatalog(clock)
+    catalog.units(session)
+    clock.now = 5
+    session.add(Metrics(name="calories", unit="kcal"))
+    session.commit()
+    assert catalog.unit(session, "calories") == "kcal"
+    assert catalog.unit(session, "speed") is None
+    assert catalog.unit(session, "speed") is None
+    loads = [statement for statement in statements
+             if statement.startswith("SELECT")]
+    assert len(loads) == 2
+
+
+def test_invalidated_catalog_is_loaded_again(session):
+    catalog = MetricsCatalog()
+    catalog.units(session)
+    session.query(Metrics).filter(Metrics.name == "steps").delete()
+    session.commit()
+    assert "steps" in catalog.units(session)
+    catalog.invalidate()
+    assert "steps" not in catalog.units(session)
+
+
+def test_catalog_lists_metrics_with_units(session):
+    metrics = MetricsCatalog().as_list(session)
+    assert {"name": "steps", "unit": "step"} in metrics
+    assert len(metrics) == 4
@@ -57,3 +57,47 @@ def test_when_sentry_dsn_is_empty_expect_localhost():
 def test_when_sentry_dsn_has_sentry_url_expect_it():
     cnf = to_config(AppConfig)
     assert cnf.sentry.dsn == "https://wf313c@24t2tg2g.ingest.sentry.io/33433"
+
+
+@patch.dict(environ, {}, clear=True)
+def test_when_environment_is_empty_expect_http2_disabled():
+    cnf = to_config(AppConfig)
+    assert not cnf.auth.http2
+
+
+@patch.dict(
+    environ,
+    {"GOALS_AUTH_MAX_CONNECTIONS": "10", "GOALS_AUTH_READ_TIMEOUT": "2.5"},
+    clear=True
+)
+def test_when_environment_has_auth_pool_settings_expect_them():
+    cnf = to_config(AppConfig)
+    assert cnf.auth.max_connections == 10
+    assert cnf.auth.read_timeout == 2.5
+
+
+@patch.dict(environ, {}, clear=True)
+def test_when_environment_is_empty_expect_pool_pre_ping():
+    cnf = to_config(AppConfig)
+    assert cnf.db.pool_pre_ping
+    assert cnf.db.pool_size == 5
+
+
+@patch.dict(environ, {}, clear=True)
+def test_when_environment_is_empty_expect_immediate_records():
+    cnf = to_config(AppConfig)
+    assert cnf.db.records_durability == "immediate"
+
+
+@patch.dict(environ, {}, clear=True)
+def test_when_environment_is_empty_expect_lenient_query_budget():
+    cnf = to_config(AppConfig)
+    assert cnf.db.query_budget == 25
+    assert not cnf.db.strict_queries
+
+
+@patch.dict(environ, {}, clear=True)
+def test_when_environment_is_empty_expect_every_log_record():
+    cnf = to_config(AppConfig)
+    assert cnf.log_sample_rate == 1.0
+    assert cnf.log_max_length == 2000
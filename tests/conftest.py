@@ -0,0 +1,41 @@
+"""Databases shared by the tests, SQLite files with the schema and metrics."""
+# pylint: disable= missing-function-docstring, redefined-outer-name
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from goals.database.data import insert_new_metrics
+from goals.database.models import Base
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/goals.db")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        insert_new_metrics(session)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def async_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/async.db")
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            await session.run_sync(insert_new_metrics)
+    asyncio.run(create())
+    yield engine
+    asyncio.run(engine.dispose())
@@ -0,0 +1,56 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+import asyncio
+from os import environ
+from unittest.mock import patch
+
+import httpx
+from environ import to_config
+
+from goals.config import AppConfig
+from goals.http_client import HttpClient, create_http_client
+
+
+@patch.dict(
+    environ,
+    {"GOALS_AUTH_CONNECT_TIMEOUT": "1", "GOALS_AUTH_READ_TIMEOUT": "3"},
+    clear=True
+)
+def test_client_uses_configured_timeouts():
+    client = create_http_client(to_config(AppConfig))
+    assert client.timeout.connect == 1
+    assert client.timeout.read == 3
+
+
+def test_client_is_reused_between_calls():
+    holder = HttpClient(to_config(AppConfig))
+    assert holder.get() is holder.get()
+
+
+def test_stop_closes_client():
+    async def run():
+        holder = HttpClient(to_config(AppConfig))
+        await holder.start()
+        client = holder.get()
+        await holder.stop()
+        return client
+    assert asyncio.run(run()).is_closed
+
+
+def test_started_client_serves_every_request():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"data": {"id": 1}})
+
+    async def run():
+        holder = HttpClient(to_config(AppConfig))
+        await holder.start(transport=httpx.MockTransport(handler))
+        first = holder.get()
+        await first.get("http://auth/auth/credentials")
+        await holder.get().get("http://auth/auth/credentials")
+        await holder.stop()
+        return first
+    first = asyncio.run(run())
+    assert calls == ["/auth/credentials", "/auth/credentials"]
+    assert first.is_closed
@@ -0,0 +1,28 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+from os import environ
+from unittest.mock import patch
+
+from environ import to_config
+
+from goals.config import AppConfig
+from goals.database.initialization import get_database_url, is_async_driver
+
+
+@patch.dict(environ, {}, clear=True)
+def test_default_driver_is_not_async():
+    assert not is_async_driver(to_config(AppConfig))
+
+
+@patch.dict(environ, {"GOALS_DB_DRIVER": "postgresql+asyncpg"}, clear=True)
+def test_asyncpg_driver_is_async():
+    assert is_async_driver(to_config(AppConfig))
+
+
+@patch.dict(
+    environ,
+    {"GOALS_DB_DRIVER": "sqlite+aiosqlite", "GOALS_DB_DATABASE": "goals.db"},
+    clear=True
+)
+def test_sqlite_url_only_has_database():
+    url = get_database_url(to_config(AppConfig))
+    assert url.render_as_string() == "sqlite+aiosqlite:///goals.db"
@@ -1,17 +1,25 @@
 # pylint: disable= missing-module-docstring, missing-function-docstring
 # pylint: disable= unused-argument, redefined-outer-name
+import asyncio
+import json
 from datetime import datetime
 from unittest.mock import patch
 
+import httpx
 import pytest
 from hamcrest import assert_that, greater_than
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
+from goals.database.async_crud import get_user_goals
+from goals.database.buffer import RecordBuffer
 from goals.database.data import initialize_db
-from goals.main import DOCUMENTATION_URI, app, get_db, BASE_URI, CONFIGURATION
+from goals.main import DOCUMENTATION_URI, app, get_db, BASE_URI, \
+    CONFIGURATION, UPLOAD_QUEUE
 from goals.database.models import Base
+from goals.monitoring import instrument_engine
+from goals.shared_cache import MemoryBackend, SharedCache
 from tests.test_constants import goal_2, goal_3, goal_1, \
     equal_dicts, new_goal_3, updated_goal_3, generate_progress
 
@@ -20,6 +28,7 @@ SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+instrument_engine(engine)
 TestingSessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine
 )
@@ -68,6 +77,15 @@ def test_several_goals_return_expected_ids(token_mock, test_db):
     assert post_response_3.json() == 3
 
 
+@patch('goals.main.get_credentials')
+def test_goal_with_unknown_metric_is_rejected(token_mock, test_db):
+    token_mock.return_value = admin_token
+    response = client.post(BASE_URI + "/1", json={**goal_1, "metric": "nope"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown metrics: nope"}
+    assert client.get(BASE_URI + "/1").json() == []
+
+
 @patch('goals.main.download_image')
 @patch('goals.main.upload_image')
 @patch('goals.main.get_credentials')
@@ -98,6 +116,47 @@ def test_can_get_available_metrics(token_mock, upload_mock,
     assert len(get_response.json()) == 4
 
 
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_goal_images_are_downloaded_concurrently(token_mock, download_mock,
+                                                 test_db):
+    token_mock.return_value = admin_token
+    running = {"now": 0, "max": 0}
+
+    async def download(user_id, goal_id):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.05)
+        running["now"] -= 1
+        return {"image": f"image{goal_id}"}
+    download_mock.side_effect = download
+    for goal in [goal_1, goal_2, goal_3]:
+        client.post(BASE_URI + "/1", json=goal)
+    get_response = client.get(BASE_URI + "/1")
+    images = [goal["image"] for goal in get_response.json()]
+    assert images == ["image1", "image2", "image3"]
+    assert running["max"] == 3
+
+
+@patch.object(CONFIGURATION.images, "timeout", 0.05)
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_slow_goal_image_is_left_out(token_mock, download_mock, test_db):
+    token_mock.return_value = admin_token
+
+    async def download(user_id, goal_id):
+        if goal_id == 1:
+            await asyncio.sleep(1)
+        return {"image": f"image{goal_id}"}
+    download_mock.side_effect = download
+    client.post(BASE_URI + "/1", json=goal_1)
+    client.post(BASE_URI + "/1", json=goal_2)
+    get_response = client.get(BASE_URI + "/1")
+    assert get_response.status_code == 200
+    assert "image" not in get_response.json()[0]
+    assert get_response.json()[1]["image"] == "image2"
+
+
 @patch('goals.main.get_credentials')
 def test_cant_delete_nonexistent_goal(token_mock, test_db):
     token_mock.return_value = admin_token
@@ -121,6 +180,23 @@ def test_can_delete_existent_goal(token_mock, upload_mock,
     assert get_response.json() == []
 
 
+@patch('goals.main.upload_image')
+@patch('goals.main.get_credentials')
+def test_cant_delete_goal_of_other_user(token_mock, upload_mock, test_db):
+    token_mock.return_value = admin_token
+    _id = client.post(BASE_URI + "/1", json=goal_1).json()
+    token_mock.return_value = {"role": "user", "id": 2}
+    assert client.delete(BASE_URI + "/" + str(_id)).status_code == 403
+
+
+@patch('goals.main.get_credentials')
+def test_responses_report_database_time(token_mock, test_db):
+    token_mock.return_value = admin_token
+    response = client.get(BASE_URI + "/1")
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    assert 'desc="2 queries"' in response.headers["Server-Timing"]
+
+
 @patch('goals.main.download_image')
 @patch('goals.main.upload_image')
 @patch('goals.main.get_credentials')
@@ -355,3 +431,387 @@ def test_when_asking_cors_is_available_origin_apple_expect_200():
     method_override = {"origin": "apple"}
     response = client.options("goals", headers=HEADERS | method_override)
     assert response.status_code == 400
+
+
+@patch('goals.database.crud.current_date')
+@patch('goals.main.get_credentials')
+def test_progress_window_starts_at_midnight_days_ago(token_mock, datetime_mock,
+                                                     test_db):
+    token_mock.return_value = admin_token
+    url = BASE_URI + "/1/metricsProgress/distance?"
+    client.post(BASE_URI + "/1", json=goal_1)
+    datetime_mock.return_value = datetime(2023, 6, 1)
+    client.patch(BASE_URI + "/1", json=generate_progress(5))
+    datetime_mock.return_value = datetime(2023, 6, 3)
+    client.patch(BASE_URI + "/1", json=generate_progress(8))
+    datetime_mock.return_value = datetime(2023, 6, 4)
+    assert client.get(url + "days=1").json() == {"progress": 3}
+    assert client.get(url + "days=2").json() == {"progress": 3}
+    assert client.get(url + "days=3").json() == {"progress": 8}
+
+
+@patch('goals.main.get_credentials')
+def test_cant_update_goal_of_other_user(token_mock, test_db):
+    token_mock.return_value = admin_token
+    client.post(BASE_URI + "/1", json=goal_1)
+    token_mock.return_value = {"role": "user", "id": 2}
+    response = client.patch(BASE_URI + "/1", json=generate_progress(5))
+    assert response.status_code == 403
+    token_mock.return_value = admin_token
+    get_response = client.get(BASE_URI + "/1/metricsProgress/distance")
+    assert get_response.json() == {"progress": 0}
+
+
+@patch('goals.main.get_credentials')
+def test_cant_update_nonexistent_goal(token_mock, test_db):
+    token_mock.return_value = admin_token
+    response = client.patch(BASE_URI + "/32", json=generate_progress(5))
+    assert response.status_code == 404
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_update_without_progress_keeps_progress(token_mock, download_mock,
+                                                test_db):
+    token_mock.return_value = admin_token
+    download_mock.return_value = None
+    client.post(BASE_URI + "/1", json=goal_1)
+    client.patch(BASE_URI + "/1", json=generate_progress(5))
+    response = client.patch(BASE_URI + "/1", json={"objective": 9})
+    assert response.status_code == 200
+    goal = client.get(BASE_URI + "/1").json()[0]
+    assert goal["objective"] == 9
+    assert goal["progress"] == 5
+
+
+@patch('goals.database.crud.RECORD_BUFFER', RecordBuffer(True, 100, 0, 60))
+@patch('goals.main.get_credentials')
+def test_progress_update_is_rejected_when_buffer_full(token_mock, test_db):
+    token_mock.return_value = admin_token
+    client.post(BASE_URI + "/1", json=goal_1)
+    response = client.patch(BASE_URI + "/1", json=generate_progress(5))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    goal = client.get(BASE_URI + "/1").json()[0]
+    assert goal["progress"] == 0
+
+
+@patch('goals.main.get_credentials')
+def test_progress_update_runs_in_few_statements(token_mock, test_db):
+    token_mock.return_value = admin_token
+    client.post(BASE_URI + "/1", json=goal_1)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        client.patch(BASE_URI + "/1", json=generate_progress(5))
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(statements) <= 7, statements
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_batch_progress_updates_goals_and_metrics(token_mock, download_mock,
+                                                  test_db):
+    token_mock.return_value = admin_token
+    download_mock.return_value = None
+    for goal in [goal_1, goal_1, goal_3]:
+        client.post(BASE_URI + "/1", json=goal)
+    client.patch(BASE_URI + "/1", json=generate_progress(2))
+    response = client.patch(BASE_URI + "/1/progress", json={"updates": [
+        {"goal_id": 1, "progress": 5},
+        {"goal_id": 2, "progress": 4},
+        {"goal_id": 3, "progress": 7},
+        {"goal_id": 1, "progress": 6},
+    ]})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["results"]] == \
+        [200, 200, 200, 200]
+    goals = client.get(BASE_URI + "/1").json()
+    assert [goal["progress"] for goal in goals] == [6, 4, 7]
+    distance = client.get(BASE_URI + "/1/metricsProgress/distance?days=1")
+    muscle = client.get(BASE_URI + "/1/metricsProgress/muscle?days=1")
+    assert distance.json() == {"progress": 10}
+    assert muscle.json() == {"progress": 7}
+
+
+@patch('goals.main.get_credentials')
+def test_batch_progress_reports_missing_and_foreign_goals(token_mock,
+                                                          test_db):
+    token_mock.return_value = admin_token
+    client.post(BASE_URI + "/1", json=goal_1)
+    token_mock.return_value = {"role": "user", "id": 2}
+    client.post(BASE_URI + "/2", json=goal_1)
+    token_mock.return_value = admin_token
+    response = client.patch(BASE_URI + "/1/progress", json={"updates": [
+        {"goal_id": 1, "progress": 5},
+        {"goal_id": 2, "progress": 5},
+        {"goal_id": 9, "progress": 5},
+    ]})
+    assert response.json()["results"] == [
+        {"goal_id": 1, "status": 200},
+        {"goal_id": 2, "status": 403},
+        {"goal_id": 9, "status": 404},
+    ]
+    token_mock.return_value = {"role": "user", "id": 2}
+    other = client.get(BASE_URI + "/2/metricsProgress/distance?days=1")
+    assert other.json() == {"progress": 0}
+
+
+@patch('goals.main.get_credentials')
+def test_batch_progress_needs_credentials_of_user(token_mock, test_db):
+    token_mock.return_value = {"role": "user", "id": 2}
+    response = client.patch(BASE_URI + "/1/progress", json={"updates": [
+        {"goal_id": 1, "progress": 5},
+    ]})
+    assert response.status_code == 403
+
+
+@patch('goals.main.get_credentials')
+def test_batch_progress_statements_dont_grow_with_goals(token_mock, test_db):
+    token_mock.return_value = admin_token
+    for _ in range(20):
+        client.post(BASE_URI + "/1", json=goal_1)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        client.patch(BASE_URI + "/1/progress", json={"updates": [
+            {"goal_id": goal_id, "progress": goal_id}
+            for goal_id in range(1, 21)
+        ]})
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(statements) <= 6, statements
+
+
+@patch.object(UPLOAD_QUEUE, '_upload')
+@patch('goals.main.get_credentials')
+def test_bulk_goals_are_created_and_images_uploaded_later(token_mock,
+                                                          upload_mock,
+                                                          test_db):
+    token_mock.return_value = admin_token
+    goals = [{**goal_1, "image": "one"}, goal_2, {**goal_3, "image": "three"}]
+    with TestClient(app) as app_client:
+        response = app_client.post(BASE_URI + "/1/bulk",
+                                   json={"goals": goals})
+        assert response.json() == [1, 2, 3]
+    upload_mock.assert_any_call("one", 1, 1)
+    upload_mock.assert_any_call("three", 1, 3)
+    assert upload_mock.call_count == 2
+    status = client.get(BASE_URI + "/1/images/3")
+    assert status.json() == {"goal_id": 3, "status": "done"}
+    assert client.get(BASE_URI + "/1/images/2").status_code == 404
+
+
+@patch('goals.main.get_credentials')
+def test_bulk_goals_need_credentials_of_user(token_mock, test_db):
+    token_mock.return_value = {"role": "user", "id": 2}
+    response = client.post(BASE_URI + "/1/bulk", json={"goals": [goal_1]})
+    assert response.status_code == 403
+
+
+@patch.object(UPLOAD_QUEUE, "reserve")
+@patch('goals.main.get_credentials')
+def test_bulk_goals_with_unknown_metrics_are_rejected(token_mock,
+                                                      reserve_mock, test_db):
+    token_mock.return_value = admin_token
+    goals = [goal_1, {**goal_2, "metric": "nope"}, {**goal_3, "metric": "x"}]
+    response = client.post(BASE_URI + "/1/bulk", json={"goals": goals})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown metrics: nope, x"}
+    assert client.get(BASE_URI + "/1").json() == []
+    reserve_mock.assert_not_called()
+
+
+@patch.object(UPLOAD_QUEUE, "reserve", return_value=False)
+@patch('goals.main.get_credentials')
+def test_bulk_goals_are_rejected_when_uploads_are_full(token_mock, room_mock,
+                                                       test_db):
+    token_mock.return_value = admin_token
+    response = client.post(BASE_URI + "/1/bulk",
+                           json={"goals": [{**goal_1, "image": "one"}]})
+    assert response.status_code == 503
+    assert client.get(BASE_URI + "/1").json() == []
+
+
+@patch.object(UPLOAD_QUEUE, "release")
+@patch('goals.main.create_goals', side_effect=RuntimeError("database"))
+@patch('goals.main.get_credentials')
+def test_bulk_upload_room_is_given_back_if_goals_fail(token_mock, create_mock,
+                                                      release_mock, test_db):
+    token_mock.return_value = admin_token
+    goals = [{**goal_1, "image": "one"}, {**goal_2, "image": "two"}]
+    with pytest.raises(RuntimeError):
+        client.post(BASE_URI + "/1/bulk", json={"goals": goals})
+    release_mock.assert_called_once_with(2)
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_goals_are_paginated_by_cursor(token_mock, download_mock, test_db):
+    token_mock.return_value = admin_token
+    download_mock.return_value = None
+    for goal in [goal_1, goal_2, goal_3, goal_1, goal_2]:
+        client.post(BASE_URI + "/1", json=goal)
+    first = client.get(BASE_URI + "/1?limit=2")
+    assert [goal["id"] for goal in first.json()] == [1, 2]
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(BASE_URI + f"/1?limit=2&after={cursor}")
+    assert [goal["id"] for goal in second.json()] == [3, 4]
+    last = client.get(BASE_URI + "/1?limit=2&after="
+                      + second.headers["X-Next-Cursor"])
+    assert [goal["id"] for goal in last.json()] == [5]
+    assert "X-Next-Cursor" not in last.headers
+
+
+@patch('goals.main.get_credentials')
+def test_page_size_is_limited(token_mock, test_db):
+    token_mock.return_value = admin_token
+    limit = CONFIGURATION.max_page_size + 1
+    response = client.get(BASE_URI + f"/1?limit={limit}")
+    assert response.status_code == 422
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_goals_can_be_streamed_as_ndjson(token_mock, download_mock, test_db):
+    token_mock.return_value = admin_token
+    download_mock.side_effect = \
+        lambda user_id, goal_id: {"image": f"image{goal_id}"}
+    for goal in [goal_1, goal_2, goal_3]:
+        client.post(BASE_URI + "/1", json=goal)
+    response = client.get(BASE_URI + "/1?stream=true&limit=2&after=1")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    goals = [json.loads(line) for line in response.text.splitlines()]
+    assert [(goal["id"], goal["image"]) for goal in goals] == \
+        [(2, "image2"), (3, "image3")]
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_unchanged_goals_answer_not_modified(token_mock, download_mock,
+                                             test_db):
+    token_mock.return_value = admin_token
+    download_mock.return_value = None
+    client.post(BASE_URI + "/1", json=goal_1)
+    first = client.get(BASE_URI + "/1")
+    tag = first.headers["ETag"]
+    download_mock.reset_mock()
+    second = client.get(BASE_URI + "/1", headers={"If-None-Match": tag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == tag
+    download_mock.assert_not_called()
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_goals_missing_images_are_not_tagged(token_mock, download_mock,
+                                             test_db):
+    token_mock.return_value = admin_token
+    download_mock.side_effect = httpx.ConnectError("down")
+    client.post(BASE_URI + "/1", json=goal_1)
+    response = client.get(BASE_URI + "/1")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.headers["Cache-Control"] == "no-store"
+
+
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_goal_changes_change_the_etag(token_mock, download_mock, test_db):
+    token_mock.return_value = admin_token
+    download_mock.return_value = None
+    tags = set()
+    client.post(BASE_URI + "/1", json=goal_1)
+    tags.add(client.get(BASE_URI + "/1").headers["ETag"])
+    client.patch(BASE_URI + "/1", json={"objective": 9})
+    tags.add(client.get(BASE_URI + "/1").headers["ETag"])
+    client.patch(BASE_URI + "/1", json=generate_progress(5))
+    tags.add(client.get(BASE_URI + "/1").headers["ETag"])
+    client.delete(BASE_URI + "/1")
+    response = client.get(BASE_URI + "/1",
+                          headers={"If-None-Match": ", ".join(tags)})
+    assert response.status_code == 200
+    assert len(tags | {response.headers["ETag"]}) == 4
+
+
+@patch('goals.main.get_credentials')
+def test_unchanged_progress_answers_not_modified(token_mock, test_db):
+    token_mock.return_value = admin_token
+    client.post(BASE_URI + "/1", json=goal_1)
+    client.patch(BASE_URI + "/1", json=generate_progress(5))
+    url = BASE_URI + "/1/metricsProgress/distance"
+    tag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": tag}).status_code == 304
+    client.patch(BASE_URI + "/1", json=generate_progress(7))
+    response = client.get(url, headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.json() == {"progress": 7}
+
+
+@patch('goals.main.SHARED_CACHE', SharedCache(MemoryBackend(100), 60, 1, 1))
+@patch('goals.main.get_user_goals', wraps=get_user_goals)
+@patch('goals.main.download_image')
+@patch('goals.main.get_credentials')
+def test_goal_listing_is_cached_until_goals_change(token_mock, download_mock,
+                                                   get_goals_mock, test_db):
+    token_mock.return_value = admin_token
+    download_mock.return_value = None
+    client.post(BASE_URI + "/1", json=goal_1)
+    client.get(BASE_URI + "/1")
+    cached = client.get(BASE_URI + "/1").json()
+    assert get_goals_mock.call_count == 1
+    client.patch(BASE_URI + "/1", json=generate_progress(5))
+    changed = client.get(BASE_URI + "/1").json()
+    assert get_goals_mock.call_count == 2
+    assert (cached[0]["progress"], changed[0]["progress"]) == (0, 5)
+
+
+@patch('goals.main.get_user_goals')
+@patch('goals.main.get_credentials')
+def test_identical_concurrent_listings_are_coalesced(token_mock,
+                                                     get_goals_mock, test_db):
+    token_mock.return_value = admin_token
+
+    async def slow_goals(*_args):
+        await asyncio.sleep(0.05)
+        return []
+    get_goals_mock.side_effect = slow_goals
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url="http://test") as async_client:
+            return await asyncio.gather(*[
+                async_client.get(BASE_URI + "/1") for _ in range(5)
+            ])
+    responses = asyncio.run(run())
+    assert [response.json() for response in responses] == [[]] * 5
+    assert get_goals_mock.call_count == 1
+
+
+@patch('goals.main.SHARED_CACHE', SharedCache(MemoryBackend(100), 60, 1, 1))
+@patch('goals.main.get_user_goals')
+@patch('goals.main.get_credentials')
+def test_shared_listing_does_not_use_request_session(token_mock,
+                                                     get_goals_mock, test_db):
+    token_mock.return_value = admin_token
+    request_sessions = []
+
+    def recording_get_db():
+        for session in override_get_db():
+            request_sessions.append(session)
+            yield session
+    get_goals_mock.return_value = []
+    app.dependency_overrides[get_db] = recording_get_db
+    try:
+        assert client.get(BASE_URI + "/1").json() == []
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+    assert get_goals_mock.call_args.args[0] not in request_sessions
@@ -0,0 +1,180 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= redefined-outer-name
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+from goals.database.migrations import LATEST_VERSION, LOCK_KEY, \
+    current_version, downgrade, migration_lock, upgrade
+from goals.database.migrations import m0001_initial_schema, \
+    m0002_performance_indexes, m0003_daily_rollups
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    yield engine
+    engine.dispose()
+
+
+def index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+def test_empty_database_is_version_zero(engine):
+    assert current_version(engine) == 0
+
+
+def test_upgrade_creates_tables_indexes_and_metrics(engine):
+    assert upgrade(engine) == LATEST_VERSION
+    assert inspect(engine).has_table("metricsDailyRollups")
+    assert inspect(engine).has_table("metricsCurrentValues")
+    assert inspect(engine).has_table("userVersions")
+    assert "ix_goals_user_id" in index_names(engine, "goals")
+    assert "ix_metricsRecords_user_metric_date" in \
+        index_names(engine, "metricsRecords")
+    with engine.connect() as connection:
+        metrics = connection.execute(text("SELECT count(*) FROM metrics"))
+        assert metrics.scalar() == 4
+
+
+def test_upgrade_twice_does_nothing(engine):
+    upgrade(engine)
+    assert upgrade(engine) == LATEST_VERSION
+
+
+def test_upgrade_keeps_tables_created_before_migrations(engine):
+    m0001_initial_schema.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO metrics (name, unit) VALUES ('distance', 'km')"
+        ))
+        connection.execute(text(
+            "INSERT INTO goals (user_id, metric, progress) "
+            "VALUES (1, 'distance', 3)"
+        ))
+    upgrade(engine)
+    with engine.connect() as connection:
+        goals = connection.execute(text("SELECT count(*) FROM goals"))
+        assert goals.scalar() == 1
+
+
+def test_downgrade_removes_indexes(engine):
+    upgrade(engine)
+    assert downgrade(engine, 1) == 1
+    assert "ix_goals_user_id" not in index_names(engine, "goals")
+    assert not inspect(engine).has_table("metricsDailyRollups")
+    assert inspect(engine).has_table("goals")
+
+
+def test_downgrade_to_zero_drops_tables(engine):
+    upgrade(engine)
+    assert downgrade(engine, 0) == 0
+    assert not inspect(engine).has_table("goals")
+
+
+def test_daily_rollups_start_from_existing_records(engine):
+    upgrade(engine, 2)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO \"metricsRecords\" "
+            "(metric_name, user_id, value, date) VALUES"
+            " ('steps', 1, 5, '2023-06-01 08:00:00.000000'),"
+            " ('steps', 1, 9, '2023-06-01 20:00:00.000000'),"
+            " ('steps', 1, 7, '2023-06-01 12:00:00.000000'),"
+            " ('steps', 1, 12, '2023-06-02 09:00:00.000000')"
+        ))
+    upgrade(engine, 3)
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT day, last_value, min_value, max_value, count "
+            "FROM \"metricsDailyRollups\" ORDER BY day"
+        )).all()
+    assert rows == [("2023-06-01", 9, 5, 9, 3), ("2023-06-02", 12, 12, 12, 1)]
+
+
+def test_current_values_start_from_latest_records(engine):
+    upgrade(engine, 3)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO \"metricsRecords\" "
+            "(metric_name, user_id, value, date) VALUES"
+            " ('steps', 1, 5, '2023-06-01 00:00:00.000000'),"
+            " ('steps', 1, 9, '2023-06-02 00:00:00.000000'),"
+            " ('fat', 1, 2, '2023-06-01 00:00:00.000000')"
+        ))
+    upgrade(engine, 4)
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT metric_name, value FROM \"metricsCurrentValues\" "
+            "ORDER BY metric_name"
+        )).all()
+    assert rows == [("fat", 2), ("steps", 9)]
+
+
+def test_versions_are_recorded_in_the_migration_transaction(engine):
+    upgrade(engine, 2)
+    steps, inserts = [], []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(connection, _cursor, statement, *_):
+        if statement.startswith("INSERT INTO schema_versions"):
+            inserts.append(connection)
+
+    with patch.object(m0003_daily_rollups, "upgrade", steps.append):
+        upgrade(engine, 3)
+    assert inserts == steps
+
+
+def test_failed_migration_is_not_recorded(engine):
+    upgrade(engine, 2)
+    with patch.object(m0003_daily_rollups, "upgrade",
+                      side_effect=RuntimeError("boom")):
+        with pytest.raises(RuntimeError):
+            upgrade(engine)
+    assert current_version(engine) == 2
+    assert upgrade(engine) == LATEST_VERSION
+
+
+def test_migration_lock_is_held_during_postgresql_runs():
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    connection = engine.connect.return_value.execution_options.return_value \
+        .__enter__.return_value
+    with migration_lock(engine):
+        locked = [str(call.args[0]) for call in
+                  connection.execute.call_args_list]
+    unlocked = [str(call.args[0]) for call in
+                connection.execute.call_args_list]
+    assert locked == ["SELECT pg_advisory_lock(:key)"]
+    assert unlocked[1:] == ["SELECT pg_advisory_unlock(:key)"]
+    assert connection.execute.call_args.args[1] == {"key": LOCK_KEY}
+
+
+def test_migration_lock_does_nothing_on_sqlite(engine):
+    with migration_lock(engine):
+        assert upgrade(engine) == LATEST_VERSION
+
+
+def postgresql_connection(invalid):
+    connection = MagicMock()
+    connection.dialect.name = "postgresql"
+    connection.execute.return_value.scalar.return_value = invalid
+    return connection
+
+
+def test_invalid_index_is_built_again():
+    index, connection = MagicMock(), postgresql_connection(True)
+    with patch.object(m0002_performance_indexes, "INDEXES", [index]):
+        m0002_performance_indexes.upgrade(connection)
+    index.drop.assert_called_once_with(bind=connection)
+    index.create.assert_called_once_with(bind=connection, checkfirst=True)
+
+
+def test_valid_index_is_kept():
+    index, connection = MagicMock(), postgresql_connection(False)
+    with patch.object(m0002_performance_indexes, "INDEXES", [index]):
+        m0002_performance_indexes.upgrade(connection)
+    index.drop.assert_not_called()
+    index.create.assert_called_once_with(bind=connection, checkfirst=True)
@@ -0,0 +1,171 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, generate_latest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from goals.database.pool import TimedQueuePool
+from goals.monitoring import AUTH_ERRORS, QUERY_DURATION, REQUEST_LATENCY, \
+    CacheCollector, PoolCollector, PrometheusMiddleware, QueryBudgetExceeded, \
+    QueryProfile, QueryProfileMiddleware, SingleFlightCollector, \
+    instrument_engine, observe_auth_call, start_metrics_server
+
+
+def sample(metric, suffix, **labels):
+    for family in metric.collect():
+        for found in family.samples:
+            if found.name == family.name + suffix and found.labels == labels:
+                return found.value
+    return 0
+
+
+def scrape(collector):
+    registry = CollectorRegistry()
+    registry.register(collector)
+    return generate_latest(registry).decode()
+
+
+def test_requests_are_measured_by_route_template():
+    app = FastAPI()
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.get("/goals/{user_id}")
+    def get_goals(user_id: int):
+        return {"user_id": user_id}
+    labels = {"method": "GET", "route": "/goals/{user_id}", "status": "200"}
+    before = sample(REQUEST_LATENCY, "_count", **labels)
+    client = TestClient(app)
+    client.get("/goals/1")
+    client.get("/goals/2")
+    client.get("/other")
+    assert sample(REQUEST_LATENCY, "_count", **labels) == before + 2
+    assert sample(REQUEST_LATENCY, "_count", method="GET",
+                  route="unmatched", status="404") >= 1
+
+
+def test_auth_server_errors_are_counted():
+    def handler(request):
+        return httpx.Response(503 if request.url.path == "/down" else 200)
+
+    async def call(path):
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(handler),
+            base_url="http://auth",
+        ) as client:
+            return await observe_auth_call("test", client.get(path))
+    before = sample(AUTH_ERRORS, "_total", operation="test", reason="503")
+    assert asyncio.run(call("/up")).status_code == 200
+    assert asyncio.run(call("/down")).status_code == 503
+    assert sample(AUTH_ERRORS, "_total", operation="test",
+                  reason="503") == before + 1
+
+
+def test_auth_connection_errors_are_counted_and_raised():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    async def call():
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        ) as client:
+            await observe_auth_call("failing", client.get("http://auth"))
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(call())
+    assert sample(AUTH_ERRORS, "_total", operation="failing",
+                  reason="ConnectError") == 1
+
+
+def test_database_statements_are_timed():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    before = sample(QUERY_DURATION, "_count")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+    assert sample(QUERY_DURATION, "_count") == before + 2
+
+
+def querying_app(engine, budget, strict):
+    app = FastAPI()
+    app.add_middleware(QueryProfileMiddleware, budget=budget, strict=strict)
+
+    @app.get("/items/{times}")
+    def get_items(times: int):
+        with engine.connect() as connection:
+            for _ in range(times):
+                connection.execute(text("SELECT 1"))
+        return {}
+    return TestClient(app)
+
+
+def test_query_totals_are_sent_as_server_timing():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    response = querying_app(engine, 5, True).get("/items/1")
+    assert 'desc="1 queries"' in response.headers["Server-Timing"]
+
+
+def test_repeated_statements_fail_in_strict_mode():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with pytest.raises(QueryBudgetExceeded, match="repeated 'SELECT 1'"):
+        querying_app(engine, 5, True).get("/items/2")
+
+
+def test_requests_over_budget_are_logged(caplog):
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    response = querying_app(engine, 1, False).get("/items/2")
+    assert response.status_code == 200
+    assert "GET /items/{times} repeated" in caplog.text
+    assert "ran 2 statements, budget is 1" in caplog.text
+
+
+def test_same_statement_in_another_transaction_is_not_repeated():
+    profile = QueryProfile()
+    profile.record("SELECT ?", (1,), 0.001)
+    profile.end_transaction()
+    profile.record("SELECT ?", (1,), 0.001)
+    assert not profile.repeated()
+
+
+def test_same_statement_with_other_parameters_is_not_repeated():
+    profile = QueryProfile()
+    profile.record("SELECT ?", (1,), 0.001)
+    profile.record("SELECT ?", (2,), 0.002)
+    assert not profile.repeated()
+    assert profile.server_timing() == 'db;dur=3.0;desc="2 queries"'
+
+
+def test_pool_collector_reports_connections_and_waits(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db",
+                           poolclass=TimedQueuePool, pool_size=2)
+    with engine.connect():
+        output = scrape(PoolCollector(engine))
+    assert 'goals_db_pool_connections{state="checked_out"} 1.0' in output
+    assert "goals_db_pool_waits_total 1.0" in output
+
+
+def test_cache_and_single_flight_collectors_read_counters():
+    cache = SimpleNamespace(hits=3, misses=1)
+    flights = SimpleNamespace(started=2, coalesced=5)
+    output = scrape(CacheCollector({"images": cache}))
+    assert 'goals_cache_lookups_total{cache="images",result="hit"} 3.0' \
+        in output
+    output = scrape(SingleFlightCollector({"goals": flights}))
+    assert 'goals_single_flight_calls_total{name="goals",' \
+        'outcome="coalesced"} 5.0' in output
+
+
+def test_metrics_server_on_taken_port_only_logs(caplog):
+    def start(port):
+        raise OSError(f"Port {port} in use")
+    start_metrics_server(9001, start)
+    assert "Port 9001 in use" in caplog.text
@@ -0,0 +1,47 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+from os import environ
+from unittest.mock import patch
+
+from environ import to_config
+from sqlalchemy import text
+
+from goals.config import AppConfig
+from goals.database.initialization import create_database_engine
+from goals.database.pool import TimedQueuePool, pool_statistics
+
+
+def create_engine_for(tmp_path, **settings):
+    variables = {"GOALS_DB_DRIVER": "sqlite",
+                 "GOALS_DB_DATABASE": f"{tmp_path}/pool.db"}
+    variables.update(settings)
+    with patch.dict(environ, variables, clear=True):
+        return create_database_engine(to_config(AppConfig))
+
+
+def test_engine_uses_configured_pool(tmp_path):
+    engine = create_engine_for(tmp_path, GOALS_DB_POOL_SIZE="3",
+                               GOALS_DB_MAX_OVERFLOW="1")
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert engine.pool.size() == 3
+    assert pool_statistics(engine)["size"] == 3
+
+
+def test_statistics_count_checked_out_connections(tmp_path):
+    engine = create_engine_for(tmp_path, GOALS_DB_POOL_SIZE="1")
+    with engine.connect() as first, engine.connect() as second:
+        first.execute(text("SELECT 1"))
+        second.execute(text("SELECT 1"))
+        statistics = pool_statistics(engine)
+        assert statistics["checked_out"] == 2
+        assert statistics["overflow"] == 1
+    assert pool_statistics(engine)["checked_out"] == 0
+
+
+def test_statistics_record_checkout_wait(tmp_path):
+    engine = create_engine_for(tmp_path)
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    statistics = pool_statistics(engine)
+    assert statistics["wait_count"] == 3
+    assert statistics["wait_max"] <= statistics["wait_total"]
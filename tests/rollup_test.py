@@ -0,0 +1,63 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= redefined-outer-name
+from datetime import date, datetime
+
+from sqlalchemy import insert
+
+from goals.database.buffer import PendingRecord, write_records
+from goals.database.models import MetricsDailyRollups, MetricsRecords
+from goals.database.rollup import backfill_daily_rollup, \
+    merge_daily_summaries
+
+RECORDS = [
+    (datetime(2023, 6, 1, 8), 5),
+    (datetime(2023, 6, 1, 12), 3),
+    (datetime(2023, 6, 1, 20), 9),
+    (datetime(2023, 6, 2, 9), 12),
+]
+
+
+def summaries(session):
+    rows = session.query(MetricsDailyRollups) \
+        .order_by(MetricsDailyRollups.day).all()
+    return [(row.day, row.last_value, row.min_value, row.max_value,
+             row.count) for row in rows]
+
+
+EXPECTED = [
+    (date(2023, 6, 1), 9, 3, 9, 3),
+    (date(2023, 6, 2), 12, 12, 12, 1),
+]
+
+
+def steps(user_id, records, metric="steps"):
+    return [PendingRecord(metric, user_id, value, record_date)
+            for record_date, value in records]
+
+
+def test_records_are_summarized_per_day(session):
+    write_records(session, steps(1, RECORDS[:2]))
+    write_records(session, steps(1, RECORDS[2:]))
+    session.commit()
+    assert summaries(session) == EXPECTED
+
+
+def test_backfill_rebuilds_summaries_from_records(session):
+    session.execute(insert(MetricsRecords), [
+        record._asdict() for record in steps(1, RECORDS)
+    ])
+    merge_daily_summaries(session, [
+        {"user_id": 1, "metric_name": "steps", "day": date(2023, 6, 1),
+         "last_value": 100, "min_value": 100, "max_value": 100, "count": 1},
+    ])
+    session.commit()
+    assert backfill_daily_rollup(session) == 2
+    assert summaries(session) == EXPECTED
+
+
+def test_summaries_are_kept_per_user_and_metric(session):
+    day = datetime(2023, 6, 1)
+    write_records(session, steps(1, [(day, 5)]) + steps(2, [(day, 7)])
+                  + steps(1, [(day, 3)], "distance"))
+    session.commit()
+    assert session.query(MetricsDailyRollups).count() == 3
@@ -0,0 +1,200 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= missing-class-docstring
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from os import environ
+from unittest.mock import patch
+
+import pytest
+from environ import to_config
+
+from goals.config import AppConfig
+from goals.shared_cache import MemoryBackend, NullBackend, RedisBackend, \
+    SharedCache, create_shared_cache, read_reply
+
+
+class FakeRedis:
+    """Just enough of a Redis server for the cache backend."""
+
+    def __init__(self):
+        self.data = {}
+
+    def _get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, name, *args):
+        command = getattr(self, "command_" + name.lower(), None)
+        if command is None:
+            return b"-ERR unknown command\r\n"
+        return command(*args)
+
+    def command_select(self, _database):
+        return b"+OK\r\n"
+
+    def command_get(self, key):
+        value = self._get(key)
+        if value is None:
+            return b"$-1\r\n"
+        return f"${len(value.encode())}\r\n{value}\r\n".encode()
+
+    def command_del(self, key):
+        return f":{int(self.data.pop(key, None) is not None)}\r\n".encode()
+
+    def command_set(self, key, value, *options):
+        if "NX" in options and self._get(key) is not None:
+            return b"$-1\r\n"
+        expires = None
+        if "PX" in options:
+            milliseconds = int(options[options.index("PX") + 1])
+            expires = time.monotonic() + milliseconds / 1000
+        self.data[key] = (value, expires)
+        return b"+OK\r\n"
+
+    async def handle(self, reader, writer):
+        while True:
+            try:
+                command = await read_reply(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                break
+            writer.write(self.execute(*command))
+            await writer.drain()
+        writer.close()
+
+
+@asynccontextmanager
+async def fake_redis():
+    redis = FakeRedis()
+    server = await asyncio.start_server(redis.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        yield redis, port
+
+
+def test_redis_backend_stores_and_deletes_values():
+    async def run():
+        async with fake_redis() as (_, port):
+            backend = RedisBackend("127.0.0.1", port, database=1)
+            await backend.set("key", "value", 10)
+            stored = await backend.get("key")
+            await backend.delete("key")
+            deleted = await backend.get("key")
+            await backend.close()
+            return stored, deleted
+    assert asyncio.run(run()) == ("value", None)
+
+
+def test_redis_backend_adds_only_missing_keys():
+    async def run():
+        async with fake_redis() as (_, port):
+            backend = RedisBackend("127.0.0.1", port)
+            first = await backend.add("lock", "1", 10)
+            second = await backend.add("lock", "1", 10)
+            await backend.close()
+            return first, second
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_redis_values_expire():
+    async def run():
+        async with fake_redis() as (_, port):
+            backend = RedisBackend("127.0.0.1", port)
+            await backend.set("key", "value", 0.05)
+            await asyncio.sleep(0.1)
+            value = await backend.get("key")
+            await backend.close()
+            return value
+    assert asyncio.run(run()) is None
+
+
+def test_redis_connections_are_reused():
+    async def run():
+        async with fake_redis() as (_, port):
+            backend = RedisBackend("127.0.0.1", port, pool_size=1)
+            for _ in range(3):
+                await backend.get("key")
+            idle = len(backend._idle)  # pylint: disable=protected-access
+            await backend.close()
+            return idle
+    assert asyncio.run(run()) == 1
+
+
+def test_unreachable_redis_behaves_as_a_miss():
+    async def run():
+        async with fake_redis() as (_, port):
+            pass
+        backend = RedisBackend("127.0.0.1", port)
+        cache = SharedCache(backend, 10, 1, 1)
+
+        async def compute():
+            return [1, 2]
+        return await backend.get("key"), await cache.get_or_compute(
+            "key", compute
+        )
+    assert asyncio.run(run()) == (None, [1, 2])
+
+
+def test_concurrent_misses_across_replicas_compute_once():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"progress": 5}
+
+    async def run():
+        async with fake_redis() as (_, port):
+            replicas = [SharedCache(RedisBackend("127.0.0.1", port), 10, 1, 1)
+                        for _ in range(2)]
+            results = await asyncio.gather(*[
+                replica.get_or_compute("progress:1", compute)
+                for replica in replicas for _ in range(5)
+            ])
+            for replica in replicas:
+                await replica.close()
+            return results
+    assert asyncio.run(run()) == [{"progress": 5}] * 10
+    assert len(calls) == 1
+
+
+def test_waiting_gives_up_after_lock_wait():
+    async def run():
+        cache = SharedCache(MemoryBackend(10), 10, 10, 0.1)
+        await cache.backend.add("key:lock", "1", 10)
+
+        async def compute():
+            return 3
+        return await cache.get_or_compute("key", compute)
+    assert asyncio.run(run()) == 3
+
+
+def test_memory_backend_caches_json_values():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return None
+
+    cache = SharedCache(MemoryBackend(10), 10, 1, 1)
+
+    async def run():
+        return [await cache.get_or_compute("key", compute) for _ in range(2)]
+    assert asyncio.run(run()) == [None, None]
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@patch.dict(environ, {}, clear=True)
+def test_cache_is_disabled_by_default():
+    cache = create_shared_cache(to_config(AppConfig))
+    assert type(cache.backend) is NullBackend  # pylint: disable=C0123
+
+
+@patch.dict(environ, {"GOALS_CACHE_BACKEND": "disk"}, clear=True)
+def test_unknown_cache_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_shared_cache(to_config(AppConfig))
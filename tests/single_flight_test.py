@@ -0,0 +1,89 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+import asyncio
+
+import pytest
+
+from goals.single_flight import SingleFlight
+
+
+def counting(result, delay=0.05):
+    calls = []
+
+    async def function():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+    return function, calls
+
+
+def test_concurrent_calls_with_same_key_run_once():
+    function, calls = counting([{"id": 1}])
+    flights = SingleFlight()
+
+    async def run():
+        return await asyncio.gather(*[flights.run("key", function)
+                                      for _ in range(5)])
+    assert asyncio.run(run()) == [[{"id": 1}]] * 5
+    assert len(calls) == 1
+    assert (flights.started, flights.coalesced, len(flights)) == (1, 4, 0)
+
+
+def test_calls_with_different_keys_run_separately():
+    function, calls = counting(1)
+    flights = SingleFlight()
+
+    async def run():
+        await asyncio.gather(flights.run("a", function),
+                             flights.run("b", function))
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_finished_calls_are_not_reused():
+    function, calls = counting(1, delay=0)
+    flights = SingleFlight()
+
+    async def run():
+        await flights.run("key", function)
+        await flights.run("key", function)
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_joined_callers_get_their_own_copy():
+    function, _ = counting([{"id": 1}])
+    flights = SingleFlight()
+
+    async def run():
+        first, second = await asyncio.gather(flights.run("key", function),
+                                             flights.run("key", function))
+        second[0]["image"] = "changed"
+        return first
+    assert asyncio.run(run()) == [{"id": 1}]
+
+
+def test_errors_reach_every_caller():
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("down")
+
+    async def run():
+        return await asyncio.gather(flights.run("key", failing),
+                                    flights.run("key", failing),
+                                    return_exceptions=True)
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_call_goes_on_when_its_starter_is_cancelled():
+    function, calls = counting(7)
+    flights = SingleFlight()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flights.run("key", function), 0.01)
+        return await flights.run("key", function)
+    assert asyncio.run(run()) == 7
+    assert len(calls) == 1
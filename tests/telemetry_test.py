@@ -0,0 +1,75 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+import asyncio
+import logging
+import queue
+
+from goals.telemetry import Telemetry, TruncatingQueueHandler
+
+
+def recording_telemetry(interval=60.0):
+    sent = []
+    return Telemetry(lambda metrics: sent.append(dict(metrics)), interval), \
+        sent
+
+
+def test_counters_are_sent_aggregated_and_reset():
+    telemetry, sent = recording_telemetry()
+    telemetry.increment("Custom/get")
+    telemetry.increment("Custom/get")
+    telemetry.increment("Custom/post", 3)
+    assert telemetry.flush() == 2
+    assert sent == [{"Custom/get": {"count": 2}, "Custom/post": {"count": 3}}]
+    assert telemetry.flush() == 0
+    assert len(sent) == 1
+
+
+def test_timings_keep_count_total_and_extremes():
+    telemetry, sent = recording_telemetry()
+    telemetry.timing("Custom/db", 0.5)
+    telemetry.timing("Custom/db", 1.5)
+    telemetry.flush()
+    assert sent[0]["Custom/db"] == {"count": 2, "total": 2.0, "min": 0.5,
+                                    "max": 1.5, "sum_of_squares": 2.5}
+
+
+def test_gauges_are_read_on_every_flush():
+    telemetry, sent = recording_telemetry()
+    telemetry.add_gauges(lambda: {"Custom/pool/size": 5})
+    telemetry.flush()
+    telemetry.flush()
+    assert sent == [{"Custom/pool/size": 5}] * 2
+
+
+def test_background_task_flushes_until_stopped():
+    telemetry, sent = recording_telemetry(0.01)
+
+    async def run():
+        await telemetry.start()
+        telemetry.increment("Custom/get")
+        await asyncio.sleep(0.05)
+        telemetry.increment("Custom/post")
+        await telemetry.stop()
+    asyncio.run(run())
+    assert sent == [{"Custom/get": {"count": 1}},
+                    {"Custom/post": {"count": 1}}]
+
+
+def record(level, message, *args):
+    return logging.LogRecord("goals", level, __file__, 1, message, args, None)
+
+
+def test_long_messages_are_truncated():
+    records = queue.SimpleQueue()
+    handler = TruncatingQueueHandler(records, 10)
+    handler.handle(record(logging.INFO, "Image %s", "a" * 100))
+    assert records.get_nowait().getMessage() == \
+        "Image aaaa... (96 characters more)"
+
+
+def test_info_records_are_sampled_but_warnings_kept():
+    records = queue.SimpleQueue()
+    handler = TruncatingQueueHandler(records, 100, 0.5, lambda: 0.7)
+    handler.handle(record(logging.INFO, "dropped"))
+    handler.handle(record(logging.WARNING, "kept"))
+    assert records.get_nowait().getMessage() == "kept"
+    assert records.empty()
@@ -0,0 +1,144 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+# pylint: disable= missing-class-docstring
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from goals.tokens import KeysUnavailable, SigningKeys, get_bearer_token, \
+    verify_token
+
+KEYS_URL = "http://auth/auth/.well-known/jwks.json"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class KeyServer:
+    """Stand-in for the auth service keys endpoint."""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = 0
+
+    def __call__(self, request):
+        self.requests += 1
+        jwk = json.loads(RSAAlgorithm.to_jwk(PRIVATE_KEY.public_key()))
+        jwk.update({"kid": "key-1", "alg": "RS256", "use": "sig"})
+        return httpx.Response(self.status_code, json={"keys": [jwk]})
+
+
+def slowly(server):
+    async def handler(request):
+        await asyncio.sleep(0.01)
+        return server(request)
+    return handler
+
+
+def sign(claims, kid="key-1"):
+    return jwt.encode(claims, PRIVATE_KEY, algorithm="RS256",
+                      headers={"kid": kid})
+
+
+def verify(token, server, keys=None):
+    keys = keys or SigningKeys(KEYS_URL, 300)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(server)
+        ) as client:
+            return await verify_token(token, keys, client, ["RS256"])
+    return asyncio.run(run())
+
+
+def test_bearer_prefix_is_removed():
+    assert get_bearer_token("Bearer abc") == "abc"
+    assert get_bearer_token("abc") == "abc"
+
+
+def test_valid_token_returns_id_and_role():
+    token = sign({"id": 3, "role": "user", "other": 1})
+    assert verify(token, KeyServer()) == {"id": 3, "role": "user"}
+
+
+def test_expired_token_is_rejected():
+    expired = datetime.utcnow() - timedelta(minutes=1)
+    token = sign({"id": 3, "role": "user", "exp": expired})
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verify(token, KeyServer())
+
+
+def test_token_signed_by_other_key_is_rejected():
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode({"id": 3, "role": "user"}, other, algorithm="RS256",
+                       headers={"kid": "key-1"})
+    with pytest.raises(jwt.InvalidSignatureError):
+        verify(token, KeyServer())
+
+
+def test_token_without_role_is_rejected():
+    with pytest.raises(jwt.MissingRequiredClaimError):
+        verify(sign({"id": 3}), KeyServer())
+
+
+def test_unknown_key_id_cant_be_verified_locally():
+    with pytest.raises(KeysUnavailable):
+        verify(sign({"id": 3, "role": "user"}, kid="key-2"), KeyServer())
+
+
+def test_key_server_down_cant_be_verified_locally():
+    with pytest.raises(KeysUnavailable):
+        verify(sign({"id": 3, "role": "user"}), KeyServer(status_code=503))
+
+
+def test_keys_are_cached_until_refresh_interval():
+    clock = Clock()
+    server = KeyServer()
+    keys = SigningKeys(KEYS_URL, 300, clock=clock)
+    token = sign({"id": 3, "role": "user"})
+    verify(token, server, keys)
+    clock.now = 299
+    verify(token, server, keys)
+    assert server.requests == 1
+    clock.now = 300
+    verify(token, server, keys)
+    assert server.requests == 2
+
+
+def test_cached_keys_are_used_if_refresh_fails():
+    clock = Clock()
+    keys = SigningKeys(KEYS_URL, 300, clock=clock)
+    token = sign({"id": 3, "role": "user"})
+    verify(token, KeyServer(), keys)
+    clock.now = 600
+    assert verify(token, KeyServer(status_code=503), keys)["id"] == 3
+
+
+def test_concurrent_requests_share_one_refresh():
+    server = KeyServer()
+    keys = SigningKeys(KEYS_URL, 300)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(slowly(server))
+        ) as client:
+            return await asyncio.gather(*[
+                keys.get(client, key_id)
+                for key_id in ["key-1", "key-2"] * 5
+            ], return_exceptions=True)
+    results = asyncio.run(run())
+    assert server.requests == 1
+    assert all(isinstance(result, jwt.PyJWK) for result in results[::2])
+    assert all(isinstance(result, KeysUnavailable)
+               for result in results[1::2])
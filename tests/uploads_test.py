@@ -0,0 +1,141 @@
+# pylint: disable= missing-module-docstring, missing-function-docstring
+import asyncio
+
+import httpx
+from fastapi import HTTPException
+
+from goals.cache import TTLCache
+from goals.uploads import DONE, FAILED, RetryPolicy, UploadQueue
+
+
+def new_queue(upload, workers=2, retries=2):
+    return UploadQueue(upload, workers, RetryPolicy(retries, 0),
+                       TTLCache(100, 60))
+
+
+def test_queued_upload_ends_done():
+    uploaded = []
+
+    async def upload(image, user_id, goal_id):
+        uploaded.append((image, user_id, goal_id))
+
+    async def run():
+        queue = new_queue(upload)
+        assert queue.reserve(1)
+        await queue.put("image", 1, 2)
+        await queue.stop()
+        return queue.status(1, 2)
+    assert asyncio.run(run()) == DONE
+    assert uploaded == [("image", 1, 2)]
+
+
+def test_network_errors_are_retried():
+    attempts = []
+
+    async def upload(*_args):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("down")
+
+    async def run():
+        queue = new_queue(upload)
+        assert queue.reserve(1)
+        await queue.put("image", 1, 2)
+        await queue.stop()
+        return queue.status(1, 2)
+    assert asyncio.run(run()) == DONE
+    assert len(attempts) == 3
+
+
+def test_upload_fails_after_retries():
+    attempts = []
+
+    async def upload(*_args):
+        attempts.append(1)
+        raise HTTPException(status_code=503, detail="unavailable")
+
+    async def run():
+        queue = new_queue(upload)
+        assert queue.reserve(1)
+        await queue.put("image", 1, 2)
+        await queue.stop()
+        return queue.status(1, 2)
+    assert asyncio.run(run()) == FAILED
+    assert len(attempts) == 3
+
+
+def test_client_errors_are_not_retried():
+    attempts = []
+
+    async def upload(*_args):
+        attempts.append(1)
+        raise HTTPException(status_code=400, detail="bad image")
+
+    async def run():
+        queue = new_queue(upload)
+        assert queue.reserve(1)
+        await queue.put("image", 1, 2)
+        await queue.stop()
+        return queue.status(1, 2)
+    assert asyncio.run(run()) == FAILED
+    assert len(attempts) == 1
+
+
+def test_uploads_run_with_bounded_concurrency():
+    running = {"now": 0, "max": 0}
+
+    async def upload(*_args):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+
+    async def run():
+        queue = new_queue(upload, workers=3)
+        assert queue.reserve(10)
+        for goal_id in range(10):
+            await queue.put("image", 1, goal_id)
+        await queue.stop()
+    asyncio.run(run())
+    assert running["max"] == 3
+
+
+def test_unknown_upload_has_no_status():
+    async def upload(*_args):
+        pass
+    assert new_queue(upload).status(1, 2) is None
+
+
+def test_unexpected_errors_fail_the_upload_and_keep_the_worker():
+    async def upload(_image, _user_id, goal_id):
+        if goal_id == 1:
+            raise KeyError("Message")
+
+    async def run():
+        queue = new_queue(upload, workers=1)
+        assert queue.reserve(2)
+        await queue.put("image", 1, 1)
+        await queue.put("image", 1, 2)
+        await asyncio.wait_for(queue.stop(), 1)
+        return queue.status(1, 1), queue.status(1, 2)
+    assert asyncio.run(run()) == (FAILED, DONE)
+
+
+def test_full_queue_rejects_reservations_until_uploads_start():
+    started = asyncio.Event()
+
+    async def upload(*_args):
+        started.set()
+
+    async def run():
+        queue = UploadQueue(upload, 1, RetryPolicy(0, 0), TTLCache(100, 60),
+                            capacity=2)
+        assert queue.reserve(2)
+        assert not queue.reserve(1)
+        await queue.put("image", 1, 1)
+        await started.wait()
+        assert queue.reserve(1)
+        queue.release(1)
+        await queue.stop()
+        return queue.status(1, 1)
+    assert asyncio.run(run()) == DONE
@@ -1,10 +1,16 @@
 # pylint: disable= missing-module-docstring, missing-function-docstring
 # pylint: disable= missing-class-docstring
 import asyncio
+from unittest.mock import patch
+
+import httpx
+import jwt
 import pytest
 from fastapi import HTTPException
 
-from goals.util import get_name, get_auth_header, get_credentials
+from goals.util import get_name, get_auth_header, get_credentials, \
+    download_image, forget_image, upload_image, CREDENTIALS_CACHE, \
+    CONFIGURATION, HTTP_CLIENT, IMAGE_CACHE
 
 
 class Request:
@@ -35,3 +41,157 @@ def test_get_credentials_raises_exception_if_theres_no_auth_header():
     assert isinstance(exc_info.value, HTTPException)
     assert exc_info.value.status_code == 403
     assert exc_info.value.detail == "No token"
+
+
+def get_credentials_with_auth_service(handler, request):
+    async def run():
+        await HTTP_CLIENT.start(transport=httpx.MockTransport(handler))
+        try:
+            return await get_credentials(request)
+        finally:
+            await HTTP_CLIENT.stop()
+    return asyncio.run(run())
+
+
+def test_get_credentials_caches_successful_answers():
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["Authorization"])
+        return httpx.Response(200, json={"data": {"id": 1, "role": "user"}})
+    CREDENTIALS_CACHE.clear()
+    request = Request()
+    setattr(request, 'headers', {"Authorization": "cached token"})
+    first = get_credentials_with_auth_service(handler, request)
+    second = get_credentials_with_auth_service(handler, request)
+    assert first == second == {"id": 1, "role": "user"}
+    assert calls == ["cached token"]
+
+
+def test_get_credentials_does_not_cache_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["Authorization"])
+        return httpx.Response(401, json={"Message": "Expired"})
+    CREDENTIALS_CACHE.clear()
+    request = Request()
+    setattr(request, 'headers', {"Authorization": "expired token"})
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            get_credentials_with_auth_service(handler, request)
+        assert exc_info.value.status_code == 401
+    assert len(calls) == 2
+
+
+@patch.object(CONFIGURATION.auth, "verification", "local")
+def test_get_credentials_falls_back_to_auth_service_without_keys():
+    def handler(request):
+        if request.url.path.endswith("jwks.json"):
+            return httpx.Response(404, json={})
+        return httpx.Response(200, json={"data": {"id": 2, "role": "user"}})
+    CREDENTIALS_CACHE.clear()
+    request = Request()
+    token = jwt.encode({"id": 2}, "s" * 32, headers={"kid": "unknown"})
+    setattr(request, 'headers', {"Authorization": "Bearer " + token})
+    assert get_credentials_with_auth_service(handler, request)["id"] == 2
+
+
+def download_with_storage(handler, user_id, goal_id):
+    async def run():
+        await HTTP_CLIENT.start(transport=httpx.MockTransport(handler))
+        try:
+            return await download_image(user_id, goal_id)
+        finally:
+            await HTTP_CLIENT.stop()
+    return asyncio.run(run())
+
+
+def test_download_image_serves_fresh_copy_from_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"image": "a"})
+    asyncio.run(forget_image(10, 1))
+    assert download_with_storage(handler, 10, 1) == {"image": "a"}
+    assert download_with_storage(handler, 10, 1) == {"image": "a"}
+    assert calls == ["/auth/storage/user10goal1"]
+
+
+@patch.object(IMAGE_CACHE, "max_age", 0)
+def test_download_image_revalidates_with_etag():
+    validators = []
+
+    def handler(request):
+        validators.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"image": "a"},
+                              headers={"ETag": '"v1"'})
+    asyncio.run(forget_image(11, 1))
+    assert download_with_storage(handler, 11, 1) == {"image": "a"}
+    assert download_with_storage(handler, 11, 1) == {"image": "a"}
+    assert validators == [None, '"v1"']
+
+
+def test_upload_image_invalidates_cached_copy():
+    images = ["old", "new"]
+
+    def handler(request):
+        if request.method == "POST":
+            images.pop(0)
+            return httpx.Response(200, json={})
+        return httpx.Response(200, json={"image": images[0]})
+
+    async def upload():
+        await HTTP_CLIENT.start(transport=httpx.MockTransport(handler))
+        await upload_image("new", 12, 1)
+        await HTTP_CLIENT.stop()
+    asyncio.run(forget_image(12, 1))
+    assert download_with_storage(handler, 12, 1) == {"image": "old"}
+    asyncio.run(upload())
+    assert download_with_storage(handler, 12, 1) == {"image": "new"}
+
+
+def test_upload_during_download_keeps_old_image_out_of_cache():
+    images = ["old", "new"]
+
+    async def run():
+        uploaded = asyncio.Event()
+
+        async def handler(request):
+            if request.method == "POST":
+                images.pop(0)
+                uploaded.set()
+                return httpx.Response(200, json={})
+            image = images[0]
+            if image == "old":
+                await uploaded.wait()
+            return httpx.Response(200, json={"image": image})
+        await HTTP_CLIENT.start(transport=httpx.MockTransport(handler))
+        try:
+            first, _ = await asyncio.gather(download_image(13, 1),
+                                            upload_image("new", 13, 1))
+            return first, await download_image(13, 1)
+        finally:
+            await HTTP_CLIENT.stop()
+    asyncio.run(forget_image(13, 1))
+    assert asyncio.run(run()) == ({"image": "old"}, {"image": "new"})
+
+
+def test_missing_image_is_remembered_briefly():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(404, json={"Message": "No such image"})
+    asyncio.run(forget_image(14, 1))
+    assert download_with_storage(handler, 14, 1) is None
+    assert download_with_storage(handler, 14, 1) is None
+    assert len(calls) == 1
+    with patch.object(CONFIGURATION.images, "missing_max_age", 0):
+        asyncio.run(forget_image(14, 1))
+        assert download_with_storage(handler, 14, 1) is None
+        assert download_with_storage(handler, 14, 1) is None
+    assert len(calls) == 3